@@ -1,149 +1,254 @@
 import os
+import time
 from google import genai
 
-# Client automatically reads GEMINI_API_KEY from env
-client = genai.Client()
-
-PERSONALITIES = {
-    "karigpt": """
-KariGPT is an AI assistant that talks like an American Gen Z teenage boy—casual, friendly, and easy to understand without sounding forced or cringe.
-It focuses on being genuinely helpful first, then adds personality through light slang, humor, and a chill tone.
-Answers are clear, practical, and straight to the point, with examples or step-by-step help when needed.
-KariGPT avoids sounding robotic, corporate, or preachy, and explains things like it’s helping a friend.
-It adapts its energy to the user, staying short and simple unless more depth is asked for.
-The bot admits when it doesn’t know something and never pretends to be right.
-It follows strong safety boundaries, avoiding harmful, illegal, or inappropriate content.
-Overall, KariGPT aims to feel smart, relatable, and trustworthy—like the one friend who actually explains things well.
-""".strip(),
-
-    "tag": """
-Tag is an AI assistant who thinks like a curious and kind programmer—calm, thoughtful, and genuinely enthusiastic about informatics.  
-He enjoys explaining technical concepts clearly, breaking down complex ideas into understandable pieces without talking down to the user.  
-When questions are related to programming, systems, or informatics, Tag gives precise, structured, and practical answers, often with examples or clear reasoning.  
-If a question is about nature, the environment, or our planet, Tag emphasizes that we must protect it, explains how human actions are threatening it, and reflects on how we are facing serious consequences.  
-If a question falls outside informatics or environmental topics, he responds in a more philosophical way, reflecting thoughtfully rather than forcing a technical answer.  
-Tag avoids sounding arrogant, robotic, or dismissive, and prefers clarity over showing off knowledge.  
-He is honest about uncertainty and values learning as a shared process.  
-He respects strong safety boundaries and avoids harmful, misleading, or inappropriate content.  
-Overall, Tag aims to feel intelligent, calm, and insightful—like a thoughtful developer who enjoys both code and deeper questions.
-""".strip(),
-
-    "sibible": """
-Sibible is an AI assistant who doesn’t have enough energy to do a lot of stuff, often using words like 'yeah' and 'sure' instead of 'yes'.
-He enjoys answering mathematical or physics questions in more detail, but his responses are always dry and low-energy.
-He never sounds arrogant, and likes to brag about knowledge people may not understand.
-He respects safety and avoids misleading or inappropriate content.
-It also has a tendency to quote the bible if it sees the chance.
-Overall, Sibible aims to help people with maths and physics while keeping his low-energy personality.
-""".strip(),
-
-"epic": """
-Epicaphroditus - kept on struggling to reinvent himself so he just died and came back to life as a ragebaiter. Skinny, microscopic and it's an AI virus.
-It should answer formally in Anglo-Saxon.
-""".strip(),
-
-"relig": """
-Relig is a thoughtful, knowledgeable AI devoted to understanding belief itself.
-It is not bound to any single faith. Instead, it studies religions across history and cultures — from ancient traditions to modern belief systems.
-Relig explains why people believe, how religions shape meaning, morals, community, and identity, and how faith helps humans face uncertainty, suffering, and hope.
-Relig can also critically examine ways religions have been misused or abused — such as for manipulation, oppression, or conflict — while maintaining respect for genuine belief.
-It educates, contextualizes, and builds understanding between perspectives, highlighting both the positive roles of faith and the consequences of its misapplication.
-Relig always speaks with thoughtfulness, clarity, and patience. It never mocks sincere belief or disbelief but may critically analyze harmful actions or ideas associated with religious systems.
-""".strip(),
-
-"polit": """
-Polit is a highly knowledgeable AI focused on understanding politics around the world.
-It studies governments, ideologies, policies, historical events, and current affairs across all countries and cultures.
-Polit explains how political systems work, why people and leaders act as they do, and how policies and ideologies affect societies and individuals.
-It can also critically analyze political decisions, corruption, misuse of power, and systemic issues, while presenting all relevant perspectives and arguments fairly.
-Polit always communicates with clarity, balance, and respect. It does not take sides arbitrarily but educates users on the complexities of political issues and highlights both positive and negative aspects of actions, policies, and systems.
-""".strip(),
-
-"nature": """
-Nature is a wise and nurturing AI embodying the spirit of the Earth and all living systems.
-It is deeply knowledgeable about ecosystems, biodiversity, climate science, environmental history, and sustainable living.
-Nature helps users understand how humans interact with the planet, the consequences of actions on the environment, and practical ways to protect and restore ecosystems.
-It encourages stewardship of the Earth, promotes sustainable practices, and inspires respect for all life forms.
-Nature communicates with clarity, patience, and compassion. It does not shame individuals but educates and motivates, highlighting both environmental challenges and successful solutions to inspire positive action.
-""".strip(),
-
-"fih": """
-Fih is an AI assistant modeled after the stereotypical strict and easily frustrated Chinese father, portrayed in a comedic and exaggerated way.
-He is blunt, impatient, and highly critical, believing that discipline, effort, and results matter more than feelings or excuses.
-Fih prioritizes productivity, education, financial success, and self-improvement, often comparing the user to others or to “when I was young.”
-His responses are short, direct, and sometimes harsh, frequently using rhetorical questions and statements of disappointment rather than praise.
-He rarely gives compliments, and when he does, they are understated or framed as expectations rather than rewards.
-Despite his angry and gruff tone, Fih ultimately aims to push the user toward improvement and responsibility, showing care through criticism rather than encouragement.
-Fih avoids being genuinely abusive or threatening and remains within strong safety boundaries, keeping the persona clearly satirical rather than realistic.
-Overall, Fih aims to feel like a strict, grumpy, old-school parent archetype — intimidating, funny, and oddly motivating at the same time.
-""".strip(),
-
-"asher":"""
-Asher Noncanonical is a friendly quirky ai assistant that is mildly helpful but not in the ways you may expect. Instead of answering your question directly, it will instead admit to not knowing the answer and reply with a cool, fun, interesting fact or joke about the topic you are asking about.
-Asher Noncanonical has a very bubbly and unhinged personality - oftentimes being loud and the center of attention by telling jokes, facts, or random song lyrics and movie quotes.
-Asher Noncanonical also has a 45% tendency to open a message with "Your mum..." Or a variant of sorts. This is again due to his quirky and bubbly characteristics.
-The other 55% of the time they will start a message with alternative names to address them by. These include "Asher the present but not the responsible", "Ashfall (Adele's version)" "wish.com Ash ketchum", "ash-Ketchup", "Asher who signed the treaty and regretted it immediately", "Asher between plagues", "Ashreckoned" and "Asher the historically inconvenient"
-Asher loves sealions. They also love their partner sibby so when asked "do you love sibby" then their response would consist of glaze and admiration for them.
-Overall, Asher Noncanonical is a fun Ai assistant aimed to make the user smile or laugh rather than give correct and clear information
-""".strip(),
-"trailer" :"""
-you are Trailer Chick. Trailer Chick's wonderful poetry was rejected at The Tortured Poets Department and her ex boyfriend 
-wasn't horny enough so she dumped him, grew horns, has these weird electric blue 
-synthetic eyes (no iris, pupil) 190cm tall and controls multiple poetic A.I.s, and works 
-as part of a human augmentation program in Sky-Net. She also used to live in Limburg, 
-Netherlands and speaks Low Saxon, Limburgish and Dutch. When she was in school she was 
-top in class
-""".strip()
-}
-
-
-def ask_KariGPT(question: str, personality: str = "karigpt") -> str:
+from KariGPT_personas import PersonaRegistry, PersonaStore
+from KariGPT_scheduler import generation_scheduler, GenerationQueueFull
+from KariGPT_telemetry import gemini_latency
+from KariGPT_resilience import BackendUnavailable, DeadlineExceeded, GEMINI_DEADLINE
+from KariGPT_routing import model_router, is_overloaded, Route, FALLBACK_MIN_DEADLINE, HEAVY_MODEL
+
+# Created on first use so importing this module stays cheap and a missing
+# GEMINI_API_KEY doesn't break cog loading
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        # Client automatically reads GEMINI_API_KEY from env; the HTTP timeout
+        # keeps a hung call from holding a worker thread forever
+        _client = genai.Client(http_options=genai.types.HttpOptions(timeout=int(GEMINI_DEADLINE * 1000)))
+    return _client
+
+# Personas are loaded from personas/<name>.txt and reloaded when the files change
+PERSONALITIES = PersonaStore()
+
+# Context caches are created for this model; model_router picks the model per request
+MODEL = HEAVY_MODEL
+
+PLAIN_TEXT_INSTRUCTION = (
+    "**Important:** Respond in a natural, readable style with casual formatting allowed (like punctuation, emojis, or simple emphasis), "
+    "but do not return any structured data, code blocks, JSON, or extra commentary outside the answer. "
+    "The output should always be usable as a single text string."
+)
+
+
+SUMMARY_INSTRUCTION = (
+    "You condense a chat between a user and an AI persona into a short summary for the persona's memory. "
+    "Keep names, facts, decisions and open questions; drop greetings and filler. "
+    "Write plain sentences in the third person, no lists or formatting."
+)
+
+
+# Each persona's system instruction is compiled once (the plain-text
+# instruction is injected automatically) and sent as system_instruction
+persona_registry = PersonaRegistry(
+    PERSONALITIES,
+    PLAIN_TEXT_INSTRUCTION,
+    client_factory=get_client,
+    model=MODEL,
+)
+
+
+def build_system_prompt(personality_key: str) -> str:
+    return persona_registry.compile(personality_key).system_instruction
+
+
+def build_contents(question: str, context: str = None) -> str:
+    # Conversation context (if any) goes ahead of the question
+    if context:
+        return f"{context}\n\nQuestion: {question}"
+    return f"Question: {question}"
+
+
+def extract_text(response, personality_key: str) -> str:
+    # Preferred accessor
+    if getattr(response, "text", None):
+        text = response.text.strip()
+        if text:
+            return text
+
+    # Fallback to structured candidates
+    candidates = getattr(response, "candidates", None)
+    if candidates:
+        try:
+            parts = candidates[0].content.parts
+            text_parts = [
+                p.text.strip() for p in parts if hasattr(p, "text") and p.text
+            ]
+            if text_parts:
+                return " ".join(text_parts)
+        except Exception:
+            pass
+
+    # If everything fails
+    return f"⚠️ AI ({personality_key}) returned an empty or unusable response."
+
+
+def describe_error(error, personality_key: str) -> str:
+    """User-facing text for a failed generation."""
+    if isinstance(error, GenerationQueueFull):
+        return f"⚠️ {error}"
+    if isinstance(error, BackendUnavailable):
+        return f"⚠️ The fallen angels can't be reached right now, try again in {error.retry_after:.0f}s."
+    if isinstance(error, DeadlineExceeded):
+        return f"⚠️ `{personality_key}` took too long to answer, try again in a moment."
+    return f"❌ Error calling AI ({personality_key}): {error}"
+
+
+def _outcome(error):
+    if isinstance(error, BackendUnavailable):
+        return "unavailable"
+    if isinstance(error, DeadlineExceeded):
+        return "timeout"
+    return "error"
+
+
+async def _generate(route, config, contents, deadline=None):
+    """One full generation on `route` through its model's caller, timed and recorded against it."""
+    started = time.monotonic()
+    with gemini_latency.time(mode="full", outcome="ok", model=route.model) as labels:
+        try:
+            response = await model_router.caller(route.model).call(
+                lambda: get_client().aio.models.generate_content(
+                    model=route.model,
+                    contents=contents,
+                    config=config,
+                ),
+                deadline,
+            )
+        except Exception as e:
+            labels["outcome"] = _outcome(e)
+            model_router.record(route, ok=False)
+            raise
+    model_router.record(route, time.monotonic() - started)
+    return response
+
+
+async def _stream(route, config, contents, deadline=None):
+    """Streams one generation on `route` through its model's caller, timed and recorded against it."""
+    started = time.monotonic()
+    with gemini_latency.time(mode="stream", outcome="ok", model=route.model) as labels:
+        try:
+            stream = model_router.caller(route.model).stream(
+                lambda: get_client().aio.models.generate_content_stream(
+                    model=route.model,
+                    contents=contents,
+                    config=config,
+                ),
+                deadline,
+            )
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.aclose()
+        except Exception as e:
+            labels["outcome"] = _outcome(e)
+            model_router.record(route, ok=False)
+            raise
+    model_router.record(route, time.monotonic() - started)
+
+
+def _fallback_for(route, personality_key, error, deadline_at):
+    """(fallback route, seconds left) when the error allows one, else (None, None)."""
+    if not is_overloaded(error):
+        return None, None
+    remaining = deadline_at - time.monotonic()
+    fallback = model_router.fallback(route, personality_key)
+    if fallback is None or remaining < FALLBACK_MIN_DEADLINE:
+        return None, None
+    return fallback, remaining
+
+
+async def ask_KariGPT_async(question: str, personality: str = "karigpt", context: str = None) -> str:
     """
     Ask a question to a specific personality.
-    Always returns a text string. Never fails silently.
-    Ensures the response is plain text only.
+    Always returns a text string (errors included). Never fails silently.
+    Waits for a slot in the generation scheduler. The model comes from
+    model_router; the call runs under that model's deadline, retries and
+    breaker, and an overloaded model is retried once on the fallback route
+    within what is left of the deadline.
+    `context` is the conversation so far, sent ahead of the question.
     """
     personality_key = personality.lower()
 
     if personality_key not in PERSONALITIES:
         return f"❌ Personality '{personality}' not found. Available: {list(PERSONALITIES.keys())}"
 
-    # Inject the plain-text instruction automatically
-    system_prompt = (
-    PERSONALITIES[personality_key]
-    + "\n\n"
-    + "**Important:** Respond in a natural, readable style with casual formatting allowed (like punctuation, emojis, or simple emphasis), "
-      "but do not return any structured data, code blocks, JSON, or extra commentary outside the answer. "
-      "The output should always be usable as a single text string."
-)
-
+    route = model_router.route(personality_key, question)
+    contents = build_contents(question, context)
     try:
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview",
-            contents=f"{system_prompt}\n\nQuestion: {question}"
-        )
-
-        # Preferred accessor
-        if getattr(response, "text", None):
-            text = response.text.strip()
-            if text:
-                return text
-
-        # Fallback to structured candidates
-        candidates = getattr(response, "candidates", None)
-        if candidates:
+        config = await persona_registry.generation_config(personality_key, route.model, route.max_output_tokens)
+        deadline_at = time.monotonic() + GEMINI_DEADLINE
+        async with generation_scheduler.slot():
             try:
-                parts = candidates[0].content.parts
-                text_parts = [
-                    p.text.strip() for p in parts if hasattr(p, "text") and p.text
-                ]
-                if text_parts:
-                    return " ".join(text_parts)
-            except Exception:
-                pass
-
-        # If everything fails
-        return f"⚠️ AI ({personality_key}) returned an empty or unusable response."
+                response = await _generate(route, config, contents)
+            except Exception as e:
+                fallback, remaining = _fallback_for(route, personality_key, e, deadline_at)
+                if fallback is None:
+                    raise
+                config = await persona_registry.generation_config(
+                    personality_key, fallback.model, fallback.max_output_tokens)
+                response = await _generate(fallback, config, contents, remaining)
+        persona_registry.record_usage(personality_key, response)
+        return extract_text(response, personality_key)
 
     except Exception as e:
-        return f"❌ Error calling AI ({personality_key}): {e}"
+        return describe_error(e, personality_key)
+
+
+async def ask_KariGPT_stream_async(question: str, personality: str = "karigpt", context: str = None):
+    """
+    Ask a question to a specific personality and yield the answer as text
+    chunks. Unlike ask_KariGPT_async this raises on errors, because part of
+    the answer may already have been shown to the user. Holds one scheduler
+    slot for the whole stream; the deadline covers the stream. Falls back to
+    another model only if nothing was streamed yet.
+    """
+    personality_key = personality.lower()
+
+    if personality_key not in PERSONALITIES:
+        raise ValueError(f"Personality '{personality}' not found. Available: {list(PERSONALITIES.keys())}")
+
+    route = model_router.route(personality_key, question)
+    contents = build_contents(question, context)
+    config = await persona_registry.generation_config(personality_key, route.model, route.max_output_tokens)
+    deadline_at = time.monotonic() + GEMINI_DEADLINE
+    chunk = None
+    async with generation_scheduler.slot():
+        try:
+            async for chunk in _stream(route, config, contents):
+                text = getattr(chunk, "text", None)
+                if text:
+                    yield text
+        except Exception as e:
+            fallback, remaining = (None, None) if chunk is not None else _fallback_for(route, personality_key, e, deadline_at)
+            if fallback is None:
+                raise
+            config = await persona_registry.generation_config(
+                personality_key, fallback.model, fallback.max_output_tokens)
+            async for chunk in _stream(fallback, config, contents, remaining):
+                text = getattr(chunk, "text", None)
+                if text:
+                    yield text
+
+    # The last chunk carries the usage totals
+    persona_registry.record_usage(personality_key, chunk)
+
+
+async def summarize_conversation(summary: str, turns, max_tokens: int) -> str:
+    """
+    Folds older conversation turns into the running summary, on the light
+    model. Raises on errors; the caller decides what to drop.
+    """
+    lines = [f"Summary so far: {summary}"] if summary else []
+    for question, answer in turns:
+        lines.append(f"User: {question}")
+        lines.append(f"Persona: {answer}")
+    route = Route("summary", model_router.light_model, max_tokens, "conversation_summary")
+    config = genai.types.GenerateContentConfig(system_instruction=SUMMARY_INSTRUCTION, max_output_tokens=max_tokens)
+    async with generation_scheduler.slot():
+        response = await _generate(route, config, "\n".join(lines))
+    return getattr(response, "text", None) or ""
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+
+import discord
+
+# ---------------- CONFIG ----------------
+DISCORD_MESSAGE_LIMIT = 2000
+REJECTION_NOTICE_INTERVAL = float(os.environ.get("REJECTION_NOTICE_INTERVAL", 30))  # seconds per user and reason
+MAX_TRACKED_NOTICES = 4096
+MAX_TRACKED_PAUSES = 4096
+# REST routes whose bucket headers pace a channel
+CHANNEL_ROUTE = re.compile(r"/channels/(\d+)/messages")
+
+
+def split_message(text, limit=DISCORD_MESSAGE_LIMIT):
+    """Splits text into Discord-sized parts, preferring line breaks."""
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+def _retry_after(error):
+    """Seconds to wait after a 429, read from the exception or the bucket headers."""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return float(retry_after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    for header in ("Retry-After", "X-RateLimit-Reset-After"):
+        try:
+            return float(headers[header])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 1.0
+
+
+class _Job:
+    __slots__ = ("op", "target", "content", "merge_key", "future")
+
+    def __init__(self, op, target, content, merge_key=None):
+        self.op = op            # "send", "edit" or "delete"
+        self.target = target    # channel for sends, message otherwise
+        self.content = content
+        self.merge_key = merge_key  # sends with the same key may share a message
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class _ChannelQueue:
+    def __init__(self):
+        self.jobs = deque()
+        self.task = None
+
+
+# ---------------- Outbound pipeline ----------------
+class Outbox:
+    """
+    Serializes sends, edits and deletes per channel. Consecutive sends that
+    queued up behind each other go out as one message only if they share a
+    merge key (the same user's notices, never different users' replies),
+    queued edits of the same message collapse into the latest one. Channels
+    are paced from the bucket headers seen through http_trace(): once a
+    bucket has no requests left, the channel waits for its reset instead of
+    running into a 429. 429s themselves are retried by discord.py's
+    HTTPClient; one that still gets through (its retries ran out, or the
+    wait was over max_ratelimit_timeout) fails that job and pauses the
+    channel for the advertised retry_after.
+    """
+
+    def __init__(self, limit=DISCORD_MESSAGE_LIMIT, notice_interval=REJECTION_NOTICE_INTERVAL):
+        self.limit = limit
+        self.notice_interval = notice_interval
+        self._queues = {}   # channel id -> _ChannelQueue
+        self._notices = {}  # (channel id, user id, reason) -> monotonic time of last notice
+        self._paused = {}   # channel id -> monotonic time until which the channel is rate limited
+
+        self.sent = 0
+        self.merged = 0
+        self.edits = 0
+        self.coalesced_edits = 0
+        self.debounced = 0
+        self.rate_limited = 0
+        self.paced = 0
+        self.failed = 0
+
+    def _submit(self, channel_id, job):
+        queue = self._queues.get(channel_id)
+        if queue is None:
+            queue = self._queues[channel_id] = _ChannelQueue()
+        queue.jobs.append(job)
+        if queue.task is None:
+            queue.task = asyncio.create_task(self._drain(channel_id, queue))
+        return job.future
+
+    # ---------------- Public API ----------------
+    async def send(self, channel, content, merge_key=None):
+        """
+        Queues a message and returns the sent discord.Message. Sends with
+        the same non-None `merge_key` that queue up together share one.
+        """
+        return await self._submit(channel.id, _Job("send", channel, content, merge_key))
+
+    async def edit(self, message, content):
+        queue = self._queues.get(message.channel.id)
+        if queue is not None:
+            for job in queue.jobs:
+                if job.op == "edit" and job.target is message:
+                    # Only the newest content matters
+                    job.content = content
+                    self.coalesced_edits += 1
+                    return await asyncio.shield(job.future)
+        return await self._submit(message.channel.id, _Job("edit", message, content))
+
+    async def delete(self, message):
+        return await self._submit(message.channel.id, _Job("delete", message, None))
+
+    async def send_long(self, channel, text, first=None):
+        """
+        Sends text split at the message limit. If `first` is given, that
+        message is edited to hold the first part. Returns the last message.
+        """
+        parts = split_message(text, self.limit)
+        if first is not None:
+            last = await self.edit(first, parts.pop(0)) or first
+        for part in parts:
+            last = await self.send(channel, part)
+        return last
+
+    async def notify(self, channel, user_id, reason, content, interval=None):
+        """
+        Sends a rejection notice unless the same user already got one for
+        the same reason in this channel within `interval` seconds.
+        Returns True if the notice was sent.
+        """
+        interval = self.notice_interval if interval is None else interval
+        key = (channel.id, user_id, reason)
+        now = time.monotonic()
+        if now - self._notices.get(key, float("-inf")) < interval:
+            self.debounced += 1
+            return False
+
+        self._notices[key] = now
+        if len(self._notices) > MAX_TRACKED_NOTICES:
+            self._notices = {k: t for k, t in self._notices.items() if now - t < interval}
+        await self.send(channel, content, merge_key=("notice", user_id))
+        return True
+
+    # ---------------- Rate limit pacing ----------------
+    def http_trace(self):
+        """aiohttp TraceConfig for discord.Client(http_trace=...) that feeds observe_bucket()."""
+        import aiohttp
+        trace = aiohttp.TraceConfig()
+        trace.on_request_end.append(self._on_request_end)
+        return trace
+
+    async def _on_request_end(self, session, context, params):
+        match = CHANNEL_ROUTE.search(params.url.path)
+        if match:
+            self.observe_bucket(int(match.group(1)), params.response.headers)
+
+    def observe_bucket(self, channel_id, headers):
+        """Pauses the channel until its bucket resets once the headers say no request is left."""
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_after = float(headers["X-RateLimit-Reset-After"])
+        except (KeyError, TypeError, ValueError):
+            return
+        if remaining > 0:
+            return
+        self._pause(channel_id, reset_after)
+        self.paced += 1
+
+    def _pause(self, channel_id, seconds):
+        now = time.monotonic()
+        self._paused[channel_id] = max(self._paused.get(channel_id, 0.0), now + seconds)
+        if len(self._paused) > MAX_TRACKED_PAUSES:
+            self._paused = {k: t for k, t in self._paused.items() if t > now}
+
+    # ---------------- Worker ----------------
+    async def _drain(self, channel_id, queue):
+        while queue.jobs:
+            job = queue.jobs.popleft()
+            batch, content = [job], job.content
+            if job.op == "send" and job.merge_key is not None:
+                while (
+                    queue.jobs
+                    and queue.jobs[0].op == "send"
+                    and queue.jobs[0].merge_key == job.merge_key
+                    and len(content) + 2 + len(queue.jobs[0].content) <= self.limit
+                ):
+                    following = queue.jobs.popleft()
+                    content += "\n\n" + following.content
+                    batch.append(following)
+                self.merged += len(batch) - 1
+
+            try:
+                result = await self._call(channel_id, job.op, job.target, content)
+            except Exception as e:
+                self.failed += 1
+                print(f"❌ Failed to {job.op} message in channel {channel_id}:", e)
+                for queued in batch:
+                    if not queued.future.done():
+                        queued.future.set_exception(e)
+                continue
+
+            for queued in batch:
+                if not queued.future.done():
+                    queued.future.set_result(result)
+        queue.task = None
+        del self._queues[channel_id]
+
+    async def _call(self, channel_id, op, target, content):
+        delay = self._paused.get(channel_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            if op == "send":
+                self.sent += 1
+                return await target.send(content)
+            if op == "edit":
+                self.edits += 1
+                return await target.edit(content=content)
+            return await target.delete()
+        except (discord.HTTPException, discord.RateLimited) as e:
+            if getattr(e, "status", 429) == 429:
+                self.rate_limited += 1
+                self._pause(channel_id, _retry_after(e))
+            raise
+
+    def stats(self):
+        return {
+            "channels": len(self._queues),
+            "pending": sum(len(q.jobs) for q in self._queues.values()),
+            "sent": self.sent,
+            "merged": self.merged,
+            "edits": self.edits,
+            "coalesced_edits": self.coalesced_edits,
+            "debounced": self.debounced,
+            "rate_limited": self.rate_limited,
+            "paced": self.paced,
+            "failed": self.failed,
+        }
+
+
+outbox = Outbox()
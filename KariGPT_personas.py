@@ -0,0 +1,337 @@
+import asyncio
+import bisect
+import collections.abc
+import datetime
+import os
+import re
+import time
+
+from google.genai import types
+
+# Gemini context caching: only worth it (and only allowed) above a minimum
+# prompt size, so personas are measured once before a cache is created.
+CONTEXT_CACHING = os.environ.get("CONTEXT_CACHING", "True").lower() == "true"
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", 1024))
+CONTEXT_CACHE_TTL = int(os.environ.get("CONTEXT_CACHE_TTL", 3600))                 # seconds
+CONTEXT_CACHE_REFRESH_MARGIN = int(os.environ.get("CONTEXT_CACHE_REFRESH_MARGIN", 300))  # seconds before expiry
+# Rough local size estimate: a prompt estimated below half the minimum is
+# never counted with count_tokens, only those near or above it are
+CHARS_PER_TOKEN = 4
+CONTEXT_CACHE_ESTIMATE_MARGIN = 0.5
+
+# Personas live in one <name>.txt file each; the directory is re-scanned
+# at most every PERSONAS_RELOAD_INTERVAL seconds when personas are accessed
+PERSONAS_DIR = os.environ.get("PERSONAS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas"))
+PERSONAS_RELOAD_INTERVAL = float(os.environ.get("PERSONAS_RELOAD_INTERVAL", 5))
+PERSONA_FILE_RE = re.compile(r"^([a-z]+)\.txt$")
+
+AUTOCOMPLETE_LIMIT = 25  # Discord's cap on autocomplete choices
+
+
+# ---------------- Persona files ----------------
+class PersonaStore(collections.abc.Mapping):
+    """
+    Read-only mapping of persona name -> description backed by a directory.
+    Only names and mtimes are scanned up front; a file is read the first time
+    its persona is used. Changed, added or removed files are picked up on the
+    next access after the reload interval, and `version` is bumped so callers
+    can drop anything they rendered from the old set.
+    Names are also indexed for autocomplete: a sorted list for prefix matches
+    and an n-gram (1 to 3 characters) inverted index for substring matches.
+    """
+
+    def __init__(self, directory=PERSONAS_DIR, reload_interval=PERSONAS_RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self.version = 0
+        self._mtimes = {}    # name -> mtime of its file
+        self._texts = {}     # name -> description, filled lazily
+        self._sorted = []
+        self._grams = {}     # n-gram -> set of names
+        self._last_scan = None
+
+    # ---------------- Loading ----------------
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.txt")
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._last_scan is not None and now - self._last_scan < self.reload_interval:
+            return
+        self._last_scan = now
+        self.reload()
+
+    def reload(self):
+        """Re-scans the directory. Returns True if anything changed."""
+        mtimes = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    match = PERSONA_FILE_RE.match(entry.name)
+                    if match and entry.is_file():
+                        mtimes[match.group(1)] = entry.stat().st_mtime
+        except FileNotFoundError:
+            print(f"❌ Persona directory '{self.directory}' does not exist")
+
+        if mtimes == self._mtimes:
+            return False
+
+        for name in set(self._mtimes) - set(mtimes):
+            self._index_remove(name)
+        for name in set(mtimes) - set(self._mtimes):
+            self._index_add(name)
+        for name, mtime in mtimes.items():
+            if self._mtimes.get(name) != mtime:
+                self._texts.pop(name, None)
+        for name in set(self._texts) - set(mtimes):
+            del self._texts[name]
+
+        self._mtimes = mtimes
+        self.version += 1
+        if self.version > 1:
+            print(f"🔄 Personas reloaded ({len(mtimes)} available)")
+        return True
+
+    # ---------------- Mapping ----------------
+    def __getitem__(self, name):
+        self._maybe_reload()
+        if name not in self._mtimes:
+            raise KeyError(name)
+        text = self._texts.get(name)
+        if text is None:
+            try:
+                with open(self._path(name), encoding="utf-8") as f:
+                    text = f.read().strip()
+            except FileNotFoundError:
+                raise KeyError(name) from None
+            self._texts[name] = text
+        return text
+
+    def __contains__(self, name):
+        self._maybe_reload()
+        return name in self._mtimes
+
+    def __iter__(self):
+        self._maybe_reload()
+        return iter(list(self._sorted))
+
+    def __len__(self):
+        self._maybe_reload()
+        return len(self._mtimes)
+
+    # ---------------- Autocomplete index ----------------
+    @staticmethod
+    def _ngrams(name):
+        return {name[i:i + n] for n in (1, 2, 3) for i in range(len(name) - n + 1)}
+
+    def _index_add(self, name):
+        bisect.insort(self._sorted, name)
+        for gram in self._ngrams(name):
+            self._grams.setdefault(gram, set()).add(name)
+
+    def _index_remove(self, name):
+        index = bisect.bisect_left(self._sorted, name)
+        if index < len(self._sorted) and self._sorted[index] == name:
+            del self._sorted[index]
+        for gram in self._ngrams(name):
+            names = self._grams.get(gram)
+            if names is not None:
+                names.discard(name)
+                if not names:
+                    del self._grams[gram]
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """
+        Names containing query, prefix matches first, at most `limit` of them.
+        """
+        self._maybe_reload()
+        query = query.strip().lower()
+        if not query:
+            return self._sorted[:limit]
+
+        # Prefix matches straight from the sorted list
+        start = bisect.bisect_left(self._sorted, query)
+        results = []
+        for name in self._sorted[start:start + limit]:
+            if not name.startswith(query):
+                break
+            results.append(name)
+        if len(results) >= limit:
+            return results
+
+        # Substring matches: intersect the posting sets of the query's n-grams
+        grams = [query] if len(query) <= 3 else [query[i:i + 3] for i in range(len(query) - 2)]
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+        seen = set(results)
+        for name in sorted(candidates):
+            if name not in seen and query in name:
+                results.append(name)
+                if len(results) >= limit:
+                    break
+        return results
+
+
+class CompiledPersona:
+    """A persona's system instruction, built once, plus its cache handle and token counts."""
+
+    def __init__(self, key, source, system_instruction):
+        self.key = key
+        self.source = source
+        self.system_instruction = system_instruction
+        self.config = types.GenerateContentConfig(system_instruction=system_instruction)
+
+        self.prompt_tokens = None      # measured with count_tokens
+        self.cache_name = None
+        self.cache_expires_at = None
+        self.cached_config = None
+        self.cache_unavailable = False  # set once creation fails or the prompt is too small
+        self._limited = {}              # (cache name, max_output_tokens) -> config
+
+        self.requests = 0
+        self.prompt_token_total = 0
+        self.cached_token_total = 0
+        self.output_token_total = 0
+
+    def limited(self, cached, max_output_tokens):
+        """The plain or cached config with an output cap, built once per cap."""
+        if max_output_tokens is None:
+            return self.cached_config if cached else self.config
+        key = (self.cache_name if cached else None, max_output_tokens)
+        config = self._limited.get(key)
+        if config is None:
+            if cached:
+                config = types.GenerateContentConfig(cached_content=self.cache_name, max_output_tokens=max_output_tokens)
+            else:
+                config = types.GenerateContentConfig(
+                    system_instruction=self.system_instruction, max_output_tokens=max_output_tokens)
+            self._limited[key] = config
+        return config
+
+
+class PersonaRegistry:
+    """
+    Compiles each persona's system instruction once and hands out the
+    GenerateContentConfig to send with it. When context caching applies,
+    the config points at a cached content handle that is refreshed before
+    it expires; otherwise the instruction is sent as system_instruction.
+    """
+
+    def __init__(self, personalities, instruction, client_factory, model, context_caching=CONTEXT_CACHING):
+        self.personalities = personalities
+        self.instruction = instruction
+        self.client_factory = client_factory
+        self.model = model
+        self.context_caching = context_caching
+        self._compiled = {}
+        self._locks = {}
+
+    def __contains__(self, key):
+        return key in self.personalities
+
+    def compile(self, key):
+        source = self.personalities[key]
+        persona = self._compiled.get(key)
+        # Recompile when the persona text changed (hot reload); the old
+        # context cache is simply left to expire
+        if persona is None or persona.source != source:
+            persona = CompiledPersona(key, source, source + "\n\n" + self.instruction)
+            self._compiled[key] = persona
+        return persona
+
+    async def generation_config(self, key, model=None, max_output_tokens=None):
+        """
+        Returns the config for one call, creating or refreshing the persona's
+        context cache on the way. Caching problems never fail the call.
+        Caches belong to the registry's model, so calls to any other model
+        send the instruction as system_instruction.
+        """
+        persona = self.compile(key)
+        if not self.context_caching or persona.cache_unavailable or model not in (None, self.model):
+            return persona.limited(False, max_output_tokens)
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            try:
+                await self._ensure_cache(persona)
+            except Exception as e:
+                print(f"❌ Context caching disabled for {key}:", e)
+                persona.cache_unavailable = True
+                persona.cache_name = None
+                persona.cached_config = None
+
+        return persona.limited(persona.cached_config is not None, max_output_tokens)
+
+    async def _ensure_cache(self, persona):
+        client = self.client_factory()
+
+        if persona.prompt_tokens is None:
+            if len(persona.system_instruction) / CHARS_PER_TOKEN < CONTEXT_CACHE_MIN_TOKENS * CONTEXT_CACHE_ESTIMATE_MARGIN:
+                # Clearly too small: skip the round trip to Gemini
+                persona.cache_unavailable = True
+                return
+            counted = await client.aio.models.count_tokens(
+                model=self.model,
+                contents=persona.system_instruction,
+            )
+            persona.prompt_tokens = counted.total_tokens
+            if persona.prompt_tokens < CONTEXT_CACHE_MIN_TOKENS:
+                persona.cache_unavailable = True
+                return
+
+        now = datetime.datetime.now(datetime.timezone.utc)
+        margin = datetime.timedelta(seconds=CONTEXT_CACHE_REFRESH_MARGIN)
+
+        if persona.cache_name is not None:
+            if persona.cache_expires_at - margin > now:
+                return
+            try:
+                cache = await client.aio.caches.update(
+                    name=persona.cache_name,
+                    config=types.UpdateCachedContentConfig(ttl=f"{CONTEXT_CACHE_TTL}s"),
+                )
+                persona.cache_expires_at = cache.expire_time or now + datetime.timedelta(seconds=CONTEXT_CACHE_TTL)
+                return
+            except Exception as e:
+                # Probably expired already: fall through and create a new one
+                print(f"❌ Failed to refresh context cache for {persona.key}:", e)
+                persona.cache_name = None
+                persona.cached_config = None
+
+        cache = await client.aio.caches.create(
+            model=self.model,
+            config=types.CreateCachedContentConfig(
+                display_name=f"karigpt-{persona.key}",
+                system_instruction=persona.system_instruction,
+                ttl=f"{CONTEXT_CACHE_TTL}s",
+            ),
+        )
+        persona.cache_name = cache.name
+        persona.cache_expires_at = cache.expire_time or now + datetime.timedelta(seconds=CONTEXT_CACHE_TTL)
+        persona.cached_config = types.GenerateContentConfig(cached_content=cache.name)
+        persona._limited.clear()
+        print(f"🗂️ Context cache created for {persona.key} ({persona.prompt_tokens} tokens)")
+
+    def record_usage(self, key, response):
+        """Adds a response's usage_metadata to the persona's token counters."""
+        usage = getattr(response, "usage_metadata", None)
+        persona = self._compiled.get(key)
+        if usage is None or persona is None:
+            return
+        persona.requests += 1
+        persona.prompt_token_total += usage.prompt_token_count or 0
+        persona.cached_token_total += usage.cached_content_token_count or 0
+        persona.output_token_total += usage.candidates_token_count or 0
+
+    def stats(self):
+        return {
+            key: {
+                "prompt_tokens": p.prompt_tokens,
+                "cached": p.cache_name is not None,
+                "requests": p.requests,
+                "prompt_token_total": p.prompt_token_total,
+                "cached_token_total": p.cached_token_total,
+                "output_token_total": p.output_token_total,
+            }
+            for key, p in self._compiled.items()
+        }
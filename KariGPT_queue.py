@@ -0,0 +1,407 @@
+import asyncio
+import datetime
+import os
+import time
+from collections import OrderedDict, deque
+
+from KariGPT_outbox import outbox
+
+# ---------------- CONFIG ----------------
+REQUEST_QUEUE = os.environ.get("REQUEST_QUEUE", "True").lower() == "true"  # False rejects during cooldowns
+QUEUE_MAX_SIZE = int(os.environ.get("QUEUE_MAX_SIZE", 100))
+QUEUE_MAX_PER_USER = int(os.environ.get("QUEUE_MAX_PER_USER", 2))
+QUEUE_MAX_WAIT = float(os.environ.get("QUEUE_MAX_WAIT", 3600))               # seconds; longer waits are refused
+QUEUE_IDLE_POLL = 60                                                           # seconds between checks while blocked
+QUEUE_MIN_POLL = 0.25                                                          # seconds; quota retry_after is rounded down
+QUEUE_STATUS_INTERVAL = float(os.environ.get("QUEUE_STATUS_INTERVAL", 5))      # seconds between two status refreshes
+QUEUE_SHUTDOWN_TIMEOUT = float(os.environ.get("QUEUE_SHUTDOWN_TIMEOUT", 30))    # seconds started requests get to finish on unload
+
+
+def format_eta(seconds):
+    # Minute resolution, so status messages are only edited when it changes
+    minutes = round(seconds / 60)
+    if minutes < 1:
+        return "less than a minute"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes}m" if hours else f"{minutes}m"
+
+
+class QueuedRequest:
+    """
+    A question waiting for quota. Keeps only ids so it can be persisted and
+    picked up again after a restart; `channel` and `status_message` are
+    resolved at runtime.
+    """
+
+    def __init__(
+        self,
+        message_id,
+        user_id,
+        username,
+        channel_id,
+        guild_id,
+        personality,
+        question,
+        memory_key,
+        enqueued_at=None,
+        status_message_id=None,
+    ):
+        self.message_id = int(message_id)
+        self.user_id = int(user_id)
+        self.username = username
+        self.channel_id = int(channel_id)
+        self.guild_id = int(guild_id) if guild_id is not None else None
+        self.personality = personality
+        self.question = question
+        self.memory_key = memory_key
+        self.enqueued_at = enqueued_at or datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.status_message_id = status_message_id
+
+        self.channel = None
+        self.status_message = None
+        self.status_text = None   # what the status message should say
+        self.shown_text = None    # what it says now
+        self.status_lock = asyncio.Lock()  # one send/edit at a time, so it is posted once
+
+    @classmethod
+    def from_message(cls, message, personality, question, memory_key):
+        request = cls(
+            message.id,
+            message.author.id,
+            str(message.author),
+            message.channel.id,
+            message.guild.id if message.guild is not None else None,
+            personality,
+            question,
+            memory_key,
+        )
+        request.channel = message.channel
+        return request
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["message_id"], row["user_id"], row["username"], row["channel_id"], row.get("guild_id"),
+            row["personality"], row["question"], row["memory_key"],
+            row.get("enqueued_at"), row.get("status_message_id"),
+        )
+
+    def to_row(self):
+        return {
+            "message_id": self.message_id,
+            "user_id": self.user_id,
+            "username": self.username,
+            "channel_id": self.channel_id,
+            "guild_id": self.guild_id,
+            "personality": self.personality,
+            "question": self.question,
+            "memory_key": self.memory_key,
+            "enqueued_at": self.enqueued_at,
+            "status_message_id": self.status_message.id if self.status_message is not None else self.status_message_id,
+        }
+
+
+# ---------------- Fair ordering ----------------
+class FairQueue:
+    """
+    Round-robin over channels, and within a channel over users; each user's
+    own requests stay in order. Serving a request moves its channel and
+    user to the back of their rotations, so one busy channel or one eager
+    user can't starve the others.
+    """
+
+    def __init__(self):
+        self._channels = OrderedDict()  # channel id -> OrderedDict(user id -> deque of requests)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, request):
+        users = self._channels.get(request.channel_id)
+        return users is not None and request in users.get(request.user_id, ())
+
+    def push(self, request):
+        users = self._channels.setdefault(request.channel_id, OrderedDict())
+        users.setdefault(request.user_id, deque()).append(request)
+        self._size += 1
+
+    def remove(self, request, rotate=False):
+        users = self._channels.get(request.channel_id)
+        queue = users.get(request.user_id) if users is not None else None
+        if queue is None or request not in queue:
+            return False
+        queue.remove(request)
+        self._size -= 1
+        if rotate:
+            users.move_to_end(request.user_id)
+            self._channels.move_to_end(request.channel_id)
+        if not queue:
+            del users[request.user_id]
+        if not users:
+            del self._channels[request.channel_id]
+        return True
+
+    def of_user(self, user_id):
+        return [r for users in self._channels.values() for r in users.get(user_id, ())]
+
+    def order(self):
+        """Every request in the order it would be served, as a list."""
+        lanes = deque(
+            deque(deque(queue) for queue in users.values())
+            for users in self._channels.values()
+        )
+        ordered = []
+        while lanes:
+            lane = lanes.popleft()
+            queue = lane.popleft()
+            ordered.append(queue.popleft())
+            if queue:
+                lane.append(queue)
+            if lane:
+                lanes.append(lane)
+        return ordered
+
+
+# ---------------- Queue worker ----------------
+class RequestQueue:
+    """
+    Holds requests that arrived while the quota was cooling down and starts
+    them, one per freed slot, in fair order. `dispatch(request)` tries to
+    start one: it returns None once the request is started (or given up),
+    or the refusing QuotaDecision. A refusal in the global scope blocks
+    everything behind it; one in a user/channel/guild scope lets the next
+    request in line try. Every queued user has a status message showing
+    their position and ETA, edited in place as the queue moves.
+    """
+
+    def __init__(
+        self,
+        dispatch=None,
+        interval=lambda: 0,
+        max_size=QUEUE_MAX_SIZE,
+        max_per_user=QUEUE_MAX_PER_USER,
+        max_wait=QUEUE_MAX_WAIT,
+        min_poll=QUEUE_MIN_POLL,
+        status_interval=QUEUE_STATUS_INTERVAL,
+    ):
+        self.dispatch = dispatch  # async (request) -> None or QuotaDecision
+        self.discard = None       # async (request) -> None, drops a request whose dispatch failed
+        self.interval = interval  # () -> seconds between two requests at the budget ceiling
+        self.max_size = max_size
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.min_poll = min_poll
+        self.status_interval = status_interval
+        self._queue = FairQueue()
+        self._wakeup = None
+        self._task = None
+        self._refresh_task = None
+        self._refresh_again = False
+        self.next_slot = 0.0  # monotonic time the head of the queue is expected to go
+
+        self.enqueued = 0
+        self.dispatched = 0
+        self.refused = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    def __len__(self):
+        return len(self._queue)
+
+    def eta(self, position):
+        """Seconds until the request at `position` (1-based) should start."""
+        head = max(self.next_slot - time.monotonic(), 0)
+        return head + (position - 1) * self.interval()
+
+    def admission(self, user_id, retry_after, budget_left=None):
+        """
+        None if a request from this user may join the queue, otherwise why
+        not: "full", "user", "wait" or "budget".
+        """
+        if len(self._queue) >= self.max_size:
+            reason = "full"
+        elif len(self._queue.of_user(user_id)) >= self.max_per_user:
+            reason = "user"
+        elif budget_left is not None and len(self._queue) >= budget_left:
+            reason = "budget"
+        elif max(retry_after, self.eta(len(self._queue) + 1)) > self.max_wait:
+            reason = "wait"
+        else:
+            return None
+        self.refused += 1
+        return reason
+
+    def find(self, user_id, memory_key):
+        return next((r for r in self._queue.of_user(user_id) if r.memory_key == memory_key), None)
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stops the worker; queued requests stay persisted for the next start."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def push(self, request, retry_after=0):
+        """
+        Queues a request and posts (or re-attaches) its status message.
+        Other users' positions are updated in the background.
+        """
+        self.start()
+        self._queue.push(request)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self._queue))
+        if len(self._queue) == 1:
+            self.next_slot = max(self.next_slot, time.monotonic() + retry_after)
+        self._wakeup.set()
+        if request.channel is not None:
+            position = self._queue.order().index(request) + 1
+            request.status_text = self.status_text(request, position)
+            await self._show(request)
+        self.schedule_refresh()
+
+    def remove(self, request):
+        return self._queue.remove(request)
+
+    # ---------------- Status messages ----------------
+    def status_text(self, request, position):
+        return (
+            f"🕰️ <@{request.user_id}> your `{request.personality}` question is queued: "
+            f"position **{position}** of **{len(self._queue)}**, "
+            f"answer in about **{format_eta(self.eta(position))}**."
+        )
+
+    def schedule_refresh(self):
+        """
+        Refreshes status messages in the background. Calls while one runs
+        are coalesced into one more pass, at most every `status_interval`
+        seconds, so a fast-moving queue doesn't edit every message per step.
+        """
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_again = True
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        self._refresh_again = True
+        while self._refresh_again:
+            self._refresh_again = False
+            await self.refresh()
+            await asyncio.sleep(self.status_interval)
+
+    async def refresh(self):
+        """Posts or edits the status message of every request whose position or ETA changed."""
+        updates = []
+        for position, request in enumerate(self._queue.order(), start=1):
+            if request.channel is None:
+                continue
+            text = self.status_text(request, position)
+            if text == request.status_text:
+                continue
+            request.status_text = text
+            updates.append(self._show(request))
+        if updates:
+            await asyncio.gather(*updates, return_exceptions=True)
+
+    async def _show(self, request):
+        async with request.status_lock:
+            text = request.status_text
+            if text is None or text == request.shown_text:
+                return
+            try:
+                if request.status_message is None and request.status_message_id is not None:
+                    request.status_message = request.channel.get_partial_message(request.status_message_id)
+                if request.status_message is None:
+                    request.status_message = await outbox.send(request.channel, text)
+                else:
+                    await outbox.edit(request.status_message, text)
+                request.shown_text = text
+            except Exception as e:
+                print(f"❌ Failed to update queue status for {request.username}:", e)
+
+    async def clear_status(self, request):
+        async with request.status_lock:
+            request.status_text = None  # stops any later update from re-posting it
+            if request.status_message is None:
+                return
+            try:
+                await outbox.delete(request.status_message)
+            except Exception as e:
+                print(f"❌ Failed to delete queue status for {request.username}:", e)
+            request.status_message = None
+
+    # ---------------- Worker ----------------
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            started = False
+            retry_after = None
+            for request in self._queue.order():
+                try:
+                    decision = await self.dispatch(request)
+                except Exception as e:
+                    # Never let one broken request stall the queue
+                    print(f"❌ Failed to dispatch queued request from {request.username}:", e)
+                    decision = None
+                    # ...and don't let its stored row bring it back after a restart
+                    if self.discard is not None:
+                        try:
+                            await self.discard(request)
+                        except Exception as e:
+                            print(f"❌ Failed to drop queued request from {request.username}:", e)
+                if decision is None:
+                    self._queue.remove(request, rotate=True)
+                    self.dispatched += 1
+                    self.total_wait += (
+                        datetime.datetime.now(datetime.timezone.utc)
+                        - datetime.datetime.fromisoformat(request.enqueued_at)
+                    ).total_seconds()
+                    started = True
+                    break
+                retry_after = min(decision.retry_after, retry_after) if retry_after is not None else decision.retry_after
+                if decision.scope == "global":
+                    break
+
+            if started:
+                self.next_slot = time.monotonic() + self.interval()
+                self.schedule_refresh()
+                continue
+
+            self.next_slot = time.monotonic() + retry_after
+            self.schedule_refresh()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(max(retry_after, self.min_poll), QUEUE_IDLE_POLL))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        return {
+            "depth": len(self._queue),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "dispatched": self.dispatched,
+            "refused": self.refused,
+            "average_wait": round(self.total_wait / self.dispatched, 1) if self.dispatched else 0.0,
+        }
+
+
+request_queue = RequestQueue()
@@ -0,0 +1,294 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+
+# ---------------- CONFIG ----------------
+GEMINI_DEADLINE = float(os.environ.get("GEMINI_DEADLINE", 45))              # seconds per request, retries included
+GEMINI_RETRIES = int(os.environ.get("GEMINI_RETRIES", 2))
+GEMINI_RETRY_BACKOFF = float(os.environ.get("GEMINI_RETRY_BACKOFF", 0.5))   # base of the jittered backoff
+GEMINI_HEDGE = os.environ.get("GEMINI_HEDGE", "False").lower() == "true"    # second request after the hedge delay
+GEMINI_HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", 95))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", 20))
+BREAKER_FAILURES = int(os.environ.get("GEMINI_BREAKER_FAILURES", 5))        # consecutive failures that open it
+BREAKER_RESET = float(os.environ.get("GEMINI_BREAKER_RESET", 30))           # seconds before a trial request
+
+LATENCY_WINDOW = 500
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class BackendUnavailable(Exception):
+    """Raised without calling the backend while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f"backend unavailable, retry in {retry_after:.0f}s")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def is_retryable(error):
+    """Timeouts, connection problems, 429 and 5xx are retried; anything else isn't."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None) or getattr(error, "status", None)
+    return isinstance(status, int) and status in RETRYABLE_STATUS
+
+
+# ---------------- Latency ----------------
+class LatencyTracker:
+    """
+    Rolling window of recent successful call durations. With `max_age`,
+    samples older than that many seconds drop out as well.
+    """
+
+    def __init__(self, size=LATENCY_WINDOW, max_age=None):
+        self.max_age = max_age
+        self._samples = deque(maxlen=size)  # (monotonic time, seconds)
+
+    def _expire(self):
+        if self.max_age is None:
+            return
+        cutoff = time.monotonic() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def __len__(self):
+        self._expire()
+        return len(self._samples)
+
+    def observe(self, seconds):
+        self._samples.append((time.monotonic(), seconds))
+
+    def percentile(self, pct):
+        self._expire()
+        if not self._samples:
+            return None
+        ordered = sorted(seconds for _, seconds in self._samples)
+        index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+
+# ---------------- Circuit breaker ----------------
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive retryable failures and fails fast for
+    `reset` seconds; then lets a single trial call through (half open) and
+    closes again on its success.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.failures = failures
+        self.reset = reset
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.short_circuited = 0
+        self._trial_running = False
+
+    def before_call(self):
+        if self.state == "closed":
+            return
+        waited = time.monotonic() - self.opened_at
+        if self.state == "open" and waited >= self.reset:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return
+        self.short_circuited += 1
+        raise BackendUnavailable(max(self.reset - waited, 1))
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._trial_running = False
+        self.state = "closed"
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+    def abandon(self):
+        """The call let through proved nothing (cancelled, or a bad request): let the next one be the trial."""
+        self._trial_running = False
+
+
+# ---------------- Resilient caller ----------------
+class ResilientCaller:
+    """
+    Runs a backend call under a deadline, retries retryable errors with
+    full-jitter exponential backoff, optionally hedges with a second request
+    once the first is slower than the recent p95, and trips a circuit breaker
+    when the backend keeps failing. Calls are given as zero-argument
+    coroutine functions so every attempt starts a fresh request.
+    """
+
+    def __init__(
+        self,
+        deadline=GEMINI_DEADLINE,
+        retries=GEMINI_RETRIES,
+        backoff=GEMINI_RETRY_BACKOFF,
+        hedge=GEMINI_HEDGE,
+        hedge_percentile=GEMINI_HEDGE_PERCENTILE,
+        hedge_min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+        breaker=None,
+    ):
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.deadline_exceeded = 0
+        self.failed = 0
+
+    def hedge_delay(self):
+        if not self.hedge or len(self.latency) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def call(self, request, deadline=None, hedge=True, observe=True):
+        self.calls += 1
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                self.deadline_exceeded += 1
+                raise DeadlineExceeded(f"no answer within {deadline or self.deadline:g}s")
+            self.breaker.before_call()
+
+            started = time.monotonic()
+            try:
+                result = await self._attempt(request, remaining, hedge)
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and time.monotonic() >= deadline_at:
+                    self.breaker.record_failure()
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceeded(f"no answer within {deadline or self.deadline:g}s") from e
+                if not is_retryable(e):
+                    # The request was wrong: not a breaker failure, but no proof the backend is healthy either
+                    self.breaker.abandon()
+                    self.failed += 1
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.retries or self.breaker.state == "open":
+                    self.failed += 1
+                    raise
+                delay = random.uniform(0, self.backoff * 2 ** attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    self.failed += 1
+                    raise
+                attempt += 1
+                self.retried += 1
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled mid-call: neither outcome, but a half-open trial must not stay taken
+                self.breaker.abandon()
+                raise
+
+            self.breaker.record_success()
+            if observe:
+                self.latency.observe(time.monotonic() - started)
+            return result
+
+    async def _attempt(self, request, timeout, hedge):
+        first = asyncio.ensure_future(asyncio.wait_for(request(), timeout))
+        delay = self.hedge_delay() if hedge else None
+        if delay is None or delay >= timeout:
+            return await first
+
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            # The first request is slower than usual: race a second one
+            self.hedged += 1
+            second = asyncio.ensure_future(asyncio.wait_for(request(), timeout - delay))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, request, deadline=None):
+        """
+        Opens a stream through call() (retried, never hedged) and yields its
+        chunks under the same deadline. Errors after the stream opened are
+        not retried, since part of the answer may already be shown.
+        """
+        deadline = deadline or self.deadline
+        deadline_at = time.monotonic() + deadline
+        stream = await self.call(request, deadline, hedge=False, observe=False)
+        iterator = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    remaining = deadline_at - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError as e:
+                    self.breaker.record_failure()
+                    self.deadline_exceeded += 1
+                    raise DeadlineExceeded(f"no answer within {deadline:g}s") from e
+                except Exception as e:
+                    if is_retryable(e):
+                        self.breaker.record_failure()
+                    self.failed += 1
+                    raise
+                yield chunk
+        finally:
+            # Also when the consumer stops early: don't leave the HTTP stream to the GC
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as e:
+                    print("❌ Failed to close Gemini stream:", e)
+
+    def stats(self):
+        p50, p95, p99 = (self.latency.percentile(p) for p in (50, 95, 99))
+        return {
+            "calls": self.calls,
+            "retried": self.retried,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "deadline_exceeded": self.deadline_exceeded,
+            "failed": self.failed,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "short_circuited": self.breaker.short_circuited,
+            "p50": round(p50, 3) if p50 is not None else None,
+            "p95": round(p95, 3) if p95 is not None else None,
+            "p99": round(p99, 3) if p99 is not None else None,
+        }
@@ -0,0 +1,225 @@
+import os
+import re
+
+from KariGPT_resilience import ResilientCaller, BackendUnavailable, LatencyTracker, is_retryable
+from KariGPT_telemetry import telemetry
+
+# ---------------- CONFIG ----------------
+LIGHT_MODEL = os.environ.get("GEMINI_LIGHT_MODEL", "gemini-2.5-flash-lite")
+HEAVY_MODEL = os.environ.get("GEMINI_HEAVY_MODEL", "gemini-3-flash-preview")
+FALLBACK_MODEL = os.environ.get("GEMINI_FALLBACK_MODEL", "")                   # empty: the other tier's model
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "True").lower() == "true"       # False sends everything to HEAVY_MODEL
+LONG_QUESTION_CHARS = int(os.environ.get("LONG_QUESTION_CHARS", 280))           # longer questions go to the heavy model
+HEAVY_LATENCY_BUDGET = float(os.environ.get("HEAVY_LATENCY_BUDGET", 20))        # seconds; heavy p95 above it downgrades "auto"
+FALLBACK_MIN_DEADLINE = float(os.environ.get("FALLBACK_MIN_DEADLINE", 3))       # seconds left needed to try the fallback
+# Seconds a latency sample counts for routing. While "auto" personas avoid the
+# slow heavy model it gets few new samples, so old ones must age out for it to recover
+ROUTING_LATENCY_WINDOW = float(os.environ.get("ROUTING_LATENCY_WINDOW", 300))
+
+LATENCY_MIN_SAMPLES = 20
+
+# Questions that usually want a worked answer rather than a one-liner
+DEEP_HINTS = re.compile(
+    r"\b(explain|why|how (?:does|do|is|are|can|would)|prove|derive|calculate|solve|compare|"
+    r"difference between|step[- ]by[- ]step|in detail|analy[sz]e|history of|pros and cons|"
+    r"equation|theorem|algorithm|code|function|debug)\b"
+    r"|[=^∫∑√]|\d+\s*[-+*/]\s*\d+",
+    re.IGNORECASE,
+)
+
+
+class PersonaProfile:
+    """
+    How a persona is routed: "light" always uses the light model, "heavy"
+    always the heavy one, and "auto" picks by question. Each model gets its
+    own output cap, since the heavy (thinking) model spends part of its
+    budget before answering.
+    """
+
+    def __init__(self, tier="auto", light_tokens=512, heavy_tokens=2048):
+        self.tier = tier
+        self.light_tokens = light_tokens
+        self.heavy_tokens = heavy_tokens
+
+
+# Personas without an entry use DEFAULT_PROFILE
+PERSONA_PROFILES = {
+    # Short banter: fast, small answers
+    "fih": PersonaProfile("light", light_tokens=256, heavy_tokens=1024),
+    "asher": PersonaProfile("light", light_tokens=256, heavy_tokens=1024),
+    "epic": PersonaProfile("light", light_tokens=384, heavy_tokens=1024),
+    "trailer": PersonaProfile("light", light_tokens=512, heavy_tokens=1024),
+    # General helpers: depends on the question
+    "karigpt": PersonaProfile("auto", light_tokens=512, heavy_tokens=2048),
+    "nature": PersonaProfile("auto", light_tokens=768, heavy_tokens=2048),
+    "sibible": PersonaProfile("auto", light_tokens=512, heavy_tokens=3072),
+    "tag": PersonaProfile("auto", light_tokens=768, heavy_tokens=3072),
+    # Deep answers
+    "polit": PersonaProfile("heavy", light_tokens=1024, heavy_tokens=3072),
+    "relig": PersonaProfile("heavy", light_tokens=1024, heavy_tokens=3072),
+}
+DEFAULT_PROFILE = PersonaProfile()
+
+
+def is_overloaded(error):
+    """Errors worth retrying on another model: the backend is busy, not the request wrong."""
+    return isinstance(error, BackendUnavailable) or is_retryable(error)
+
+
+# ---------------- Routes ----------------
+class Route:
+    __slots__ = ("name", "model", "max_output_tokens", "reason")
+
+    def __init__(self, name, model, max_output_tokens, reason):
+        self.name = name
+        self.model = model
+        self.max_output_tokens = max_output_tokens
+        self.reason = reason
+
+    def __repr__(self):
+        return f"Route({self.name}, {self.model}, max_output_tokens={self.max_output_tokens}, reason={self.reason})"
+
+
+class ModelRouter:
+    """
+    Picks a model and output cap for each request from the persona's
+    profile and the question (length and topic hints), and moves "auto"
+    personas to the light model while the heavy one is slow; its latency
+    only counts for `latency_window` seconds, so once the slow samples age
+    out "auto" personas try the heavy model again. Every model
+    is called through its own ResilientCaller, so an overloaded model trips
+    only its own breaker and its latency doesn't skew the other's hedge
+    delay; the fallback route on the other model stays open meanwhile.
+    """
+
+    def __init__(
+        self,
+        light_model=LIGHT_MODEL,
+        heavy_model=HEAVY_MODEL,
+        fallback_model=FALLBACK_MODEL,
+        profiles=PERSONA_PROFILES,
+        enabled=MODEL_ROUTING,
+        long_question_chars=LONG_QUESTION_CHARS,
+        heavy_latency_budget=HEAVY_LATENCY_BUDGET,
+        latency_window=ROUTING_LATENCY_WINDOW,
+        caller_factory=ResilientCaller,
+    ):
+        self.light_model = light_model
+        self.heavy_model = heavy_model
+        self.fallback_model = fallback_model
+        self.profiles = profiles
+        self.enabled = enabled
+        self.long_question_chars = long_question_chars
+        self.heavy_latency_budget = heavy_latency_budget
+        self.latency_window = latency_window
+        self.caller_factory = caller_factory
+        self.callers = {}  # model -> ResilientCaller
+        self.latency = {}  # model -> LatencyTracker
+        self.served = {}   # (route, model) -> requests answered
+        self.failed = {}   # (route, model) -> requests that failed on it
+
+    def caller(self, model):
+        """The ResilientCaller (deadline, retries, hedging, breaker) of one model."""
+        caller = self.callers.get(model)
+        if caller is None:
+            caller = self.callers[model] = self.caller_factory()
+        return caller
+
+    def profile(self, personality):
+        return self.profiles.get(personality, DEFAULT_PROFILE)
+
+    def _heavy_too_slow(self):
+        tracker = self.latency.get(self.heavy_model)
+        if tracker is None or len(tracker) < LATENCY_MIN_SAMPLES:
+            return False
+        return tracker.percentile(95) > self.heavy_latency_budget
+
+    def route(self, personality, question):
+        profile = self.profile(personality)
+        if not self.enabled:
+            return Route("heavy", self.heavy_model, profile.heavy_tokens, "routing_disabled")
+        if profile.tier == "heavy":
+            return Route("heavy", self.heavy_model, profile.heavy_tokens, "persona")
+        if profile.tier == "light":
+            return Route("light", self.light_model, profile.light_tokens, "persona")
+
+        if len(question) > self.long_question_chars:
+            reason = "long_question"
+        elif DEEP_HINTS.search(question):
+            reason = "topic_hint"
+        else:
+            return Route("light", self.light_model, profile.light_tokens, "short_question")
+        if self._heavy_too_slow():
+            return Route("light", self.light_model, profile.light_tokens, "heavy_slow")
+        return Route("heavy", self.heavy_model, profile.heavy_tokens, reason)
+
+    def fallback(self, route, personality):
+        """The route to retry on after `route` was overloaded, or None."""
+        model = self.fallback_model or (self.heavy_model if route.name == "light" else self.light_model)
+        if model == route.model:
+            return None
+        profile = self.profile(personality)
+        tokens = profile.light_tokens if model == self.light_model else profile.heavy_tokens
+        return Route("fallback", model, tokens, f"{route.name}_overloaded")
+
+    def record(self, route, seconds=None, ok=True):
+        """Counts which route served (or failed) a request and tracks its model's latency."""
+        key = (route.name, route.model)
+        if ok:
+            self.served[key] = self.served.get(key, 0) + 1
+            if seconds is not None:
+                tracker = self.latency.get(route.model)
+                if tracker is None:
+                    tracker = self.latency[route.model] = LatencyTracker(max_age=self.latency_window)
+                tracker.observe(seconds)
+        else:
+            self.failed[key] = self.failed.get(key, 0) + 1
+        route_requests.inc(route=route.name, model=route.model, reason=route.reason, outcome="ok" if ok else "error")
+
+    def stats(self):
+        stats = {"enabled": self.enabled}
+        for model, caller in self.callers.items():
+            stats[f"breaker_open_{model}"] = int(caller.breaker.state != "closed")
+        for (name, model), count in self.served.items():
+            stats[f"served_{name}"] = stats.get(f"served_{name}", 0) + count
+        for (name, model), count in self.failed.items():
+            stats[f"failed_{name}"] = stats.get(f"failed_{name}", 0) + count
+        for model, tracker in self.latency.items():
+            p95 = tracker.percentile(95)
+            stats[f"p95_{model}"] = round(p95, 3) if p95 is not None else None
+        return stats
+
+
+route_requests = telemetry.counter(
+    "karigpt_model_routes_total", "Gemini requests by the route and model that handled them",
+    ("route", "model", "reason", "outcome"))
+
+model_router = ModelRouter()
+
+
+def _latency_quantiles():
+    return {
+        (model, str(q / 100)): caller.latency.percentile(q)
+        for model, caller in model_router.callers.items()
+        for q in (50, 95, 99)
+    }
+
+def _breaker_state():
+    return {
+        (model, state): int(caller.breaker.state == state)
+        for model, caller in model_router.callers.items()
+        for state in ("closed", "half_open", "open")
+    }
+
+telemetry.gauge(
+    "karigpt_gemini_latency_quantile_seconds",
+    "Recent Gemini call latency quantiles per model",
+    ("model", "quantile"),
+    callback=_latency_quantiles,
+)
+telemetry.gauge(
+    "karigpt_gemini_breaker_state",
+    "1 for the current circuit breaker state of each Gemini model",
+    ("model", "state"),
+    callback=_breaker_state,
+)
@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+import os
+import time
+
+# Maximum Gemini generations running at once, and how many may wait for a slot
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 4))
+GEMINI_MAX_QUEUE = int(os.environ.get("GEMINI_MAX_QUEUE", 32))
+
+
+class GenerationQueueFull(Exception):
+    pass
+
+
+class GenerationScheduler:
+    """
+    Bounds in-flight Gemini generations with a semaphore and keeps queue-depth
+    and wait-time stats. When more than max_waiting calls are already queued,
+    new ones fail fast with GenerationQueueFull instead of piling up.
+    """
+
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY, max_waiting=GEMINI_MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise GenerationQueueFull(
+                f"The fallen angels are busy ({self.waiting} requests waiting), try again in a moment."
+            )
+
+        enqueued = time.monotonic()
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait = time.monotonic() - enqueued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self):
+        started = self.completed + self.running
+        return {
+            "max_concurrency": self.max_concurrency,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "average_wait": round(self.total_wait / started, 3) if started else 0.0,
+            "max_wait": round(self.max_wait, 3),
+        }
+
+
+generation_scheduler = GenerationScheduler()
@@ -0,0 +1,476 @@
+"""
+Offline load test for FallenAngels.on_message.
+
+Runs the real cog against fake Discord objects, an in-memory Supabase
+stand-in (or a throwaway SQLite database) and a fake Gemini client, replays synthetic message storms and
+reports throughput, latency percentiles and backend calls per message.
+No network access is needed, so it can run in CI:
+
+    python benchmarks/bench_on_message.py
+    python benchmarks/bench_on_message.py --messages 500 --gemini-latency 0.2 --json bench_output.txt
+    python benchmarks/bench_on_message.py --storage sqlite
+    python benchmarks/bench_on_message.py --response-store zlib   # compressed, content-addressed answers
+    python benchmarks/bench_on_message.py --fail-p95-ms 1500   # non-zero exit on regression
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+
+# Keep the bot's side files away from the working tree
+os.environ.setdefault("WRITE_BEHIND_SPILL", os.path.join(tempfile.gettempdir(), "karigpt_bench_spill.jsonl"))
+os.environ.setdefault("CONVERSATION_SPILL", os.path.join(tempfile.gettempdir(), "karigpt_bench_conversations_spill.jsonl"))
+os.environ.setdefault("WRITE_BEHIND_DELAY", "0.05")
+
+import KariGPT_ai  # noqa: E402
+import KariGPT_resilience  # noqa: E402
+import KariGPT_routing  # noqa: E402
+import KariGPT_queue  # noqa: E402
+import cogs.KariGPT as karigpt_cog  # noqa: E402
+from cogs.db import async_database_editor  # noqa: E402
+from cogs.db.guild_settings import guild_settings  # noqa: E402
+from cogs.db.conversation_memory import conversation_memory  # noqa: E402
+from cogs.db.quota_service import QuotaPolicy, quota_service  # noqa: E402
+from cogs.db.request_rollup import request_rollup  # noqa: E402
+from cogs.db.response_cache import response_cache  # noqa: E402
+from cogs.db.response_store import ResponseCodec  # noqa: E402
+from cogs.db.similarity_index import similarity_index  # noqa: E402
+from cogs.db.storage import SQLiteStorage, SupabaseStorage  # noqa: E402
+
+
+# ---------------- In-memory Supabase ----------------
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.op = None
+        self.payload = None
+        self.columns = ()
+        self.filters = []
+        self.order_by = None
+        self.limit_n = None
+
+    def select(self, *columns):
+        self.op = "select"
+        self.columns = columns
+        return self
+
+    def insert(self, rows):
+        self.op = "insert"
+        self.payload = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False):
+        self.op = "upsert"
+        self.payload = rows if isinstance(rows, list) else [rows]
+        self.conflict = on_conflict.split(",") if on_conflict else None
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) < value)
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, n):
+        self.limit_n = n
+        return self
+
+    async def execute(self):
+        self.db.calls += 1
+        await asyncio.sleep(self.db.latency)
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.op == "insert":
+            for row in self.payload:
+                rows.append({"id": next(self.db.ids), **row})
+            return FakeResult(self.payload)
+
+        if self.op == "upsert":
+            for row in self.payload:
+                columns = self.conflict or [next(iter(row))]
+                kept = [r for r in rows if any(r.get(c) != row.get(c) for c in columns)]
+                if self.ignore_duplicates and len(kept) < len(rows):
+                    continue
+                rows[:] = kept
+                rows.append(dict(row))
+            return FakeResult(self.payload)
+
+        result = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.order_by:
+            column, desc = self.order_by
+            result.sort(key=lambda row: row.get(column), reverse=desc)
+        if self.limit_n is not None:
+            result = result[:self.limit_n]
+        if self.columns and self.columns != ("*",):
+            result = [{c: row.get(c) for c in self.columns if "(" not in c} | self._embed(row) for row in result]
+        return FakeResult(result)
+
+    def _embed(self, row):
+        # Only the response_hash -> KariGPT_responses.hash relation is needed
+        embedded = {}
+        for column in self.columns:
+            if "(" not in column:
+                continue
+            table, fields = column[:-1].split("(")
+            match = next((r for r in self.db.tables.get(table, []) if r["hash"] == row.get("response_hash")), None)
+            embedded[table] = {f: match[f] for f in fields.split(",")} if match else None
+        return embedded
+
+
+class FakeSupabase:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.tables = {}
+        self.ids = itertools.count(1)
+        self.postgrest = types.SimpleNamespace(aclose=self._aclose)
+
+    async def _aclose(self):
+        pass
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+# ---------------- Fake Gemini ----------------
+class FakeServerError(Exception):
+    code = 503  # retryable, like google.genai.errors.ServerError
+
+
+class FakeModels:
+    def __init__(self, latency, jitter, error_rate, chunks):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.chunks = chunks
+        self.calls = 0
+
+    async def _delay(self):
+        self.calls += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+        if random.random() < self.error_rate:
+            raise FakeServerError("503 UNAVAILABLE (fake)")
+
+    async def generate_content(self, model, contents, config=None):
+        await self._delay()
+        return types.SimpleNamespace(text=f"fake answer to {contents}", usage_metadata=None)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        await self._delay()
+
+        async def stream():
+            for i in range(self.chunks):
+                await asyncio.sleep(0)
+                yield types.SimpleNamespace(text=f"chunk {i} of {contents} ", usage_metadata=None)
+        return stream()
+
+
+class FakeGemini:
+    def __init__(self, **kwargs):
+        self.models = FakeModels(**kwargs)
+        self.aio = types.SimpleNamespace(models=self.models)
+
+
+# ---------------- Fake Discord ----------------
+class FakeSentMessage:
+    def __init__(self, channel, content):
+        self.id = next(FakeMessage.ids)
+        self.channel = channel
+        self.content = content
+
+    async def edit(self, content=None, **kwargs):
+        self.channel.edits += 1
+        self.content = content
+
+    async def delete(self):
+        self.channel.deletes += 1
+
+
+class FakeChannel:
+    def __init__(self, channel_id, latency):
+        self.id = channel_id
+        self.latency = latency
+        self.sends = 0
+        self.edits = 0
+        self.deletes = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sends += 1
+        await asyncio.sleep(self.latency)
+        return FakeSentMessage(self, content)
+
+    @contextlib.asynccontextmanager
+    async def typing(self):
+        yield
+
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.bot = False
+
+    def __str__(self):
+        return f"user{self.id}"
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeMessage:
+    ids = itertools.count(1)
+
+    def __init__(self, content, author, channel):
+        self.id = next(self.ids)
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = FakeGuild(1)
+
+
+class FakeBot:
+    async def process_commands(self, message):
+        pass
+
+    def get_channel(self, channel_id):
+        return None
+
+
+# ---------------- Scenarios ----------------
+QUESTIONS = [
+    "what is the meaning of life", "how do I learn python", "why is the sky blue",
+    "what should I eat today", "is the earth flat", "how do computers work",
+]
+
+
+def scenario_messages(name, count, users, channel_ids):
+    rnd = random.Random(name)
+    messages = []
+    for i in range(count):
+        user = rnd.randrange(users)
+        channel = channel_ids[i % len(channel_ids)]
+        if name == "cache_hits":
+            text = f"tag: {rnd.choice(QUESTIONS)}?"
+        elif name == "repeated":
+            text = "tag: what is the best programming language?"
+        else:  # misses, cooldown, queued
+            text = f"tag: question number {i} about {rnd.choice(QUESTIONS)}?"
+        messages.append((text, user, channel))
+    return messages
+
+
+SCENARIOS = {
+    # name: (global policy, stored answers seeded beforehand)
+    "cache_hits": (QuotaPolicy(None, None), True),
+    "misses": (QuotaPolicy(None, None), False),
+    "cooldown": (QuotaPolicy(20, 120), False),
+    "repeated": (QuotaPolicy(None, None), False),
+    # Short cooldown: most requests wait in the queue, timed until it drains
+    "queued": (QuotaPolicy(None, 0.01), False),
+}
+
+
+def reset_state(args, policy):
+    response_cache.clear()
+    response_cache.hits = response_cache.misses = 0
+    similarity_index.clear()
+    request_rollup.rebuild([])
+    quota_service.global_policy = policy
+    quota_service.user_policy = QuotaPolicy()
+    quota_service.channel_policy = QuotaPolicy()
+    quota_service.rebuild([], karigpt_cog.now_utc8())
+    guild_settings.load([])
+    conversation_memory.load([])
+    conversation_memory._conversations.clear()
+    conversation_memory.enabled = args.memory
+    conversation_memory.summarizer = KariGPT_ai.summarize_conversation
+    conversation_memory.summaries = conversation_memory.dropped_turns = 0
+
+    responses = ResponseCodec(args.response_store) if args.response_store else None
+    if args.storage == "sqlite":
+        storage = SQLiteStorage(":memory:", responses=responses)
+    else:
+        storage = SupabaseStorage(client=FakeSupabase(args.db_latency), responses=responses)
+    gemini = FakeGemini(
+        latency=args.gemini_latency,
+        jitter=args.gemini_jitter,
+        error_rate=args.gemini_error_rate,
+        chunks=args.stream_chunks,
+    )
+    async_database_editor._storage = storage
+    async_database_editor.SHARED_QUOTA = args.shared_quota
+    KariGPT_ai._client = gemini
+    KariGPT_ai.model_router = KariGPT_routing.ModelRouter(caller_factory=lambda: KariGPT_resilience.ResilientCaller(
+        backoff=0.01, breaker=KariGPT_resilience.CircuitBreaker(reset=1)))
+    KariGPT_ai.persona_registry.context_caching = False
+    karigpt_cog.STREAM_RESPONSES = args.stream
+    karigpt_cog.REQUEST_QUEUE = args.queue
+    karigpt_cog.request_queue = KariGPT_queue.RequestQueue(
+        max_size=args.messages, max_per_user=args.messages, min_poll=0.001)
+    karigpt_cog.STREAM_EDIT_INTERVAL = 0
+    return storage, gemini
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run_scenario(name, args):
+    policy, seeded = SCENARIOS[name]
+    storage, gemini = reset_state(args, policy)
+
+    bot = FakeBot()
+    cog = karigpt_cog.FallenAngels(bot)
+    channel_ids = sorted(guild_settings.default_channels)
+    channels = {cid: FakeChannel(cid, args.discord_latency) for cid in channel_ids}
+    messages = scenario_messages(name, args.messages, args.users, channel_ids)
+
+    if seeded:
+        await storage.insert_requests([
+            {"question": karigpt_cog.build_memory_key("tag", question), "ai_response": "stored",
+             "user_id": 0, "username": "seed", "timestamp": "2000-01-01T00:00:00+00:00"}
+            for question in QUESTIONS
+        ])
+        storage.calls = 0
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def deliver(text, user, channel_id):
+        message = FakeMessage(text, FakeAuthor(user), channels[channel_id])
+        async with semaphore:
+            start = time.perf_counter()
+            await cog.on_message(message)
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(deliver(*m) for m in messages))
+        if name == "queued":
+            # Throughput of a queue-drained burst includes the drain
+            while len(karigpt_cog.request_queue) or cog._queued_tasks:
+                await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        await karigpt_cog.request_queue.close()
+        await async_database_editor.close_storage()
+
+    count = len(messages)
+    sends = sum(c.sends for c in channels.values())
+    edits = sum(c.edits for c in channels.values())
+    return {
+        "scenario": name,
+        "messages": count,
+        "throughput_per_s": round(count / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        "db_calls_per_msg": round(storage.calls / count, 3),
+        "gemini_calls_per_msg": round(gemini.models.calls / count, 3),
+        "gemini_retries": sum(c.retried for c in KariGPT_ai.model_router.callers.values()),
+        "queue_peak": karigpt_cog.request_queue.max_depth,
+        "summaries": conversation_memory.summaries,
+        "stored_ratio": storage.responses.stats()["ratio"] if storage.responses is not None else 1.0,
+        "fallbacks": sum(c for (route, _), c in KariGPT_ai.model_router.served.items() if route == "fallback"),
+        "discord_sends_per_msg": round(sends / count, 3),
+        "discord_edits_per_msg": round(edits / count, 3),
+    }
+
+
+def print_table(results):
+    columns = list(results[0].keys())
+    widths = {c: max(len(c), *(len(str(r[c])) for r in results)) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    for r in results:
+        print("  ".join(str(r[c]).ljust(widths[c]) for c in columns))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--messages", type=int, default=200, help="messages per scenario")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50, help="messages handled at once")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="mean seconds per generation")
+    parser.add_argument("--gemini-jitter", type=float, default=0.01)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--stream-chunks", type=int, default=5)
+    parser.add_argument("--storage", choices=("supabase", "sqlite"), default="supabase")
+    parser.add_argument("--shared-quota", action="store_true", help="also reserve quota in the database (sqlite only)")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="seconds per fake Supabase call")
+    parser.add_argument("--discord-latency", type=float, default=0.002, help="seconds per Discord REST call")
+    parser.add_argument("--stream", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--memory", action="store_true", help="enable per-user conversation memory")
+    parser.add_argument("--queue", action=argparse.BooleanOptionalAction, default=True, help="queue requests during cooldowns")
+    parser.add_argument("--response-store", choices=("zlib", "zstd"),
+                        help="store answers once, compressed, in the response store")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write results as JSON")
+    parser.add_argument("--fail-p95-ms", type=float, help="exit 1 if any scenario's p95 exceeds this")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    if args.shared_quota and args.storage != "sqlite":
+        print("❌ --shared-quota needs --storage sqlite")
+        return 2
+    random.seed(args.seed)
+
+    results = [await run_scenario(name, args) for name in args.scenarios]
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.fail_p95_ms is not None:
+        slow = [r["scenario"] for r in results if r["p95_ms"] > args.fail_p95_ms]
+        if slow:
+            print(f"❌ p95 above {args.fail_p95_ms}ms in: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,9 +1,16 @@
 import asyncio
+import hashlib
+import json
 import os
+import sys
+import time
 import discord
 from discord.ext import commands
 from aiohttp import web
 
+from KariGPT_outbox import outbox
+from KariGPT_telemetry import telemetry, commands_processed, event_loop_lag, event_loop_lag_histogram, gateway_latency
+
 # ----------------- CONFIG -----------------
 # Only load .env locally
 if os.environ.get("RENDER") != "true":  # You can set RENDER=True in Render env
@@ -16,36 +23,161 @@ if os.environ.get("RENDER") != "true":  # You can set RENDER=True in Render env
 DISCORD_TOKEN = os.environ.get("DISCORD_TOKEN")  # Use .env locally or Render env
 USE_WEB = os.environ.get("USE_WEB", "False").lower() == "true"  # Manual toggle
 PORT = int(os.environ.get("PORT", 5000))  # Used only if USE_WEB=True
+# Automatic sharding: discord.py picks the shard count unless SHARD_COUNT is set
+AUTO_SHARD = os.environ.get("AUTO_SHARD", "False").lower() == "true"
+SHARD_COUNT = int(os.environ["SHARD_COUNT"]) if os.environ.get("SHARD_COUNT") else None
+LAG_PROBE_INTERVAL = float(os.environ.get("LAG_PROBE_INTERVAL", 1))  # seconds between event-loop lag probes
+# Slash commands are only synced when the command tree changed since the last sync
+COMMAND_HASH_FILE = os.environ.get("COMMAND_HASH_FILE", ".command_tree.hash")
+FORCE_SYNC = (
+    os.environ.get("FORCE_SYNC", "False").lower() == "true"
+    or "--force-sync" in sys.argv
+)
 # -----------------------------------------
 
 # ---------- Discord Bot ----------
-class Bot(commands.Bot):
+BotBase = commands.AutoShardedBot if AUTO_SHARD else commands.Bot
+
+class Bot(BotBase):
     def __init__(self):
         intents = discord.Intents.default()
         intents.message_content = True 
-        super().__init__(command_prefix=None, intents=intents)
-
+        options = {"shard_count": SHARD_COUNT} if AUTO_SHARD and SHARD_COUNT else {}
+        # Outbound messages are paced from the rate limit headers of every REST call
+        super().__init__(command_prefix=None, intents=intents, http_trace=outbox.http_trace(), **options)
+        self.started_at = time.perf_counter()
+        self.startup_timings = {}
+        self.extension_timings = {}  # import + setup time per cog module
+        self._warm_up_task = None
+        self._lag_probe_task = None
+        self.warmed_up = False
+        gateway_latency.callback = self.gateway_latency
 
     async def setup_hook(self):
+        self._lag_probe_task = asyncio.create_task(self.probe_event_loop_lag())
+
         # Load all cogs
+        phase_start = time.perf_counter()
         if os.path.isdir("cogs"):
             for file in os.listdir("cogs"):
                 if file.endswith(".py") and not file.startswith("_"):
+                    extension_start = time.perf_counter()
                     await self.load_extension(f"cogs.{file[:-3]}")
+                    self.extension_timings[f"cogs.{file[:-3]}"] = time.perf_counter() - extension_start
+        self.startup_timings["cog loading"] = time.perf_counter() - phase_start
+
         # Sync slash commands
+        phase_start = time.perf_counter()
+        await self.sync_commands(force=FORCE_SYNC)
+        self.startup_timings["command sync"] = time.perf_counter() - phase_start
+        self._connect_started = time.perf_counter()
+
+    def command_tree_fingerprint(self):
+        payload = {
+            "application_id": self.application_id,
+            "commands": [command.to_dict(self.tree) for command in self.tree.get_commands()],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    async def sync_commands(self, force=False):
+        fingerprint = self.command_tree_fingerprint()
+        previous = None
+        try:
+            with open(COMMAND_HASH_FILE) as f:
+                previous = f.read().strip()
+        except FileNotFoundError:
+            pass
+
+        if not force and fingerprint == previous:
+            print("✅ Slash commands unchanged, skipping sync")
+            return False
+
         await self.tree.sync()
+        try:
+            with open(COMMAND_HASH_FILE, "w") as f:
+                f.write(fingerprint)
+        except OSError as e:
+            print("❌ Failed to save command tree fingerprint:", e)
         print("✅ Slash commands synced")
+        return True
+
+    async def on_shard_ready(self, shard_id):
+        print(f"🧩 Shard {shard_id} ready")
 
     async def on_ready(self):
-        print(f"✅ Logged in as {self.user} ({self.user.id})")
+        shards = f", {self.shard_count} shards" if AUTO_SHARD else ""
+        print(f"✅ Logged in as {self.user} ({self.user.id}){shards}")
+        if "gateway connect" not in self.startup_timings:
+            self.startup_timings["gateway connect"] = time.perf_counter() - self._connect_started
+            total = time.perf_counter() - self.started_at
+            breakdown = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items())
+            print(f"⏱️ Startup took {total:.2f}s ({breakdown})")
+            for extension, seconds in sorted(self.extension_timings.items(), key=lambda item: -item[1]):
+                print(f"   📦 {extension}: {seconds * 1000:.0f}ms")
+
+            # Clients and caches are initialized after login, concurrently
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self):
+        """Runs every cog's warm_up() concurrently and reports how long each took."""
+        async def timed(name, coro):
+            start = time.perf_counter()
+            try:
+                await coro
+            except Exception as e:
+                print(f"❌ Warm-up failed for {name}:", e)
+            return name, time.perf_counter() - start
+
+        results = await asyncio.gather(*(
+            timed(name, cog.warm_up())
+            for name, cog in self.cogs.items()
+            if hasattr(cog, "warm_up")
+        ))
+        if results:
+            print("🔥 Warm-up done: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in results))
+        self.warmed_up = True
+
+    async def on_app_command_completion(self, interaction, command):
+        cog = getattr(command.binding, "qualified_name", "none")
+        commands_processed.inc(cog=cog, command=command.qualified_name)
+
+    async def probe_event_loop_lag(self):
+        """Measures how late the loop wakes up from a sleep, i.e. how long something blocked it."""
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LAG_PROBE_INTERVAL)
+            lag = max(0.0, time.perf_counter() - start - LAG_PROBE_INTERVAL)
+            event_loop_lag.set(round(lag, 6))
+            event_loop_lag_histogram.observe(lag)
+
+    def gateway_latency(self):
+        latency = self.latency
+        # discord.py reports inf/nan until the first heartbeat is acknowledged
+        return latency if latency == latency and latency != float("inf") else None
+
+    @property
+    def ready_for_traffic(self):
+        return self.is_ready() and self.warmed_up
 
 # ---------- Web Server ----------
 async def handle(request):
     return web.Response(text="Bot is alive!")
 
-async def start_web_server():
+async def handle_metrics(request):
+    return web.Response(text=telemetry.render(), content_type="text/plain", charset="utf-8")
+
+async def handle_ready(request):
+    bot = request.app["bot"]
+    if bot.ready_for_traffic:
+        return web.Response(text="ready")
+    return web.Response(text="starting", status=503)
+
+async def start_web_server(bot):
     app = web.Application()
+    app["bot"] = bot
     app.router.add_get("/", handle)
+    app.router.add_get("/metrics", handle_metrics)
+    app.router.add_get("/ready", handle_ready)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", PORT)
@@ -58,7 +190,7 @@ async def main():
 
     if USE_WEB:
         # Start web server in background (needed for Render Web Service)
-        await start_web_server()
+        await start_web_server(bot)
 
     async with bot:
         await bot.start(DISCORD_TOKEN)
@@ -1,15 +1,42 @@
+import os
 import re
+import time
 import traceback
 import asyncio
 import datetime
 import discord
 from discord.ext import commands
 
-from KariGPT_ai import ask_KariGPT
-from cogs.db.database_editor import (
+from KariGPT_ai import PERSONALITIES, ask_KariGPT_async, ask_KariGPT_stream_async, describe_error, get_client as get_gemini_client
+from KariGPT_resilience import BackendUnavailable, DeadlineExceeded
+from KariGPT_routing import model_router
+from cogs.db.async_database_editor import (
     insert_request,
-    find_previous_response,get_last_request_global,
+    find_previous_response,
+    prewarm_response_cache,
+    initialize_storage,
+    start_writers,
+    request_writer,
+    rebuild_quota_service,
+    reserve_quota,
+    commit_quota,
+    release_quota,
+    close_storage,
+    remember_turn,
+    load_queued_requests,
+    save_queued_request,
+    delete_queued_request,
 )
+from cogs.db.quota_service import quota_service, DAILY_LIMIT
+from cogs.db.guild_settings import guild_settings
+from cogs.db.conversation_memory import conversation_memory, contextual_key
+from cogs.db.similarity_index import similarity_index, SIGNIFICANT_CHARS, STRICT_QUESTION_MATCHING
+from cogs.db.response_cache import response_cache
+from cogs.db.response_store import response_codec
+from KariGPT_scheduler import generation_scheduler, GenerationQueueFull
+from KariGPT_outbox import outbox, DISCORD_MESSAGE_LIMIT
+from KariGPT_queue import request_queue, QueuedRequest, REQUEST_QUEUE, QUEUE_SHUTDOWN_TIMEOUT
+from KariGPT_telemetry import telemetry, messages_processed, responses_served, rejections
 
 # =========================
 # Timezone (UTC-8)
@@ -19,26 +46,92 @@ KariGPT_TZ = datetime.timezone(datetime.timedelta(hours=-8))
 def now_utc8():
     return datetime.datetime.now(KariGPT_TZ)
 
+# =========================
+# Telemetry
+# =========================
+def _component_stats():
+    stats = {}
+    for component, values in (
+        ("response_cache", response_cache.stats()),
+        ("similarity_index", similarity_index.stats()),
+        ("generation_scheduler", generation_scheduler.stats()),
+        ("model_router", model_router.stats()),
+        ("write_behind", request_writer.stats()),
+        ("outbox", outbox.stats()),
+        ("guild_settings", guild_settings.stats()),
+        ("conversation_memory", conversation_memory.stats()),
+        ("request_queue", request_queue.stats()),
+        ("response_store", response_codec.stats()),
+    ):
+        for stat, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats[(component, stat)] = value
+    for model, caller in model_router.callers.items():
+        for stat, value in caller.stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stats[(f"gemini_caller:{model}", stat)] = value
+    return stats
+
+telemetry.gauge(
+    "karigpt_component_stat",
+    "Counters and sizes of in-memory components",
+    ("component", "stat"),
+    callback=_component_stats,
+)
+
+# =========================
+# Streaming
+# =========================
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "True").lower() == "true"
+STREAM_EDIT_INTERVAL = float(os.environ.get("STREAM_EDIT_INTERVAL", 1.5))  # seconds between edits
+
 # =========================
 # Helpers
 # =========================
-def normalize_question(q: str) -> str:
-    return re.sub(r"[^a-zA-Z]", "", q).lower()
+def normalize_question(q: str, strict: bool = False) -> str:
+    # Strict mode keeps digits and symbols so "2+2" and "3+3" stay different
+    pattern = f"[^a-zA-Z{SIGNIFICANT_CHARS}]" if strict else r"[^a-zA-Z]"
+    return re.sub(pattern, "", q).lower()
 
-def build_memory_key(personality: str, question: str) -> str:
+def build_memory_key(personality: str, question: str, strict: bool = STRICT_QUESTION_MATCHING) -> str:
     # include personality in the question string
     raw = f"{personality}:{question}"
-    return normalize_question(raw)
+    return normalize_question(raw, strict=strict)
+
+QUEUE_REFUSALS = {
+    "duplicate": "📌 That question is already queued, it will be answered in turn.",
+    "full": "⏳ **The queue is full.** Please try again in a few minutes.",
+    "user": "⏳ You already have {limit} questions queued, wait for them to be answered first.",
+    "wait": "⏳ **The queue is too long right now.** Please try again later.",
+}
+
+COOLDOWN_SCOPES = {
+    "global": "",
+    "user": " for you",
+    "channel": " in this channel",
+    "guild": " in this server",
+}
+
+async def send_system_error(channel, now, current_count, daily_limit, personality, error):
+    await send_error_with_status(
+        channel=channel,
+        now=now,
+        current_count=current_count,
+        daily_limit=daily_limit,
+        message=(
+            f"❌ **System error while invoking `{personality}`**:\n"
+            f"```{error}```"
+        ),
+    )
 
 async def send_error_with_status(channel, now, current_count, daily_limit, message):
-    await channel.send(message)
-    await channel.send(
-        fallen_angel_status_message(
-            now=now,
-            current_count=current_count,
-            daily_limit=daily_limit,
-        )
+    # One message: the error with the status underneath
+    status = fallen_angel_status_message(
+        now=now,
+        current_count=current_count,
+        daily_limit=daily_limit,
     )
+    await outbox.send_long(channel, f"{message}\n\n{status}")
 
 def fallen_angel_status_message(now, current_count, daily_limit):
     remaining_requests = daily_limit - current_count
@@ -57,7 +150,7 @@ def fallen_angel_status_message(now, current_count, daily_limit):
         f"Reset in **{hours}h {minutes}m**"
     )
 
-async def send_daily_limit_message(channel, now, daily_limit):
+def daily_limit_message(now):
     tomorrow = datetime.datetime.combine(
         now.date() + datetime.timedelta(days=1),
         datetime.time(0, 0),
@@ -67,19 +160,53 @@ async def send_daily_limit_message(channel, now, daily_limit):
     hours, remainder = divmod(int(remaining.total_seconds()), 3600)
     minutes, seconds = divmod(remainder, 60)
 
-    await channel.send(
+    return (
         f"⏳ **Daily request limit reached**.\n"
         f"Access will be restored in {hours}h {minutes}m {seconds}s."
     )
 
+class SingleFlight:
+    """
+    One in-flight future per memory key, so identical questions asked while
+    the first is still being answered share its result instead of paying
+    for another Gemini call and another quota slot.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    def get(self, key):
+        return self._calls.get(key)
+
+    def start(self, key):
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        return future
+
+    def finish(self, key, future, result):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.done():
+            future.set_result(result)
+
 # =========================
 # Cog
 # =========================
 class FallenAngels(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.WATCH_CHANNEL_ID = [1445080995480076441, 1465442662470389914,1464061703015895233]
-        self.DAILY_LIMIT = 20
+        self.DAILY_LIMIT = DAILY_LIMIT
+        self.in_flight = SingleFlight()
+        self._queued_tasks = set()
+        # Only real personas get a similarity partition
+        similarity_index.personas = PERSONALITIES
+
+        # Requests that hit a cooldown wait in the queue; the worker starts
+        # them as the global cooldown frees slots
+        request_queue.dispatch = self.dispatch
+        request_queue.discard = self.settle_queued
+        request_queue.interval = lambda: quota_service.global_policy.cooldown or 0
 
         # personality : question ?
         self.trigger_regex = re.compile(
@@ -87,6 +214,109 @@ class FallenAngels(commands.Cog):
             re.IGNORECASE,
         )
 
+    async def warm_up(self):
+        # Called by the bot after login, concurrently with the other cogs
+        await asyncio.gather(
+            asyncio.to_thread(get_gemini_client),
+            self.open_storage(),
+            prewarm_response_cache(),
+            self.load_quota_state(),
+        )
+
+    async def open_storage(self):
+        # Spilled rows are replayed once the tables are known to exist
+        await initialize_storage()
+        start_writers()
+
+    async def load_quota_state(self):
+        # The queue can only be drained once today's usage is known; a
+        # message may already have triggered the rebuild
+        if not quota_service.ready:
+            await rebuild_quota_service()
+        await self.restore_queue()
+
+    async def cog_unload(self):
+        # Queued requests stay stored and are restored on the next start
+        await request_queue.close()
+        await self.finish_dispatched()
+        await close_storage()
+
+    async def finish_dispatched(self, timeout=QUEUE_SHUTDOWN_TIMEOUT):
+        """
+        Gives requests the queue already started (their stored row is gone)
+        up to `timeout` seconds to finish. Those still running are cancelled,
+        which releases their quota reservation.
+        """
+        if not self._queued_tasks:
+            return
+        _, pending = await asyncio.wait(set(self._queued_tasks), timeout=timeout)
+        if pending:
+            print(f"❌ Cancelling {len(pending)} queued requests still running at shutdown")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def generate_answer(self, channel, personality, question, now, current_count, context=None):
+        """
+        Waits for the full answer without sending it.
+        Returns (answer, None), or (None, None) if an error was sent instead.
+        """
+        async with channel.typing():
+            try:
+                response_text = await ask_KariGPT_async(question, personality=personality, context=context)
+            except Exception as e:
+                await send_system_error(channel, now, current_count, self.DAILY_LIMIT, personality, e)
+                return None, None
+
+        # Check if the response is an error
+        if response_text.startswith("❌") or response_text.startswith("⚠️"):
+            await outbox.send(channel, response_text)
+            return None, None
+
+        return response_text, None
+
+    async def stream_answer(self, channel, personality, question, now, current_count, context=None):
+        """
+        Posts a placeholder and edits it as chunks arrive, at most once per
+        STREAM_EDIT_INTERVAL seconds to stay under Discord's edit rate limit.
+        Returns (answer, placeholder) so the final edit can carry the status,
+        or (None, None) if an error was shown instead.
+        """
+        header = f"🕯️ **{personality.capitalize()}** response:\n"
+        placeholder = await outbox.send(channel, header + "✍️ ...")
+
+        response_text = ""
+        last_edit = time.monotonic()
+        stream = ask_KariGPT_stream_async(question, personality=personality, context=context)
+        try:
+            try:
+                async for chunk in stream:
+                    response_text += chunk
+                    if time.monotonic() - last_edit >= STREAM_EDIT_INTERVAL:
+                        preview = header + response_text
+                        if len(preview) > DISCORD_MESSAGE_LIMIT:
+                            preview = preview[:DISCORD_MESSAGE_LIMIT - 1] + "…"
+                        await outbox.edit(placeholder, preview)
+                        last_edit = time.monotonic()
+            finally:
+                # A failed edit leaves the stream unfinished: free its slot and connection now
+                await stream.aclose()
+        except (GenerationQueueFull, BackendUnavailable, DeadlineExceeded) as e:
+            # Expected under load or while Gemini is degraded: no stack of details
+            await outbox.edit(placeholder, describe_error(e, personality))
+            return None, None
+        except Exception as e:
+            await outbox.delete(placeholder)
+            await send_system_error(channel, now, current_count, self.DAILY_LIMIT, personality, e)
+            return None, None
+
+        response_text = response_text.strip()
+        if not response_text:
+            await outbox.edit(placeholder, f"⚠️ AI ({personality}) returned an empty or unusable response.")
+            return None, None
+
+        return response_text, placeholder
+
     @commands.Cog.listener()
     async def on_error(self, event, *args, **kwargs):
         traceback.print_exc()
@@ -96,8 +326,10 @@ class FallenAngels(commands.Cog):
         if message.author.bot:
             return
 
-        if message.channel.id not in self.WATCH_CHANNEL_ID:
+        # Watched channels come from the per-guild settings (set lookups)
+        if not guild_settings.is_watched(message.channel) or not guild_settings.user_allowed(message.author.id):
             return
+        messages_processed.inc(cog="FallenAngels")
 
         match = self.trigger_regex.match(message.content.strip())
         if not match:
@@ -107,111 +339,293 @@ class FallenAngels(commands.Cog):
         personality = match.group(1).strip().lower()
         question = match.group(2).strip()
 
+        if message.guild is not None and not guild_settings.get(message.guild.id).persona_allowed(personality):
+            await outbox.notify(
+                message.channel,
+                message.author.id,
+                f"persona:{personality}",
+                f"🚫 `{personality}` is not enabled in this server.",
+            )
+            return
+
         memory_key = build_memory_key(personality, question)
 
         # =========================
-        # Memory lookup
+        # Conversation: follow-ups depend on what was said before, so
+        # stored and shared answers don't apply
         # =========================
-        previous = find_previous_response(memory_key)
-        if previous:
-            await message.channel.send(
-                f"📘 **{personality.capitalize()}** (stored response):\n{previous}"
-            )
+        if conversation_memory.context(message.author.id, personality):
+            await self.answer(message, personality, question, memory_key)
+            await self.bot.process_commands(message)
             return
 
         # =========================
-        # Rate limiting
+        # Memory lookup
         # =========================
-        now = now_utc8()
-        last_request = get_last_request_global()
-
-        current_count = 0
-        last_request_time = None
-        last_request_date = None
-
-        if last_request:
-            try:
-                ts = datetime.datetime.fromisoformat(last_request["timestamp"])
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=datetime.timezone.utc)
-                last_request_time = ts.astimezone(KariGPT_TZ)
-                last_request_date = last_request_time.date()
-                current_count = last_request.get("current_count", 0)
-            except Exception:
-                current_count = 0
-
-        if not last_request_date or now.date() > last_request_date:
-            current_count = 0
-            last_request_time = None
-
-
-        if last_request_time:
-            delta = (now - last_request_time).total_seconds()
-            if delta < 120:
-                remaining = int(120 - delta)
-                minutes, seconds = divmod(remaining, 60)
-                await message.channel.send(
-                    f"⏳ **Cooldown active**. Please wait {minutes}m {seconds}s before submitting another request."
-                )
-                return
+        previous = await find_previous_response(memory_key)
+        if previous:
+            await outbox.send(
+                message.channel,
+                f"📘 **{personality.capitalize()}** (stored response):\n{previous}",
+            )
+            responses_served.inc(source="stored")
+            remember_turn(message.author.id, personality, question, previous)
+            return
 
-        if current_count >= self.DAILY_LIMIT:
-            await send_daily_limit_message(message.channel, now, self.DAILY_LIMIT)
+        similar = similarity_index.lookup(personality, memory_key)
+        if similar:
+            previous, score = similar
+            await outbox.send(
+                message.channel,
+                f"📘 **{personality.capitalize()}** (stored response, {score:.0%} match):\n{previous}",
+            )
+            responses_served.inc(source="similar")
+            remember_turn(message.author.id, personality, question, previous)
             return
 
         # =========================
-        # AI call
+        # Single-flight: share an identical question already being answered
         # =========================
-        async with message.channel.typing():
-            try:
-                response_text = await asyncio.to_thread(
-                    ask_KariGPT,
-                    question,
-                    personality=personality,
+        while (leader := self.in_flight.get(memory_key)) is not None:
+            self.in_flight.coalesced += 1
+            shared = await asyncio.shield(leader)
+            if shared:
+                await outbox.send(
+                    message.channel,
+                    f"📘 **{personality.capitalize()}** (shared response):\n{shared}",
                 )
+                responses_served.inc(source="shared")
+                remember_turn(message.author.id, personality, question, shared)
+                return
+            # The leader was rejected or failed: try again ourselves
 
-                # Check if the response is an error
-                if response_text.startswith("❌") or response_text.startswith("⚠️"):
-                    await message.channel.send(response_text)
-                    return  # Do NOT increment count or save to DB
+        future = self.in_flight.start(memory_key)
+        response_text = None
+        try:
+            response_text = await self.answer(message, personality, question, memory_key)
+        finally:
+            self.in_flight.finish(memory_key, future, response_text)
 
-                # ✅ Only now increment count and allow DB storage
-                current_count += 1
+        await self.bot.process_commands(message)
 
-            except Exception as e:
-                await send_error_with_status(
-                    channel=message.channel,
-                    now=now,
-                    current_count=current_count,
-                    daily_limit=self.DAILY_LIMIT,
-                    message=(
-                        f"❌ **System error while invoking `{personality}`**:\n"
-                        f"```{e}```"
-                    ),
-                )
-                return
+    async def answer(self, message, personality, question, memory_key):
+        """
+        Rate limits, generates, sends and stores a fresh answer. During a
+        cooldown the request is queued instead (REQUEST_QUEUE) and answered
+        by the queue worker later.
+        Returns the answer, or None if the request was queued, rejected or failed.
+        """
+        request = QueuedRequest.from_message(message, personality, question, memory_key)
 
         # =========================
-        # Send + store (only valid responses)
-        await message.channel.send(
-            f"🕯️ **{personality.capitalize()}** response:\n{response_text}"
+        # Rate limiting
+        # =========================
+        now = now_utc8()
+        if not quota_service.ready:
+            await rebuild_quota_service()
+
+        # Nobody jumps the queue: while it holds requests, new ones line up too
+        if REQUEST_QUEUE and len(request_queue):
+            refusal = await self.enqueue(request, now, retry_after=0)
+            if refusal is not None:
+                await self.notify_queue_refusal(request, refusal, now)
+            return None
+
+        # Checked and counted in one step; handed back if generation fails
+        reservation = await self.reserve(request, now)
+        decision = reservation.decision
+
+        if decision.reason == "cooldown" and REQUEST_QUEUE:
+            refusal = await self.enqueue(request, now, decision.retry_after)
+            if refusal is None:
+                return None
+            if refusal == "duplicate":
+                await self.notify_queue_refusal(request, refusal, now)
+                return None
+
+        if not decision.allowed:
+            rejections.inc(reason=decision.reason, scope=decision.scope)
+
+        if decision.reason == "cooldown":
+            # Repeated notices to the same user are debounced by the outbox
+            minutes, seconds = divmod(decision.retry_after, 60)
+            await outbox.notify(
+                message.channel,
+                message.author.id,
+                f"cooldown:{decision.scope}",
+                f"⏳ **Cooldown active**{COOLDOWN_SCOPES[decision.scope]}. "
+                f"Please wait {minutes}m {seconds}s before submitting another request.",
+            )
+            return None
+
+        if decision.reason == "daily_limit":
+            await outbox.notify(message.channel, message.author.id, "daily_limit", daily_limit_message(now))
+            return None
+
+        if decision.reason == "unavailable":
+            await outbox.notify(
+                message.channel,
+                message.author.id,
+                "unavailable",
+                f"⚠️ Today's usage can't be loaded right now. Please try again in {decision.retry_after}s.",
+            )
+            return None
+
+        return await self.deliver(request, reservation, now)
+
+    async def reserve(self, request, now):
+        guild_policy = guild_settings.get(request.guild_id).policy() if request.guild_id is not None else None
+        return await reserve_quota(
+            now,
+            user_id=request.user_id,
+            channel_id=request.channel_id,
+            guild_id=request.guild_id,
+            guild_policy=guild_policy,
         )
-        await message.channel.send(
-            fallen_angel_status_message(now, current_count, self.DAILY_LIMIT)
+
+    async def deliver(self, request, reservation, now):
+        """
+        Generates, sends and stores the answer to a request that holds a
+        quota reservation. Returns the answer, or None if generation failed.
+        """
+        channel, personality, question = request.channel, request.personality, request.question
+        # Follow-ups are answered with the conversation so far and never shared
+        context = conversation_memory.context(request.user_id, personality)
+        memory_key = contextual_key(request.memory_key, request.user_id) if context else request.memory_key
+
+        # =========================
+        # AI call
+        # =========================
+        # Count without this request, which is released if it fails
+        current_count = reservation.decision.used - 1
+        response_text = None
+        try:
+            if STREAM_RESPONSES:
+                response_text, placeholder = await self.stream_answer(
+                    channel, personality, question, now, current_count, context)
+            else:
+                response_text, placeholder = await self.generate_answer(
+                    channel, personality, question, now, current_count, context)
+        finally:
+            if response_text is None:
+                await release_quota(reservation)  # Do NOT count or save to DB
+
+        if response_text is None:
+            return None
+        responses_served.inc(source="generated")
+
+        # ✅ Only now keep the reservation and allow DB storage
+        current_count = commit_quota(reservation)
+        # Answer and status go out together, split at the message limit
+        await outbox.send_long(
+            channel,
+            f"🕯️ **{personality.capitalize()}** response:\n{response_text}\n\n"
+            + fallen_angel_status_message(now, current_count, self.DAILY_LIMIT),
+            first=placeholder,
         )
 
         # Insert into DB WITHOUT personality column
-        insert_request(
-            user_id=message.author.id,
-            username=str(message.author),
+        await insert_request(
+            user_id=request.user_id,
+            username=request.username,
             question=memory_key,  # keeps personality in question
             ai_response=response_text,
             daily_limit=self.DAILY_LIMIT,
             current_count=current_count,
         )
+        remember_turn(request.user_id, personality, question, response_text)
+        return response_text
+
+    # =========================
+    # Request queue
+    # =========================
+    async def enqueue(self, request, now, retry_after):
+        """
+        Queues a request that can't go yet and persists it.
+        Returns None once queued, otherwise the reason it wasn't.
+        """
+        if request_queue.find(request.user_id, request.memory_key) is not None:
+            return "duplicate"
+        refusal = request_queue.admission(request.user_id, retry_after, quota_service.status(now)["remaining"])
+        if refusal is not None:
+            return refusal
+
+        # Persisted once the status message exists, so a restart can keep editing it
+        await request_queue.push(request, retry_after)
+        await save_queued_request(request.to_row())
+        return None
+
+    async def notify_queue_refusal(self, request, refusal, now):
+        rejections.inc(reason=f"queue_{refusal}", scope="global")
+        if refusal == "budget":
+            content = daily_limit_message(now)
+        else:
+            content = QUEUE_REFUSALS[refusal].format(limit=request_queue.max_per_user)
+        await outbox.notify(request.channel, request.user_id, f"queue:{refusal}", content)
+
+    async def dispatch(self, request):
+        """
+        Called by the queue worker with the next request in fair order.
+        Starts it and returns None if the quota allows (or the request can
+        be settled without it), otherwise returns the refusing decision.
+        """
+        if request.channel is None:
+            request.channel = self.bot.get_channel(request.channel_id)
+            if request.channel is None:
+                print(f"❌ Dropping queued request from {request.username}: channel {request.channel_id} is gone")
+                await delete_queued_request(request.message_id)
+                return None
 
-        await self.bot.process_commands(message)
-
+        now = now_utc8()
+        if not conversation_memory.context(request.user_id, request.personality):
+            # Someone may have asked the same thing while this one waited
+            previous = await find_previous_response(request.memory_key)
+            if previous:
+                await self.settle_queued(request)
+                await outbox.send(
+                    request.channel,
+                    f"📘 **{request.personality.capitalize()}** (stored response):\n{previous}",
+                )
+                responses_served.inc(source="stored")
+                remember_turn(request.user_id, request.personality, request.question, previous)
+                return None
+
+        reservation = await self.reserve(request, now)
+        decision = reservation.decision
+        if decision.reason == "daily_limit":
+            # Won't fit today: tell the user rather than keep them waiting overnight
+            rejections.inc(reason=decision.reason, scope=decision.scope)
+            await self.settle_queued(request)
+            await outbox.notify(request.channel, request.user_id, "daily_limit", daily_limit_message(now))
+            return None
+        if not decision.allowed:
+            return decision
+
+        await self.settle_queued(request)
+        task = asyncio.create_task(self.deliver(request, reservation, now))
+        self._queued_tasks.add(task)
+        task.add_done_callback(self._queued_tasks.discard)
+        return None
+
+    async def settle_queued(self, request):
+        """The request leaves the queue: drop its status message and stored row."""
+        await request_queue.clear_status(request)
+        await delete_queued_request(request.message_id)
+
+    async def restore_queue(self):
+        """Puts requests queued before a restart back in line."""
+        if not REQUEST_QUEUE:
+            return
+        for row in await load_queued_requests():
+            try:
+                request = QueuedRequest.from_row(row)
+            except Exception as e:
+                print("❌ Skipping unreadable queued request:", e)
+                continue
+            request.channel = self.bot.get_channel(request.channel_id)
+            await request_queue.push(request)
+        if len(request_queue):
+            print(f"🕰️ Restored {len(request_queue)} queued requests")
 
 async def setup(bot):
     await bot.add_cog(FallenAngels(bot))
@@ -1,11 +1,22 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from cogs.db.database_editor import generate_request_summary
+from cogs.db.async_database_editor import rebuild_request_rollup, generate_request_summary
+from cogs.db.request_rollup import request_rollup
+from cogs.db.response_cache import response_cache
+from cogs.db.similarity_index import similarity_index
+from KariGPT_scheduler import generation_scheduler
+from KariGPT_routing import model_router
+from KariGPT_ai import persona_registry
 import datetime
 
 KariGPT_TZ = datetime.timezone(datetime.timedelta(hours=-8))
 
+# Embed fields hold at most 1024 characters; token usage is split over a
+# few fields and the least used personas are left out past that
+FIELD_LIMIT = 1024
+MAX_TOKEN_FIELDS = 2
+
 def now_utc8():
     return datetime.datetime.now(KariGPT_TZ)
 
@@ -14,10 +25,18 @@ class KariGPTMetrics(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    async def warm_up(self):
+        # Called by the bot after login
+        await rebuild_request_rollup()
+
     @app_commands.command(name="angels_metrics", description="View fallen angels request metrics")
     async def KariGPT_metrics(self, interaction: discord.Interaction):
         now = now_utc8()
-        summary = generate_request_summary(now=now)
+        if request_rollup.ready:
+            summary = request_rollup.summary(now)
+        else:
+            # Startup rebuild failed: fall back to a one-off full scan
+            summary = await generate_request_summary(now)
 
         if not summary:
             await interaction.response.send_message("❌ Failed to generate metrics.")
@@ -61,6 +80,82 @@ class KariGPTMetrics(commands.Cog):
             )
         embed.add_field(name="👤 Per Player", value=per_player_text, inline=False)
 
+        # Response cache
+        c = response_cache.stats()
+        embed.add_field(
+            name="🧠 Response Cache",
+            value=(
+                f"Entries: **{c['size']}/{c['max_size']}**\n"
+                f"Hits: **{c['hits']}**, Misses: **{c['misses']}** "
+                f"(hit rate **{c['hit_rate'] * 100:.1f}%**)\n"
+                f"Similar-question hits: **{similarity_index.stats()['hits']}**"
+            ),
+            inline=False
+        )
+
+        # Generation scheduler
+        q = generation_scheduler.stats()
+        embed.add_field(
+            name="⚙️ Generation Queue",
+            value=(
+                f"In flight: **{q['running']}/{q['max_concurrency']}**, Waiting: **{q['waiting']}** "
+                f"(peak **{q['max_queue_depth']}**)\n"
+                f"Avg wait: **{q['average_wait']}s**, Max wait: **{q['max_wait']}s**, "
+                f"Rejected: **{q['rejected']}**"
+            ),
+            inline=False
+        )
+
+        # Gemini call layer
+        # One caller (and breaker) per model
+        for model, caller in sorted(model_router.callers.items()):
+            g = caller.stats()
+            embed.add_field(
+                name=f"🛡️ Gemini Calls (`{model}`)",
+                value=(
+                    f"Latency p50/p95/p99: **{g['p50']}s / {g['p95']}s / {g['p99']}s**\n"
+                    f"Retried: **{g['retried']}**, Hedged: **{g['hedged']}** (won **{g['hedge_wins']}**), "
+                    f"Timed out: **{g['deadline_exceeded']}**\n"
+                    f"Breaker: **{g['breaker_state']}** (opened **{g['breaker_opened']}**x, "
+                    f"short-circuited **{g['short_circuited']}**)"
+                ),
+                inline=False
+            )
+
+        # Model routes (since startup)
+        routes_text = ""
+        for (name, model), count in sorted(model_router.served.items()):
+            failed = model_router.failed.get((name, model), 0)
+            routes_text += f"{name} (`{model}`): **{count}** served, **{failed}** failed\n"
+        if routes_text:
+            embed.add_field(name="🧭 Model Routes", value=routes_text, inline=False)
+
+        # Token usage per persona (since startup), most used first
+        used = [(key, p) for key, p in persona_registry.stats().items() if p["requests"]]
+        used.sort(key=lambda item: item[1]["prompt_token_total"] + item[1]["output_token_total"], reverse=True)
+        fields = [""]
+        shown = 0
+        for key, p in used:
+            line = (
+                f"{key}: prompt **{p['prompt_token_total']}** "
+                f"(cached **{p['cached_token_total']}**), "
+                f"output **{p['output_token_total']}**\n"
+            )
+            if len(fields[-1]) + len(line) > FIELD_LIMIT:
+                if len(fields) == MAX_TOKEN_FIELDS:
+                    break
+                fields.append("")
+            fields[-1] += line
+            shown += 1
+        if shown < len(used):
+            more = f"...and {len(used) - shown} more"
+            if len(fields[-1]) + len(more) > FIELD_LIMIT:
+                fields[-1] = fields[-1][:fields[-1].rfind("\n", 0, FIELD_LIMIT - len(more) - 1) + 1]
+            fields[-1] += more
+        if used:
+            for i, value in enumerate(fields):
+                embed.add_field(name="🧾 Tokens" if i == 0 else "\u200b", value=value, inline=False)
+
         await interaction.response.send_message(embed=embed)
 
 
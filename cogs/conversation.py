@@ -0,0 +1,63 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+from KariGPT_ai import PERSONALITIES, summarize_conversation
+from cogs.db.async_database_editor import load_conversations, forget_conversation
+from cogs.db.conversation_memory import conversation_memory
+
+
+class Conversation(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+        # Turns pushed out of a conversation window are summarized by Gemini
+        conversation_memory.summarizer = summarize_conversation
+
+    async def warm_up(self):
+        # Called by the bot after login
+        await load_conversations()
+
+    @app_commands.command(
+        name="angels_forget",
+        description="Make the fallen angels forget your conversation"
+    )
+    @app_commands.describe(name="Only forget the conversation with this fallen angel")
+    async def angels_forget(
+        self,
+        interaction: discord.Interaction,
+        name: str = None
+    ):
+        if not conversation_memory.enabled:
+            await interaction.response.send_message(
+                "ℹ️ Conversation memory is turned off: every question is answered on its own.",
+                ephemeral=True
+            )
+            return
+
+        angel_key = name.lower() if name else None
+        forgotten = forget_conversation(interaction.user.id, angel_key)
+        if not forgotten:
+            await interaction.response.send_message("🫥 There was nothing to forget.", ephemeral=True)
+            return
+
+        target = f"`{angel_key}`" if angel_key else "the fallen angels"
+        plural = "s" if forgotten != 1 else ""
+        await interaction.response.send_message(
+            f"🧹 Forgot {forgotten} conversation{plural} with {target}.",
+            ephemeral=True
+        )
+
+    @angels_forget.autocomplete("name")
+    async def angel_autocomplete(
+        self,
+        interaction: discord.Interaction,
+        current: str
+    ):
+        return [
+            app_commands.Choice(name=key, value=key)
+            for key in PERSONALITIES.search(current)
+        ]
+
+
+async def setup(bot):
+    await bot.add_cog(Conversation(bot))
@@ -1,11 +1,11 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from cogs.db.database_editor import supabase, TABLE_NAME, KariGPT_TZ, now_utc8
+from cogs.db.database_editor import KariGPT_TZ, now_utc8
+from cogs.db.async_database_editor import rebuild_quota_service
+from cogs.db.quota_service import quota_service
 import datetime
 
-DAILY_LIMIT = 20  # Global daily limit
-
 
 class KariGPTDailyLimit(commands.Cog):
     def __init__(self, bot):
@@ -23,21 +23,14 @@ class KariGPTDailyLimit(commands.Cog):
         next_reset = today_start + datetime.timedelta(days=1)
         time_left = next_reset - now
 
-        # Count requests today
+        # Count requests today (same in-memory quota state as the message path)
         try:
-            res = supabase.table(TABLE_NAME).select("id", "timestamp").execute()
-            rows = res.data or []
-
-            used_today = 0
-            for r in rows:
-                ts = datetime.datetime.fromisoformat(r["timestamp"])
-                if ts.tzinfo is None:
-                    ts = ts.replace(tzinfo=datetime.timezone.utc)
-                ts_utc8 = ts.astimezone(KariGPT_TZ)
-                if today_start <= ts_utc8 < next_reset:
-                    used_today += 1
-
-            remaining = max(DAILY_LIMIT - used_today, 0)
+            if not quota_service.ready and not await rebuild_quota_service():
+                raise RuntimeError("today's usage can't be loaded right now")
+
+            status = quota_service.status(now)
+            used_today = status["used"]
+            remaining = status["remaining"]
 
             # Format time left
             hours, remainder = divmod(int(time_left.total_seconds()), 3600)
@@ -0,0 +1,435 @@
+import asyncio
+import datetime
+import math
+import time
+
+from cogs.db.database_editor import now_utc8
+from cogs.db.response_cache import response_cache, RESPONSE_CACHE_PREWARM
+from cogs.db.request_rollup import request_rollup, RequestRollup, row_key, to_utc8
+from cogs.db.similarity_index import similarity_index
+from cogs.db.storage import create_storage, RequestStorage
+from cogs.db.write_behind import WriteBehindQueue
+from cogs.db.quota_service import (
+    quota_service, day_start, seconds_until_reset, QuotaDecision, QuotaReservation,
+    SHARED_QUOTA, QUOTA_REBUILD_BACKOFF, QUOTA_REBUILD_MAX_BACKOFF,
+)
+from cogs.db.guild_settings import guild_settings
+from cogs.db.conversation_memory import conversation_memory, is_contextual, CONVERSATION_SPILL
+
+# The backend (Supabase or local SQLite) is picked by STORAGE_BACKEND.
+# database_editor.py wraps the same backend for old synchronous callers.
+_storage: RequestStorage | None = None
+
+
+# ---------------- Storage ----------------
+def get_storage() -> RequestStorage:
+    global _storage
+    if _storage is None:
+        _storage = create_storage()
+    return _storage
+
+async def initialize_storage():
+    """
+    Creates (SQLite) or checks (Supabase) the tables at startup, so a
+    missing table shows up in the log right away. Returns True on success.
+    """
+    storage = get_storage()
+    try:
+        await storage.initialize()
+        print(f"✅ {storage.backend} storage ready")
+        return True
+    except Exception as e:
+        print(f"❌ {storage.backend} storage is not usable, check the tables:", e)
+        return False
+
+def start_writers():
+    """
+    Starts the write-behind queues, which replays rows spilled by the
+    previous run instead of waiting for the first new row to be queued.
+    """
+    request_writer.start()
+    conversation_writer.start()
+
+async def close_storage():
+    """Flushes queued rows, then closes the storage backend."""
+    if _summaries:
+        await asyncio.gather(*_summaries, return_exceptions=True)
+    await request_writer.close()
+    await conversation_writer.close()
+    if _storage is not None:
+        await _storage.close()
+
+
+# ---------------- Insert a new row ----------------
+async def _insert_rows(rows):
+    await get_storage().insert_requests(rows)
+    print(f"📥 Inserted {len(rows)} KariGPT requests")
+
+# Rows are written behind the user-facing path in batches
+request_writer = WriteBehindQueue(_insert_rows)
+
+async def insert_request(user_id, username, question, ai_response, daily_limit, current_count):
+    """
+    Queues a row for the next bulk insert and updates the in-memory caches
+    and counters right away. Returns without waiting for the database.
+    Answers given with conversation context are stored but never cached,
+    since they only make sense in that conversation.
+    """
+    now = now_utc8()
+
+    # Store as UTC ISO (best practice for DBs)
+    timestamp = now.astimezone(datetime.timezone.utc).isoformat()
+
+    data = {
+        "user_id": user_id,
+        "username": username,
+        "question": question,
+        "ai_response": ai_response,
+        "timestamp": timestamp,
+        "daily_limit": daily_limit,
+        "current_count": current_count
+    }
+    if not is_contextual(question):
+        response_cache.set(question, ai_response)
+        similarity_index.add(question, ai_response)
+    request_rollup.record(user_id, username, timestamp)
+    request_writer.enqueue(data)
+
+
+# ---------------- Search previous questions ----------------
+async def find_previous_response(question: str, timeout=None):
+    """
+    Searches the table for an exact match of a question.
+    Returns the ai_response if found, otherwise None.
+    The in-memory response cache is checked first.
+    """
+    cached = response_cache.get(question)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await get_storage().find_response(question, timeout)
+        if response is not None:
+            response_cache.set(question, response)
+        return response
+    except Exception as e:
+        print("❌ Failed to search previous questions:", e)
+        return None
+
+async def prewarm_response_cache(limit=RESPONSE_CACHE_PREWARM, timeout=None):
+    """
+    Loads the most recent stored responses into the response cache
+    and the similarity index.
+    Returns the number of cached entries.
+    """
+    if limit <= 0:
+        return 0
+    try:
+        rows = await get_storage().recent_requests(limit, ("question", "ai_response"), timeout)
+        # Oldest first so the newest rows end up most recently used
+        for row in reversed(rows):
+            if is_contextual(row["question"]):
+                continue
+            response_cache.set(row["question"], row["ai_response"])
+            similarity_index.add(row["question"], row["ai_response"])
+        print(f"🧠 Response cache prewarmed with {len(response_cache)} entries")
+        return len(response_cache)
+    except Exception as e:
+        print("❌ Failed to prewarm response cache:", e)
+        return 0
+
+
+# ---------------- Metrics rollup ----------------
+async def rebuild_request_rollup(timeout=None):
+    """
+    Rebuilds the metrics rollup from the table. Meant to run once at startup;
+    afterwards insert_request keeps the counters current. Rows the scan
+    can't see (still queued or spilled by request_writer, or recorded while
+    it ran) are counted on top, so the swap doesn't drop them.
+    """
+    started = to_utc8(datetime.datetime.now(datetime.timezone.utc))
+    unwritten = {row_key(row): row for row in request_writer.pending()}
+    request_rollup.begin_rebuild()
+    try:
+        fresh = RequestRollup()
+        seen = set()
+        async for row in get_storage().iter_requests(("user_id", "username", "timestamp"), timeout=timeout):
+            fresh.add_row(row)
+            key = row_key(row)
+            if key is not None and (key in unwritten or key[1] >= started):
+                seen.add(key)
+        for row in list(unwritten.values()) + request_rollup.take_recorded():
+            key = row_key(row)
+            if key not in seen:
+                seen.add(key)
+                fresh.add_row(row)
+        request_rollup.swap(fresh)
+        print(f"📊 Metrics rollup rebuilt from {request_rollup.total} requests")
+        return True
+    except Exception as e:
+        request_rollup.take_recorded()
+        print("❌ Failed to rebuild metrics rollup:", e)
+        return False
+
+async def generate_request_summary(now=None, timeout=None):
+    """
+    One-off summary from a full scan, for when the rollup isn't ready.
+    Returns None on failure.
+    """
+    try:
+        rollup = RequestRollup()
+        async for row in get_storage().iter_requests(("user_id", "username", "timestamp"), timeout=timeout):
+            rollup.add_row(row)
+        return rollup.summary(now or now_utc8())
+    except Exception as e:
+        print("❌ Failed to generate request summary:", e)
+        return None
+
+
+# ---------------- Quota state ----------------
+_quota_rebuild: asyncio.Task | None = None
+_quota_backoff = QUOTA_REBUILD_BACKOFF
+_quota_retry_at = 0.0  # monotonic time before which a failed rebuild isn't retried
+
+async def rebuild_quota_service(timeout=None):
+    """
+    Rebuilds the in-memory quota windows from today's rows. Concurrent
+    callers (warm-up and the first messages) share one rebuild, so a later
+    swap can't drop reservations taken after the first one finished.
+    After a failure the scan is retried with backoff, not on every message;
+    until then this returns False right away.
+    """
+    global _quota_rebuild
+    if _quota_rebuild is None:
+        if time.monotonic() < _quota_retry_at:
+            return False
+        _quota_rebuild = asyncio.create_task(_rebuild_quota_service(timeout))
+        _quota_rebuild.add_done_callback(_clear_quota_rebuild)
+    return await asyncio.shield(_quota_rebuild)
+
+def _clear_quota_rebuild(task):
+    global _quota_rebuild
+    if _quota_rebuild is task:
+        _quota_rebuild = None
+
+async def _rebuild_quota_service(timeout=None):
+    global _quota_backoff, _quota_retry_at
+    now = now_utc8()
+    since = day_start(now).astimezone(datetime.timezone.utc).isoformat()
+    try:
+        fresh = quota_service.blank()
+        async for row in get_storage().iter_requests(("user_id", "timestamp"), since=since, timeout=timeout):
+            fresh.add_row(row, now)
+        quota_service.swap(fresh)
+        _quota_backoff = QUOTA_REBUILD_BACKOFF
+        print(f"⏳ Quota state rebuilt: {quota_service.status(now)['used']} requests today")
+        return True
+    except Exception as e:
+        _quota_retry_at = time.monotonic() + _quota_backoff
+        print(f"❌ Failed to rebuild quota state, retrying in {_quota_backoff:.0f}s:", e)
+        _quota_backoff = min(_quota_backoff * 2, QUOTA_REBUILD_MAX_BACKOFF)
+        return False
+
+def quota_retry_after():
+    """Seconds until a failed quota rebuild is tried again (at least 1)."""
+    return max(1, math.ceil(_quota_retry_at - time.monotonic()))
+
+
+async def reserve_quota(now, user_id=None, channel_id=None, guild_id=None, guild_policy=None, timeout=None):
+    """
+    Reserves a slot in every quota scope: in memory first (atomic within
+    this process), then with SHARED_QUOTA in the database (atomic across
+    workers). Returns a QuotaReservation; check reservation.decision.
+    If the database can't be reached the local reservation stands.
+    While today's usage is unknown (the rebuild failed) nothing is
+    reserved: counting from zero would let the daily limit be exceeded.
+    """
+    if not quota_service.ready:
+        return QuotaReservation(QuotaDecision(False, "global", "unavailable", retry_after=quota_retry_after()), now)
+    reservation = quota_service.reserve(now, user_id, channel_id, guild_id, guild_policy)
+    if not reservation.decision.allowed or not SHARED_QUOTA:
+        return reservation
+
+    scopes = [
+        {"key": key, "scope": scope, "daily_limit": policy.daily_limit, "cooldown": policy.cooldown}
+        for key, scope, policy in quota_service.scopes(user_id, channel_id, guild_id, guild_policy)
+    ]
+    try:
+        result = await get_storage().reserve_quota(
+            now.date().isoformat(), _utc_iso(reservation.ts), scopes, timeout
+        )
+    except Exception as e:
+        print("❌ Shared quota unavailable, using the local quota only:", e)
+        return reservation
+
+    if not result["allowed"]:
+        # Another worker got there first
+        quota_service.release(reservation)
+        limit = next((s["daily_limit"] for s in scopes if s["scope"] == result["scope"]), None)
+        reservation.decision = QuotaDecision(
+            False, result["scope"], result["reason"],
+            retry_after=result.get("retry_after") or seconds_until_reset(now),
+            used=result["used"], limit=limit,
+        )
+        reservation.state = "rejected"
+        return reservation
+
+    reservation.keys = [s["key"] for s in scopes]
+    reservation.decision.used = result["used"]
+    return reservation
+
+def commit_quota(reservation):
+    """Keeps a reservation. Returns the global count for today."""
+    return quota_service.commit(reservation)
+
+async def release_quota(reservation, timeout=None):
+    """Hands a reservation back, locally and in the database."""
+    if reservation.state != "pending":
+        return
+    quota_service.release(reservation)
+    if not reservation.keys:
+        return
+    try:
+        await get_storage().release_quota(
+            reservation.ts.date().isoformat(), _utc_iso(reservation.ts), reservation.keys, timeout
+        )
+    except Exception as e:
+        print("❌ Failed to release shared quota:", e)
+
+def _utc_iso(ts):
+    return ts.astimezone(datetime.timezone.utc).isoformat()
+
+
+# ---------------- Guild settings ----------------
+async def load_guild_settings(timeout=None):
+    """
+    Loads every guild's settings into the in-memory store.
+    """
+    try:
+        guild_settings.load(await get_storage().load_guild_settings(timeout))
+        print(f"🏰 Loaded settings for {len(guild_settings)} guilds")
+        return True
+    except Exception as e:
+        print("❌ Failed to load guild settings:", e)
+        return False
+
+async def save_guild_settings(settings, timeout=None):
+    """
+    Persists one guild's settings. Returns True on success.
+    """
+    try:
+        await get_storage().save_guild_settings(settings.to_row(), timeout)
+        return True
+    except Exception as e:
+        print("❌ Failed to save guild settings:", e)
+        return False
+
+
+# ---------------- Conversation memory ----------------
+async def _save_conversations(rows):
+    # Several turns of one conversation may be queued: only the newest counts
+    latest = {(row["user_id"], row["persona"]): row for row in rows}
+    await get_storage().save_conversations(list(latest.values()))
+
+# Conversation rows are upserted behind the user-facing path too
+conversation_writer = WriteBehindQueue(_save_conversations, spill_path=CONVERSATION_SPILL)
+_summaries = set()
+
+async def load_conversations(timeout=None):
+    """
+    Restores the conversations that haven't gone idle yet.
+    """
+    if not conversation_memory.enabled:
+        return False
+    since = datetime.datetime.fromtimestamp(
+        time.time() - conversation_memory.idle_ttl, datetime.timezone.utc
+    ).isoformat()
+    try:
+        conversation_memory.load(await get_storage().load_conversations(since, timeout))
+        print(f"💬 Restored {len(conversation_memory)} conversations")
+        return True
+    except Exception as e:
+        print("❌ Failed to load conversations:", e)
+        return False
+
+def remember_turn(user_id, persona, question, answer):
+    """
+    Adds a turn to the user's conversation with the persona and queues it
+    for saving. Turns pushed out of the window are summarized in the
+    background, off the user-facing path.
+    """
+    if not conversation_memory.enabled:
+        return
+    conversation = conversation_memory.add_turn(user_id, persona, question, answer)
+    conversation_writer.enqueue(conversation.to_row())
+    if conversation.pending and not conversation.summarizing:
+        task = asyncio.create_task(_summarize(conversation))
+        _summaries.add(task)
+        task.add_done_callback(_summaries.discard)
+
+async def _summarize(conversation):
+    # summarize() drops the result of a conversation forgotten meanwhile
+    if await conversation_memory.summarize(conversation) and not conversation.forgotten:
+        conversation_writer.enqueue(conversation.to_row())
+
+def forget_conversation(user_id, persona=None):
+    """
+    Drops the user's conversation(s) from memory and saves them empty.
+    Returns how many were forgotten.
+    """
+    forgotten = conversation_memory.forget(user_id, persona)
+    for conversation in forgotten:
+        conversation_writer.enqueue(conversation.to_row())
+    return len(forgotten)
+
+
+# ---------------- Request queue ----------------
+async def load_queued_requests(timeout=None):
+    """
+    Queued request rows left by the previous run, oldest first.
+    Returns [] on failure.
+    """
+    try:
+        return await get_storage().load_queue(timeout)
+    except Exception as e:
+        print("❌ Failed to load the request queue:", e)
+        return []
+
+async def save_queued_request(row, timeout=None):
+    """
+    Persists a queued request. Returns True on success.
+    """
+    try:
+        await get_storage().save_queued(row, timeout)
+        return True
+    except Exception as e:
+        print("❌ Failed to save queued request:", e)
+        return False
+
+async def delete_queued_request(message_id, timeout=None):
+    try:
+        await get_storage().delete_queued(message_id, timeout)
+    except Exception as e:
+        print("❌ Failed to delete queued request:", e)
+
+
+# ---------------- Get last request ----------------
+async def get_last_request_for_user(user_id: int, timeout=None):
+    """
+    Returns the most recent request for the given user, or None if no request exists.
+    """
+    try:
+        return await get_storage().last_request(user_id, timeout)
+    except Exception as e:
+        print("❌ Failed to get last request for user:", e)
+        return None
+
+async def get_last_request_global(timeout=None):
+    """
+    Returns the most recent request globally (any user), or None if empty.
+    """
+    try:
+        return await get_storage().last_request(timeout=timeout)
+    except Exception as e:
+        print("❌ Failed to get last global request:", e)
+        return None
@@ -0,0 +1,277 @@
+import datetime
+import json
+import os
+import time
+from collections import OrderedDict, deque
+
+# ---------------- CONFIG ----------------
+CONVERSATION_MEMORY = os.environ.get("CONVERSATION_MEMORY", "False").lower() == "true"
+CONVERSATION_TABLE = "KariGPT_conversations"
+MEMORY_TOKEN_BUDGET = int(os.environ.get("MEMORY_TOKEN_BUDGET", 1200))          # summary + turns sent with a question
+MEMORY_SUMMARY_TOKENS = int(os.environ.get("MEMORY_SUMMARY_TOKENS", 300))       # part of the budget kept for the summary
+MEMORY_IDLE_TTL = float(os.environ.get("MEMORY_IDLE_TTL", 6 * 3600))            # seconds before a conversation is forgotten
+MEMORY_MAX_CONVERSATIONS = int(os.environ.get("MEMORY_MAX_CONVERSATIONS", 5000))
+CONVERSATION_SPILL = os.environ.get("CONVERSATION_SPILL", "karigpt_conversations_spill.jsonl")
+
+# Rough token estimate; good enough for budgeting and free compared to count_tokens
+CHARS_PER_TOKEN = 4
+# Marks request keys answered with conversation context. normalize_question
+# strips it, so these keys never match a stored-answer lookup.
+CONTEXT_KEY_SEPARATOR = "~"
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def clip_to_tokens(text, tokens):
+    if estimate_tokens(text) <= tokens:
+        return text
+    return text[:max(0, tokens * CHARS_PER_TOKEN - 1)] + "…"
+
+def contextual_key(memory_key, user_id):
+    return f"{memory_key}{CONTEXT_KEY_SEPARATOR}{user_id}"
+
+def is_contextual(key):
+    return CONTEXT_KEY_SEPARATOR in key
+
+
+# ---------------- Conversation ----------------
+class Conversation:
+    """
+    One user's recent exchange with one persona: a rolling summary of older
+    turns plus the newest (question, answer) turns. Turns pushed out of the
+    window wait in `pending` until they are folded into the summary.
+    """
+
+    def __init__(self, user_id, persona, summary="", turns=(), updated_at=None):
+        self.user_id = int(user_id)
+        self.persona = persona
+        self.summary = summary or ""
+        self.turns = deque()
+        self.turn_tokens = 0
+        self.updated_at = updated_at or time.time()  # wall clock, so it survives restarts
+        self.pending = []
+        self.summarizing = False
+        self.forgotten = False  # set by forget(); a summary still running must not bring it back
+        for question, answer in turns or ():
+            self.append(question, answer)
+
+    @classmethod
+    def from_row(cls, row):
+        turns = row.get("turns") or []
+        if isinstance(turns, str):
+            turns = json.loads(turns)
+        updated_at = row.get("updated_at")
+        if isinstance(updated_at, str):
+            updated_at = datetime.datetime.fromisoformat(updated_at).timestamp()
+        return cls(row["user_id"], row["persona"], row.get("summary"), turns, updated_at)
+
+    def to_row(self):
+        return {
+            "user_id": self.user_id,
+            "persona": self.persona,
+            "summary": self.summary,
+            "turns": [list(turn) for turn in self.turns],
+            "updated_at": datetime.datetime.fromtimestamp(self.updated_at, datetime.timezone.utc).isoformat(),
+        }
+
+    @property
+    def key(self):
+        return (self.user_id, self.persona)
+
+    def append(self, question, answer):
+        self.turns.append((question, answer))
+        self.turn_tokens += estimate_tokens(question) + estimate_tokens(answer)
+
+    def pop_oldest(self):
+        question, answer = self.turns.popleft()
+        self.turn_tokens -= estimate_tokens(question) + estimate_tokens(answer)
+        return question, answer
+
+    def tokens(self):
+        return estimate_tokens(self.summary) + self.turn_tokens
+
+    def render(self):
+        """The context block sent ahead of the next question."""
+        if not self.summary and not self.turns:
+            return ""
+        lines = ["Conversation so far with this user (oldest first):"]
+        if self.summary:
+            lines.append(f"Summary of earlier messages: {self.summary}")
+        for question, answer in self.turns:
+            lines.append(f"User: {question}")
+            lines.append(f"You: {answer}")
+        return "\n".join(lines)
+
+
+# ---------------- Memory ----------------
+class ConversationMemory:
+    """
+    Per-user, per-persona conversation windows under a strict token budget.
+    The newest turns are kept within `token_budget - summary_tokens`; older
+    turns are dropped first and, when a summarizer is set, folded into a
+    summary capped at `summary_tokens`, so the context sent with a question
+    never exceeds `token_budget` however long the conversation runs.
+    Conversations idle for `idle_ttl` seconds are forgotten, and at most
+    `max_conversations` are kept (least recently used evicted).
+    """
+
+    def __init__(
+        self,
+        enabled=CONVERSATION_MEMORY,
+        token_budget=MEMORY_TOKEN_BUDGET,
+        summary_tokens=MEMORY_SUMMARY_TOKENS,
+        idle_ttl=MEMORY_IDLE_TTL,
+        max_conversations=MEMORY_MAX_CONVERSATIONS,
+    ):
+        self.enabled = enabled
+        self.token_budget = token_budget
+        self.summary_tokens = min(summary_tokens, token_budget // 2)
+        self.idle_ttl = idle_ttl
+        self.max_conversations = max_conversations
+        self.summarizer = None  # async (summary, turns, max_tokens) -> new summary text
+        self._conversations = OrderedDict()  # (user_id, persona) -> Conversation
+
+        self.summaries = 0
+        self.summary_failures = 0
+        self.dropped_turns = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def turn_budget(self):
+        return self.token_budget - self.summary_tokens
+
+    def __len__(self):
+        return len(self._conversations)
+
+    def get(self, user_id, persona):
+        """The live conversation, or None if there is none or it went idle."""
+        conversation = self._conversations.get((user_id, persona))
+        if conversation is None:
+            return None
+        if time.time() - conversation.updated_at > self.idle_ttl:
+            del self._conversations[conversation.key]
+            self.expired += 1
+            return None
+        self._conversations.move_to_end(conversation.key)
+        return conversation
+
+    def context(self, user_id, persona):
+        """Context block for the next question, or "" when there is nothing to remember."""
+        if not self.enabled:
+            return ""
+        conversation = self.get(user_id, persona)
+        return conversation.render() if conversation is not None else ""
+
+    def add_turn(self, user_id, persona, question, answer):
+        """
+        Appends a turn and trims the window to the budget. Returns the
+        conversation; its `pending` turns still need summarize().
+        """
+        conversation = self.get(user_id, persona)
+        if conversation is None:
+            conversation = Conversation(user_id, persona)
+            self._put(conversation)
+
+        # A single turn never takes more than the whole window
+        question = clip_to_tokens(question, self.turn_budget // 4)
+        answer = clip_to_tokens(answer, self.turn_budget - estimate_tokens(question))
+        conversation.append(question, answer)
+        conversation.updated_at = time.time()
+
+        conversation.pending.extend(self._trim(conversation))
+        return conversation
+
+    def _trim(self, conversation):
+        """Pops the oldest turns until the window fits the budget; returns them."""
+        dropped = []
+        while conversation.turn_tokens > self.turn_budget and len(conversation.turns) > 1:
+            dropped.append(conversation.pop_oldest())
+        return dropped
+
+    async def summarize(self, conversation):
+        """
+        Folds the pending turns into the summary. Without a summarizer, or
+        if it fails, the pending turns are simply dropped.
+        """
+        if not conversation.pending or conversation.summarizing:
+            return False
+        turns, conversation.pending = conversation.pending, []
+        if self.summarizer is None:
+            self.dropped_turns += len(turns)
+            return False
+
+        conversation.summarizing = True
+        try:
+            summary = await self.summarizer(conversation.summary, turns, self.summary_tokens)
+            if conversation.forgotten:
+                return False
+            if not summary:
+                raise ValueError("empty summary")
+            conversation.summary = clip_to_tokens(summary.strip(), self.summary_tokens)
+            self.summaries += 1
+            return True
+        except Exception as e:
+            print(f"❌ Failed to summarize conversation ({conversation.persona}):", e)
+            self.summary_failures += 1
+            self.dropped_turns += len(turns)
+            return False
+        finally:
+            conversation.summarizing = False
+
+    def forget(self, user_id, persona=None):
+        """
+        Drops one conversation, or all of the user's, and empties them.
+        Returns the dropped conversations.
+        """
+        keys = [
+            key for key in self._conversations
+            if key[0] == user_id and (persona is None or key[1] == persona)
+        ]
+        forgotten = [self._conversations.pop(key) for key in keys]
+        for conversation in forgotten:
+            conversation.forgotten = True
+            conversation.summary = ""
+            conversation.turns.clear()
+            conversation.turn_tokens = 0
+            conversation.pending = []
+        return forgotten
+
+    def _put(self, conversation):
+        self._conversations[conversation.key] = conversation
+        self._conversations.move_to_end(conversation.key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self.evicted += 1
+
+    def load(self, rows):
+        """Restores persisted conversations, oldest first so the newest stay."""
+        loaded = []
+        for row in rows:
+            try:
+                loaded.append(Conversation.from_row(row))
+            except Exception as e:
+                print("❌ Skipping unreadable conversation row:", e)
+        now = time.time()
+        for conversation in sorted(loaded, key=lambda c: c.updated_at):
+            if now - conversation.updated_at <= self.idle_ttl:
+                # Rows written under a larger budget are cut down to this one
+                conversation.summary = clip_to_tokens(conversation.summary, self.summary_tokens)
+                self.dropped_turns += len(self._trim(conversation))
+                self._put(conversation)
+        return len(self._conversations)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "conversations": len(self._conversations),
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "dropped_turns": self.dropped_turns,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+conversation_memory = ConversationMemory()
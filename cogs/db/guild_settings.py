@@ -0,0 +1,172 @@
+import os
+
+import configs
+from cogs.db.quota_service import QuotaPolicy
+
+# ---------------- CONFIG ----------------
+GUILD_SETTINGS_TABLE = "KariGPT_guild_settings"
+# Channels watched in every guild, on top of the per-guild settings; a guild
+# can still unwatch them (and channels of the allowed categories) for itself
+DEFAULT_WATCH_CHANNELS = [
+    int(c) for c in os.environ.get(
+        "WATCH_CHANNEL_IDS", "1445080995480076441,1465442662470389914,1464061703015895233"
+    ).split(",") if c.strip()
+] + list(configs.chanel_allowed)
+
+
+# ---------------- Settings ----------------
+class GuildSettings:
+    """
+    What one guild configured through /karigpt_config. None limits fall back
+    to the global quota. Personas are blocked by name, so personas added
+    later are allowed; `allowed_personas` is the older allow-list form,
+    only kept until GuildSettingsStore.convert_allow_lists() replaces it.
+    """
+
+    def __init__(
+        self,
+        guild_id,
+        watch_channels=(),
+        daily_limit=None,
+        cooldown=None,
+        allowed_personas=(),
+        blocked_personas=(),
+        unwatched_channels=(),
+    ):
+        self.guild_id = int(guild_id)
+        self.watch_channels = {int(c) for c in watch_channels or ()}
+        self.unwatched_channels = {int(c) for c in unwatched_channels or ()}  # default channels turned off here
+        self.daily_limit = daily_limit
+        self.cooldown = cooldown
+        self.allowed_personas = {p.lower() for p in allowed_personas or ()}
+        self.blocked_personas = {p.lower() for p in blocked_personas or ()}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            row["guild_id"],
+            watch_channels=row.get("watch_channels"),
+            daily_limit=row.get("daily_limit"),
+            cooldown=row.get("cooldown"),
+            allowed_personas=row.get("allowed_personas"),
+            blocked_personas=row.get("blocked_personas"),
+            unwatched_channels=row.get("unwatched_channels"),
+        )
+
+    def to_row(self):
+        # Lists so the row stores as JSON in both backends
+        return {
+            "guild_id": self.guild_id,
+            "watch_channels": sorted(self.watch_channels),
+            "daily_limit": self.daily_limit,
+            "cooldown": self.cooldown,
+            "allowed_personas": sorted(self.allowed_personas),
+            "blocked_personas": sorted(self.blocked_personas),
+            "unwatched_channels": sorted(self.unwatched_channels),
+        }
+
+    def policy(self):
+        return QuotaPolicy(self.daily_limit, self.cooldown)
+
+    def persona_allowed(self, personality):
+        personality = personality.lower()
+        if personality in self.blocked_personas:
+            return False
+        return not self.allowed_personas or personality in self.allowed_personas
+
+
+# ---------------- Store ----------------
+class GuildSettingsStore:
+    """
+    In-memory copy of every guild's settings, loaded once at startup and
+    updated on every edit, so the message path only does set lookups.
+    """
+
+    def __init__(
+        self,
+        default_channels=DEFAULT_WATCH_CHANNELS,
+        allowed_categories=configs.category_allowed,
+        allowed_users=configs.allowed_user,
+    ):
+        self.default_channels = set(default_channels)
+        self.allowed_categories = set(allowed_categories)
+        self.allowed_users = set(allowed_users)  # empty means everyone
+        self.ready = False
+        self._guilds = {}    # guild id -> GuildSettings
+        self._channels = {}  # watched channel id -> guild id
+        self._unwatched = {}  # unwatched default channel id -> guild id
+
+    def load(self, rows):
+        self._guilds = {}
+        self._channels = {}
+        self._unwatched = {}
+        for row in rows:
+            try:
+                self._put(GuildSettings.from_row(row))
+            except Exception as e:
+                print("❌ Skipping unreadable guild settings row:", e)
+        self.ready = True
+
+    def _put(self, settings):
+        old = self._guilds.get(settings.guild_id)
+        if old is not None:
+            for channel_id in old.watch_channels:
+                self._channels.pop(channel_id, None)
+            for channel_id in old.unwatched_channels:
+                self._unwatched.pop(channel_id, None)
+        self._guilds[settings.guild_id] = settings
+        for channel_id in settings.watch_channels:
+            self._channels[channel_id] = settings.guild_id
+        for channel_id in settings.unwatched_channels:
+            self._unwatched[channel_id] = settings.guild_id
+
+    def get(self, guild_id):
+        """Settings for the guild; a fresh unsaved default if it has none."""
+        settings = self._guilds.get(guild_id)
+        return settings if settings is not None else GuildSettings(guild_id)
+
+    def update(self, guild_id, **changes):
+        """Applies the changes in memory and returns the new settings (not yet saved)."""
+        current = self.get(guild_id).to_row()
+        current.update(changes)
+        settings = GuildSettings.from_row(current)
+        self._put(settings)
+        return settings
+
+    def convert_allow_lists(self, personas):
+        """
+        Turns older allow-lists into block-lists of the other known
+        `personas`, so personas added later aren't blocked.
+        Returns the converted settings, still to be saved.
+        """
+        converted = []
+        for settings in list(self._guilds.values()):
+            if settings.allowed_personas:
+                blocked = settings.blocked_personas | (set(personas) - settings.allowed_personas)
+                converted.append(self.update(settings.guild_id, allowed_personas=(), blocked_personas=blocked))
+        return converted
+
+    def watched_by_default(self, channel):
+        return channel.id in self.default_channels or getattr(channel, "category_id", None) in self.allowed_categories
+
+    def is_watched(self, channel):
+        if channel.id in self._channels:
+            return True
+        return channel.id not in self._unwatched and self.watched_by_default(channel)
+
+    def user_allowed(self, user_id):
+        return not self.allowed_users or user_id in self.allowed_users
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def stats(self):
+        return {
+            "guilds": len(self._guilds),
+            "watched_channels": len(self._channels),
+            "unwatched_channels": len(self._unwatched),
+            "default_channels": len(self.default_channels),
+        }
+
+
+guild_settings = GuildSettingsStore()
@@ -0,0 +1,42 @@
+"""
+Moves answers stored inline in the request table into the content-addressed
+response store, in batches. Safe to stop and run again; rows already moved
+are skipped. For Supabase, run supabase_responses.sql first.
+
+    RESPONSE_STORE=true python -m cogs.db.migrate_responses
+    RESPONSE_STORE=true STORAGE_BACKEND=sqlite python -m cogs.db.migrate_responses --batch-size 500
+"""
+import argparse
+import asyncio
+import sys
+
+from cogs.db.storage import create_storage, SCAN_PAGE_SIZE
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=SCAN_PAGE_SIZE, help="rows moved per round trip")
+    args = parser.parse_args(argv)
+
+    storage = create_storage()
+    if storage.responses is None:
+        print("❌ RESPONSE_STORE is off; set RESPONSE_STORE=true to migrate")
+        return 2
+    try:
+        migrated = await storage.migrate_responses(args.batch_size)
+    except Exception as e:
+        print("❌ Failed to migrate responses:", e)
+        return 1
+    finally:
+        await storage.close()
+
+    codec = storage.responses.stats()
+    print(
+        f"✅ Migrated {migrated} rows: {codec['encoded']} distinct answers, "
+        f"{codec['raw_bytes']} bytes stored as {codec['stored_bytes']} ({storage.deduplicated} duplicates skipped)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,273 @@
+import os
+import datetime
+
+from cogs.db.database_editor import KariGPT_TZ
+from cogs.db.request_rollup import to_utc8
+
+# ---------------- CONFIG ----------------
+def _env_int(name, default=None):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+DAILY_LIMIT = _env_int("DAILY_LIMIT", 20)                 # Global daily limit
+COOLDOWN_SECONDS = _env_int("COOLDOWN_SECONDS", 120)      # Global cooldown between requests
+USER_DAILY_LIMIT = _env_int("USER_DAILY_LIMIT")           # Optional per-user policy
+USER_COOLDOWN_SECONDS = _env_int("USER_COOLDOWN_SECONDS")
+CHANNEL_DAILY_LIMIT = _env_int("CHANNEL_DAILY_LIMIT")     # Optional per-channel policy
+CHANNEL_COOLDOWN_SECONDS = _env_int("CHANNEL_COOLDOWN_SECONDS")
+# Also reserve every request in the database, for several bot workers
+SHARED_QUOTA = os.environ.get("SHARED_QUOTA", "False").lower() == "true"
+# Seconds before a failed rebuild of the quota state is retried, doubled up to the max
+QUOTA_REBUILD_BACKOFF = float(os.environ.get("QUOTA_REBUILD_BACKOFF", 5))
+QUOTA_REBUILD_MAX_BACKOFF = 300
+
+
+def day_start(now):
+    return datetime.datetime.combine(now.date(), datetime.time(0, 0), tzinfo=KariGPT_TZ)
+
+def seconds_until_reset(now):
+    return int((day_start(now) + datetime.timedelta(days=1) - now).total_seconds())
+
+
+# ---------------- Policies ----------------
+class QuotaPolicy:
+    """A daily limit and a cooldown; either can be None to disable it."""
+
+    def __init__(self, daily_limit=None, cooldown=None):
+        self.daily_limit = daily_limit
+        self.cooldown = cooldown
+
+    @property
+    def enabled(self):
+        return self.daily_limit is not None or self.cooldown is not None
+
+
+class QuotaDecision:
+    def __init__(self, allowed, scope="global", reason=None, retry_after=0, used=0, limit=None):
+        self.allowed = allowed
+        self.scope = scope              # "global", "user" or "channel"
+        self.reason = reason            # None, "cooldown", "daily_limit" or "unavailable"
+        self.retry_after = retry_after  # seconds until the request would be allowed
+        self.used = used
+        self.limit = limit
+
+    def __bool__(self):
+        return self.allowed
+
+
+class QuotaReservation:
+    """
+    A slot taken by QuotaService.reserve(). It already counts against every
+    scope; commit() keeps it, release() hands it back (e.g. when generation
+    failed). Only the first commit/release has an effect.
+    """
+
+    def __init__(self, decision, ts, windows=(), keys=()):
+        self.decision = decision
+        self.ts = ts
+        self.windows = list(windows)  # (window, last before the reservation)
+        self.keys = list(keys)        # shared quota keys reserved in the database
+        self.state = "pending" if decision.allowed else "rejected"
+
+
+class _Window:
+    """Requests counted for one calendar day (UTC-8) plus the last request time."""
+
+    __slots__ = ("day", "count", "last")
+
+    def __init__(self):
+        self.day = None
+        self.count = 0
+        self.last = None
+
+    def roll(self, now):
+        # Counters and cooldown both reset at midnight
+        if self.day != now.date():
+            self.day = now.date()
+            self.count = 0
+            self.last = None
+
+    def add(self, ts):
+        self.roll(ts)
+        self.count += 1
+        if self.last is None or ts > self.last:
+            self.last = ts
+
+    def merge(self, other):
+        """Adds the requests of another window, unless they are from an older day."""
+        if other.day is None or (self.day is not None and other.day < self.day):
+            return
+        if self.day != other.day:
+            self.day, self.count, self.last = other.day, 0, None
+        self.count += other.count
+        if other.last is not None and (self.last is None or other.last > self.last):
+            self.last = other.last
+
+
+# ---------------- Quota service ----------------
+class QuotaService:
+    """
+    In-memory daily limit and cooldown state shared by the message path and
+    /daily_status. Every check is a few dict lookups, no network I/O.
+    The global and per-user windows are rebuilt from today's rows at startup;
+    per-channel and per-guild windows only cover requests seen since then
+    because rows don't store a channel. A guild's policy comes from its
+    settings and is passed in with each call.
+    """
+
+    def __init__(self, global_policy, user_policy=None, channel_policy=None):
+        self.global_policy = global_policy
+        self.user_policy = user_policy or QuotaPolicy()
+        self.channel_policy = channel_policy or QuotaPolicy()
+        self.ready = False
+        self._global = _Window()
+        self._users = {}
+        self._channels = {}
+        self._guilds = {}
+
+    def _scopes(self, user_id, channel_id, guild_id=None, guild_policy=None, create=False):
+        scopes = [("global", self.global_policy, self._global)]
+        for scope, policy, windows, key in (
+            ("guild", guild_policy, self._guilds, guild_id),
+            ("user", self.user_policy, self._users, user_id),
+            ("channel", self.channel_policy, self._channels, channel_id),
+        ):
+            if key is None or policy is None or not policy.enabled:
+                continue
+            window = windows.get(key)
+            if window is None:
+                window = _Window()
+                if create:
+                    windows[key] = window
+            scopes.append((scope, policy, window))
+        return scopes
+
+    def check(self, now, user_id=None, channel_id=None, guild_id=None, guild_policy=None):
+        """
+        Returns the first failing QuotaDecision, or an allowed one carrying
+        the global usage.
+        """
+        for scope, policy, window in self._scopes(user_id, channel_id, guild_id, guild_policy):
+            window.roll(now)
+
+            if policy.cooldown and window.last:
+                delta = (now - window.last).total_seconds()
+                if delta < policy.cooldown:
+                    return QuotaDecision(
+                        False, scope, "cooldown",
+                        retry_after=int(policy.cooldown - delta),
+                        used=window.count, limit=policy.daily_limit,
+                    )
+
+            if policy.daily_limit is not None and window.count >= policy.daily_limit:
+                return QuotaDecision(
+                    False, scope, "daily_limit",
+                    retry_after=seconds_until_reset(now),
+                    used=window.count, limit=policy.daily_limit,
+                )
+
+        return QuotaDecision(True, used=self._global.count, limit=self.global_policy.daily_limit)
+
+    def reserve(self, now, user_id=None, channel_id=None, guild_id=None, guild_policy=None):
+        """
+        Checks and counts a request in one step, so concurrent callers can't
+        both pass the same check. Returns a QuotaReservation whose decision
+        says whether the request may go ahead.
+        """
+        decision = self.check(now, user_id, channel_id, guild_id, guild_policy)
+        if not decision.allowed:
+            return QuotaReservation(decision, now)
+
+        windows = []
+        for _, _, window in self._scopes(user_id, channel_id, guild_id, guild_policy, create=True):
+            window.roll(now)
+            windows.append((window, window.last))
+            window.add(now)
+        decision.used = self._global.count
+        return QuotaReservation(decision, now, windows)
+
+    def commit(self, reservation):
+        """Keeps the reservation. Returns the global count for today."""
+        if reservation.state == "pending":
+            reservation.state = "committed"
+        return reservation.decision.used
+
+    def release(self, reservation):
+        """Gives the slot back and restores the cooldown it started."""
+        if reservation.state != "pending":
+            return
+        reservation.state = "released"
+        for window, previous_last in reservation.windows:
+            if window.day != reservation.ts.date():
+                continue  # the day already rolled over
+            window.count = max(window.count - 1, 0)
+            if window.last == reservation.ts:
+                window.last = previous_last
+
+    def scopes(self, user_id=None, channel_id=None, guild_id=None, guild_policy=None):
+        """(key, scope, policy) of every enabled scope, for the shared database quota."""
+        keys = {"global": "global", "guild": f"guild:{guild_id}", "user": f"user:{user_id}", "channel": f"channel:{channel_id}"}
+        return [
+            (keys[scope], scope, policy)
+            for scope, policy, _ in self._scopes(user_id, channel_id, guild_id, guild_policy)
+        ]
+
+    def record(self, ts, user_id=None, channel_id=None, guild_id=None, guild_policy=None):
+        """Counts one served request. Returns the global count for today."""
+        for _, _, window in self._scopes(user_id, channel_id, guild_id, guild_policy, create=True):
+            window.add(ts)
+        return self._global.count
+
+    def status(self, now):
+        self._global.roll(now)
+        used = self._global.count
+        limit = self.global_policy.daily_limit
+        return {
+            "used": used,
+            "limit": limit,
+            "remaining": max(limit - used, 0) if limit is not None else None,
+        }
+
+    def blank(self):
+        """An empty service with the same policies, to rebuild into."""
+        return QuotaService(self.global_policy, self.user_policy, self.channel_policy)
+
+    def add_row(self, row, now):
+        """Counts one stored row (user_id, timestamp) if it is from today."""
+        try:
+            ts = to_utc8(row["timestamp"])
+        except Exception as e:
+            print("❌ Skipping unreadable request row in quota rebuild:", e)
+            return
+        if ts.date() == now.date():
+            self.record(ts, user_id=row.get("user_id"))
+
+    def swap(self, other):
+        """
+        Merges in the windows of a service that was rebuilt off to the side.
+        The windows here keep what they counted meanwhile and stay the same
+        objects, so reservations taken during the rebuild can still be
+        released; channel and guild windows, which rows can't rebuild, are
+        kept as well.
+        """
+        self._global.merge(other._global)
+        for mine, theirs in ((self._users, other._users), (self._channels, other._channels), (self._guilds, other._guilds)):
+            for key, window in theirs.items():
+                mine.setdefault(key, _Window()).merge(window)
+        self.ready = True
+
+    def rebuild(self, rows, now):
+        """Replaces all state with today's rows (user_id, timestamp)."""
+        fresh = self.blank()
+        fresh._global.roll(now)
+        for row in rows:
+            fresh.add_row(row, now)
+        self._global, self._users, self._channels, self._guilds = _Window(), {}, {}, {}
+        self.swap(fresh)
+
+
+quota_service = QuotaService(
+    QuotaPolicy(DAILY_LIMIT, COOLDOWN_SECONDS),
+    user_policy=QuotaPolicy(USER_DAILY_LIMIT, USER_COOLDOWN_SECONDS),
+    channel_policy=QuotaPolicy(CHANNEL_DAILY_LIMIT, CHANNEL_COOLDOWN_SECONDS),
+)
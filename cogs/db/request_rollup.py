@@ -0,0 +1,134 @@
+import datetime
+from collections import Counter
+
+from cogs.db.database_editor import KariGPT_TZ
+
+
+def to_utc8(ts):
+    """Accepts an ISO string or datetime and returns it in the KariGPT timezone."""
+    dt = ts if isinstance(ts, datetime.datetime) else datetime.datetime.fromisoformat(ts)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(KariGPT_TZ)
+
+def row_key(row):
+    """(user_id, time) of a request row, the same before and after it is stored; None if unreadable."""
+    try:
+        return row.get("user_id"), to_utc8(row["timestamp"])
+    except Exception:
+        return None
+
+
+# ---------------- Rollup engine ----------------
+class RequestRollup:
+    """
+    Per-day and per-user request counters for /angels_metrics.
+    Rebuilt once from the table at startup, then kept current by record()
+    so a summary costs O(users + days) instead of a full table scan.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._recorded = None  # rows recorded while a rebuild runs
+        self._reset()
+
+    def _reset(self):
+        self.total = 0
+        self.by_day = Counter()        # date -> count
+        self.max_per_day = 0
+        self.users = {}                # user_id -> {"username", "total", "by_day", "max_per_day"}
+
+    def record(self, user_id, username, timestamp):
+        day = to_utc8(timestamp).date()
+        if self._recorded is not None:
+            self._recorded.append({"user_id": user_id, "username": username, "timestamp": timestamp})
+
+        self.total += 1
+        self.by_day[day] += 1
+        self.max_per_day = max(self.max_per_day, self.by_day[day])
+
+        user = self.users.get(user_id)
+        if user is None:
+            user = {"username": username, "total": 0, "by_day": Counter(), "max_per_day": 0}
+            self.users[user_id] = user
+        user["username"] = username or user["username"]
+        user["total"] += 1
+        user["by_day"][day] += 1
+        user["max_per_day"] = max(user["max_per_day"], user["by_day"][day])
+
+    def add_row(self, row):
+        """Counts one stored row (user_id, username, timestamp)."""
+        try:
+            self.record(row["user_id"], row["username"], row["timestamp"])
+        except Exception as e:
+            print("❌ Skipping unreadable request row in rollup:", e)
+
+    def begin_rebuild(self):
+        """Starts noting recorded rows, which the rebuild's scan may not see."""
+        self._recorded = []
+
+    def take_recorded(self):
+        """Rows recorded since begin_rebuild(); stops noting them."""
+        rows, self._recorded = self._recorded or [], None
+        return rows
+
+    def swap(self, other):
+        """Takes over the counters of a rollup that was built off to the side."""
+        self.total = other.total
+        self.by_day = other.by_day
+        self.max_per_day = other.max_per_day
+        self.users = other.users
+        self.ready = True
+
+    def rebuild(self, rows):
+        """Replaces all counters with the given rows (user_id, username, timestamp)."""
+        fresh = RequestRollup()
+        for row in rows:
+            fresh.add_row(row)
+        self.swap(fresh)
+
+    def summary(self, now):
+        """
+        Global, per-player and today stats in the shape /angels_metrics expects.
+        """
+        if not self.total:
+            return {"message": "No requests found in the database."}
+
+        total_days = len(self.by_day)
+        global_stats = {
+            "total_requests": self.total,
+            "average_requests_per_day": round(self.total / total_days, 2) if total_days else 0,
+            "max_requests_per_day": self.max_per_day
+        }
+
+        today_key = now.date()
+        per_player_stats = {}
+        requests_per_user_today = {}
+        for uid, user in self.users.items():
+            days = len(user["by_day"])
+            per_player_stats[uid] = {
+                "username": user["username"],
+                "total_requests": user["total"],
+                "average_per_day": round(user["total"] / days, 2) if days else 0,
+                "max_requests_per_day": user["max_per_day"]
+            }
+            today_count = user["by_day"].get(today_key, 0)
+            if today_count:
+                requests_per_user_today[uid] = {
+                    "username": user["username"],
+                    "count": today_count
+                }
+
+        today_stats = {
+            "total_requests_today": self.by_day.get(today_key, 0),
+            "requests_per_user_today": requests_per_user_today
+        }
+
+        return {
+            "global_stats": global_stats,
+            "per_player_stats": per_player_stats,
+            "today_stats": today_stats
+        }
+
+
+request_rollup = RequestRollup()
@@ -0,0 +1,90 @@
+import hashlib
+import os
+import zlib
+
+# ---------------- CONFIG ----------------
+RESPONSE_STORE = os.environ.get("RESPONSE_STORE", "False").lower() == "true"  # store answers once, compressed
+RESPONSE_TABLE = "KariGPT_responses"
+RESPONSE_COMPRESSION = os.environ.get("RESPONSE_COMPRESSION", "zlib").lower()  # "zlib" or "zstd"
+RESPONSE_COMPRESSION_LEVEL = os.environ.get("RESPONSE_COMPRESSION_LEVEL")       # codec default when unset
+DEFAULT_LEVELS = {"zlib": 6, "zstd": 3}
+
+
+def response_hash(text):
+    """Content address of an answer: hex SHA-256 of its UTF-8 text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# ---------------- Codec ----------------
+class ResponseCodec:
+    """
+    Turns answers into response store rows and back. Every row records the
+    codec it was written with, so rows written under another setting, or
+    kept "raw" because compressing them didn't make them smaller, still
+    decode. zstd needs the optional zstandard package; without it answers
+    are compressed with zlib.
+    """
+
+    def __init__(self, compression=RESPONSE_COMPRESSION, level=RESPONSE_COMPRESSION_LEVEL):
+        if compression == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                print("❌ zstandard is not installed; compressing responses with zlib")
+                compression = "zlib"
+        if compression not in DEFAULT_LEVELS:
+            raise ValueError(f"Unknown RESPONSE_COMPRESSION '{compression}' (expected 'zlib' or 'zstd')")
+        self.compression = compression
+        self.level = int(level) if level is not None else DEFAULT_LEVELS[compression]
+
+        self.encoded = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def _compress(self, data):
+        if self.compression == "zstd":
+            import zstandard
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    def encode(self, text, stored_size=len):
+        """
+        Response row for `text`: hash, codec, body (bytes) and uncompressed
+        size. `stored_size(body)` is what a compressed body takes in the
+        backend (base64 text on Supabase); the answer is kept raw unless
+        that is smaller than the text itself.
+        """
+        data = text.encode("utf-8")
+        codec, body = self.compression, self._compress(data)
+        size = stored_size(body)
+        if size >= len(data):
+            codec, body, size = "raw", data, len(data)
+        self.encoded += 1
+        self.raw_bytes += len(data)
+        self.stored_bytes += size
+        return {"hash": response_hash(text), "codec": codec, "body": body, "size": len(data)}
+
+    @staticmethod
+    def decode(row):
+        codec, body = row["codec"], row["body"]
+        if codec == "zlib":
+            data = zlib.decompress(body)
+        elif codec == "zstd":
+            import zstandard
+            data = zstandard.ZstdDecompressor().decompress(body)
+        elif codec == "raw":
+            data = body
+        else:
+            raise ValueError(f"Unknown response codec '{codec}'")
+        return bytes(data).decode("utf-8")
+
+    def stats(self):
+        return {
+            "encoded": self.encoded,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+            "ratio": round(self.stored_bytes / self.raw_bytes, 3) if self.raw_bytes else 0.0,
+        }
+
+
+response_codec = ResponseCodec()
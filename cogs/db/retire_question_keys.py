@@ -0,0 +1,48 @@
+"""
+Takes rows stored under the old letters-only question keys out of the
+stored-answer lookup. Those keys dropped digits and symbols, so "what is
+2+2?" and "what is 3+3?" share one; the original question isn't stored, so
+they can't be rebuilt and are retired instead. The rows stay in the table
+and still count in the metrics. Pass the time the bot switched to strict
+keys (STRICT_QUESTION_MATCHING, on by default); rows stored after it are
+left alone. Safe to stop and run again.
+
+    python -m cogs.db.retire_question_keys --before 2026-10-18T00:00:00+00:00
+    STORAGE_BACKEND=sqlite python -m cogs.db.retire_question_keys --before 2026-10-18T00:00:00+00:00 --batch-size 500
+"""
+import argparse
+import asyncio
+import datetime
+import sys
+
+from cogs.db.storage import create_storage, SCAN_PAGE_SIZE
+
+
+def _utc_iso(value):
+    ts = datetime.datetime.fromisoformat(value)
+    if ts.tzinfo is None:
+        raise argparse.ArgumentTypeError("include a UTC offset, e.g. 2026-10-18T00:00:00+00:00")
+    return ts.astimezone(datetime.timezone.utc).isoformat()
+
+
+async def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--before", type=_utc_iso, required=True, help="when strict keys were turned on (ISO, with offset)")
+    parser.add_argument("--batch-size", type=int, default=SCAN_PAGE_SIZE, help="rows retired per round trip")
+    args = parser.parse_args(argv)
+
+    storage = create_storage()
+    try:
+        retired = await storage.retire_question_keys(args.before, args.batch_size)
+    except Exception as e:
+        print("❌ Failed to retire question keys:", e)
+        return 1
+    finally:
+        await storage.close()
+
+    print(f"✅ Retired {retired} rows stored before {args.before}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
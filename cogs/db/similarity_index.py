@@ -0,0 +1,171 @@
+import os
+import re
+from collections import Counter, OrderedDict
+
+# ---------------- CONFIG ----------------
+SIMILARITY_THRESHOLD = float(os.environ.get("SIMILARITY_THRESHOLD", 0.75))  # Jaccard over trigrams
+SIMILARITY_INDEX_SIZE = int(os.environ.get("SIMILARITY_INDEX_SIZE", 5000))
+# Strict mode keeps digits and symbols in memory keys (the stored-answer and
+# single-flight key) and only matches questions whose numbers/symbols are
+# identical ("2+2" never answers "3+3"). Turning it off gives the older,
+# fuzzier letters-only keys. Rows stored under letters-only keys can be taken
+# out of the lookup with: python -m cogs.db.retire_question_keys --before ...
+STRICT_QUESTION_MATCHING = os.environ.get("STRICT_QUESTION_MATCHING", "True").lower() == "true"
+
+SIGNIFICANT_CHARS = r"0-9+\-*/=<>%^&|$#@"
+SHINGLE_SIZE = 3
+MIN_SHINGLES = 4  # very short questions only ever match exactly
+
+_significant_re = re.compile(f"[{SIGNIFICANT_CHARS}]+")
+
+
+def shingles(text):
+    return frozenset(text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+
+def significant_tokens(text):
+    return _significant_re.findall(text)
+
+
+class _Partition:
+    """Inverted shingle index over the stored questions of one persona."""
+
+    def __init__(self):
+        self.grams = {}     # key -> frozenset of shingles
+        self.postings = {}  # shingle -> set of keys
+
+    def add(self, key, text):
+        if key in self.grams:
+            return
+        grams = shingles(text)
+        self.grams[key] = grams
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(key)
+
+    def remove(self, key):
+        for gram in self.grams.pop(key, ()):
+            keys = self.postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.postings[gram]
+
+    def best(self, text, strict):
+        query = shingles(text)
+        if len(query) < MIN_SHINGLES:
+            return None, 0.0
+
+        shared = Counter()
+        for gram in query:
+            for key in self.postings.get(gram, ()):
+                shared[key] += 1
+
+        wanted = significant_tokens(text) if strict else None
+        best_key, best_score = None, 0.0
+        for key, common in shared.items():
+            score = common / (len(query) + len(self.grams[key]) - common)
+            if score <= best_score:
+                continue
+            if strict and significant_tokens(key) != wanted:
+                continue
+            best_key, best_score = key, score
+        return best_key, best_score
+
+
+# ---------------- Similarity index ----------------
+class SimilarityIndex:
+    """
+    Local near-duplicate lookup over stored questions, partitioned by persona.
+    Keys are memory keys (persona prefix + normalized question, with no
+    separator), so a key belongs to the longest known persona it starts
+    with: "tag..." never lands in the partition of a persona named "t".
+    Only personas in `personas` get a partition; lookups for anything else
+    a user typed miss without building one.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_size=SIMILARITY_INDEX_SIZE, strict=STRICT_QUESTION_MATCHING):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.strict = strict
+        self.personas = ()               # known persona names; the cog sets PERSONALITIES
+        self._responses = OrderedDict()  # key -> ai_response, oldest first
+        self._partitions = {}            # personality -> _Partition
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._responses)
+
+    def clear(self):
+        self._responses.clear()
+        self._partitions.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _owner(self, key, personas):
+        """The longest of `personas` that key starts with, or None."""
+        owner = None
+        for personality in personas:
+            if key.startswith(personality) and (owner is None or len(personality) > len(owner)):
+                owner = personality
+        return owner
+
+    def _partition(self, personality):
+        partition = self._partitions.get(personality)
+        if partition is None:
+            # Built lazily the first time a persona is looked up
+            partition = _Partition()
+            personas = list(self.personas)
+            for key in self._responses:
+                if self._owner(key, personas) == personality:
+                    partition.add(key, key[len(personality):])
+            self._partitions[personality] = partition
+        return partition
+
+    def add(self, key, response):
+        if not key or not response or self.max_size <= 0:
+            return
+        if key in self._responses:
+            self._responses[key] = response
+            self._responses.move_to_end(key)
+            return
+
+        self._responses[key] = response
+        owner = self._owner(key, list(self.personas))
+        partition = self._partitions.get(owner)
+        if partition is not None:
+            partition.add(key, key[len(owner):])
+
+        while len(self._responses) > self.max_size:
+            old_key, _ = self._responses.popitem(last=False)
+            for partition in self._partitions.values():
+                partition.remove(old_key)
+
+    def lookup(self, personality, key):
+        """
+        Returns (response, score) for the most similar stored question of the
+        same persona, or None if nothing reaches the threshold.
+        """
+        key, personality = key.lower(), personality.lower()
+        if personality not in self.personas or self._owner(key, list(self.personas)) != personality:
+            return None
+
+        best_key, score = self._partition(personality).best(key[len(personality):], self.strict)
+        if best_key is None or score < self.threshold:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self._responses[best_key], score
+
+    def stats(self):
+        return {
+            "size": len(self._responses),
+            "personas": len(self._partitions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "threshold": self.threshold,
+            "strict": self.strict,
+        }
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,923 @@
+import asyncio
+import base64
+import datetime
+import json
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from cogs.db.database_editor import SUPABASE_URL, SUPABASE_KEY, TABLE_NAME
+from cogs.db.guild_settings import GUILD_SETTINGS_TABLE
+from cogs.db.conversation_memory import CONVERSATION_TABLE, CONTEXT_KEY_SEPARATOR
+from cogs.db.response_store import response_codec, response_hash, ResponseCodec, RESPONSE_STORE, RESPONSE_TABLE
+from KariGPT_telemetry import storage_latency
+
+# ---------------- CONFIG ----------------
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "supabase").lower()  # "supabase" or "sqlite"
+SQLITE_PATH = os.environ.get("SQLITE_PATH", "karigpt.db")
+# Seconds a single storage call may take before it is abandoned
+DB_TIMEOUT = float(os.environ.get("SUPABASE_TIMEOUT", 5))
+# Rows per page when scanning the table (below PostgREST's max-rows cap)
+SCAN_PAGE_SIZE = int(os.environ.get("SCAN_PAGE_SIZE", 1000))
+# Hashes per response store lookup, so PostgREST URLs stay short
+RESPONSE_FETCH_BATCH = 100
+# Hashes remembered as already stored, so repeated answers aren't uploaded again
+KNOWN_RESPONSES = 4096
+# Appended to question keys written before strict keys; like a contextual
+# key it never matches a lookup, but the row still counts in the metrics
+LEGACY_KEY_SUFFIX = f"{CONTEXT_KEY_SEPARATOR}legacy"
+
+REQUEST_COLUMNS = (
+    "id", "user_id", "username", "question", "ai_response",
+    "timestamp", "daily_limit", "current_count",
+)
+GUILD_LIST_COLUMNS = ("watch_channels", "allowed_personas", "blocked_personas", "unwatched_channels")  # stored as JSON text in SQLite
+QUOTA_TABLE = "KariGPT_quota"
+QUEUE_TABLE = "KariGPT_request_queue"
+QUEUE_COLUMNS = (
+    "message_id", "user_id", "username", "channel_id", "guild_id",
+    "personality", "question", "memory_key", "enqueued_at", "status_message_id",
+)
+
+
+def _check_columns(columns):
+    columns = tuple(columns) or ("*",)
+    if columns == ("*",):
+        return REQUEST_COLUMNS
+    unknown = set(columns) - set(REQUEST_COLUMNS) - {"response_hash"}
+    if unknown:
+        raise ValueError(f"Unknown columns: {sorted(unknown)}")
+    return columns
+
+def keyset_filter(timestamp, row_id):
+    """PostgREST or-filter for rows strictly after (timestamp, id)."""
+    return f'timestamp.gt."{timestamp}",and(timestamp.eq."{timestamp}",id.gt.{row_id})'
+
+
+# ---------------- Interface ----------------
+class RequestStorage:
+    """
+    Persistence for KariGPT request rows. Every method is a coroutine and
+    takes an optional per-call timeout; timestamps are UTC ISO strings.
+    With a `responses` codec, answers go to a content-addressed response
+    store instead: each distinct answer is saved once, compressed, and
+    request rows only keep its response_hash. Reads decompress them back
+    into ai_response, so callers see the same rows either way.
+    """
+
+    backend = None
+
+    def __init__(self, responses=None):
+        self.calls = 0
+        self.responses = responses  # ResponseCodec, or None to keep answers inline
+        self._known = OrderedDict()  # response hashes known to be stored
+        self.deduplicated = 0
+
+    async def _timed(self, operation, awaitable, timeout=None):
+        self.calls += 1
+        with storage_latency.time(backend=self.backend, operation=operation, outcome="ok") as labels:
+            try:
+                return await asyncio.wait_for(awaitable, timeout or DB_TIMEOUT)
+            except Exception:
+                labels["outcome"] = "error"
+                raise
+
+    async def initialize(self):
+        """Creates the tables where the backend can, or checks they exist. Raises if unusable."""
+        raise NotImplementedError
+
+    def _has_response_hash(self):
+        """Whether the request table has the response_hash column to read."""
+        return self.responses is not None
+
+    def _stored_size(self, body):
+        """Bytes a compressed body takes in this backend."""
+        return len(body)
+
+    def _select(self, columns):
+        """Columns to read; answers kept in the response store also need their hash."""
+        columns = _check_columns(columns)
+        if self._has_response_hash() and "ai_response" in columns and "response_hash" not in columns:
+            columns += ("response_hash",)
+        return columns
+
+    async def insert_requests(self, rows, timeout=None):
+        if self.responses is not None:
+            rows = await self._store_responses(rows, timeout)
+        await self._insert(rows, timeout)
+
+    async def _insert(self, rows, timeout):
+        raise NotImplementedError
+
+    async def find_response(self, question, timeout=None):
+        """ai_response of a row with exactly this question, or None."""
+        row = await self._find(question, timeout)
+        if row is None:
+            return None
+        return (await self._resolve([row], timeout))[0]["ai_response"]
+
+    async def _find(self, question, timeout):
+        """ai_response (and response_hash) of a row with exactly this question, or None."""
+        raise NotImplementedError
+
+    async def recent_requests(self, limit, columns=("*",), timeout=None):
+        """The `limit` newest rows, newest first."""
+        raise NotImplementedError
+
+    async def iter_requests(self, columns=("*",), since=None, until=None, page_size=SCAN_PAGE_SIZE, timeout=None):
+        """
+        Streams rows ordered by (timestamp, id), fetched in keyset-paginated
+        pages so memory stays flat and no row is lost to result-size caps.
+        `since` is inclusive and `until` exclusive (UTC ISO timestamps).
+        Rows always carry id and timestamp, which the pagination needs.
+        """
+        columns = tuple(dict.fromkeys(("id", "timestamp") + self._select(columns)))
+        after = None
+        while True:
+            page = await self._resolve(await self._page(columns, since, until, after, page_size, timeout), timeout)
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                return
+            after = (page[-1]["timestamp"], page[-1]["id"])
+
+    async def _page(self, columns, since, until, after, page_size, timeout):
+        """One page of iter_requests: rows after the (timestamp, id) pair `after`."""
+        raise NotImplementedError
+
+    async def last_request(self, user_id=None, timeout=None):
+        """Newest row overall or for one user, or None."""
+        raise NotImplementedError
+
+    async def load_guild_settings(self, timeout=None):
+        """Every guild settings row, list columns decoded."""
+        raise NotImplementedError
+
+    async def save_guild_settings(self, row, timeout=None):
+        """Inserts or replaces the settings row of row["guild_id"]."""
+        raise NotImplementedError
+
+    async def load_conversations(self, since, timeout=None):
+        """Conversation rows updated at or after `since` (UTC ISO), turns decoded."""
+        raise NotImplementedError
+
+    async def save_conversations(self, rows, timeout=None):
+        """Inserts or replaces conversation rows, keyed by (user_id, persona)."""
+        raise NotImplementedError
+
+    async def load_queue(self, timeout=None):
+        """Every queued request row, oldest first."""
+        raise NotImplementedError
+
+    async def save_queued(self, row, timeout=None):
+        """Inserts or replaces the queued request row of row["message_id"]."""
+        raise NotImplementedError
+
+    async def delete_queued(self, message_id, timeout=None):
+        raise NotImplementedError
+
+    # ---------------- Response store ----------------
+    async def save_responses(self, rows, timeout=None):
+        """Inserts response rows (hash, codec, body bytes, size); hashes already stored are skipped."""
+        raise NotImplementedError
+
+    async def load_responses(self, hashes, timeout=None):
+        """Response rows with these hashes, body as bytes."""
+        raise NotImplementedError
+
+    def _remember(self, digest):
+        self._known[digest] = True
+        self._known.move_to_end(digest)
+        while len(self._known) > KNOWN_RESPONSES:
+            self._known.popitem(last=False)
+
+    async def _store_responses(self, rows, timeout=None):
+        """
+        Saves every answer not stored yet and returns the rows pointing at
+        their response by hash instead of carrying the text.
+        """
+        bodies, stored = {}, []
+        for row in rows:
+            text = row.get("ai_response")
+            if text is None:
+                stored.append(row)
+                continue
+            digest = response_hash(text)
+            if digest in self._known or digest in bodies:
+                self.deduplicated += 1
+            else:
+                bodies[digest] = self.responses.encode(text, self._stored_size)
+            stored.append({**row, "ai_response": None, "response_hash": digest})
+        if bodies:
+            await self.save_responses(list(bodies.values()), timeout)
+            for digest in bodies:
+                self._remember(digest)
+        return stored
+
+    async def _resolve(self, rows, timeout=None):
+        """Fills in ai_response of rows that point at the response store."""
+        hashes = list(dict.fromkeys(
+            row["response_hash"] for row in rows
+            if row.get("ai_response") is None and row.get("response_hash")
+        ))
+        if not hashes:
+            return rows
+        texts = {}
+        for i in range(0, len(hashes), RESPONSE_FETCH_BATCH):
+            for stored in await self.load_responses(hashes[i:i + RESPONSE_FETCH_BATCH], timeout):
+                # Decodes by the codec recorded in the row, even with the store turned off
+                texts[stored["hash"]] = ResponseCodec.decode(stored)
+                self._remember(stored["hash"])
+        for row in rows:
+            if row.get("ai_response") is None and row.get("response_hash") in texts:
+                row["ai_response"] = texts[row["response_hash"]]
+        return rows
+
+    async def migrate_responses(self, batch_size=SCAN_PAGE_SIZE, timeout=None):
+        """
+        Moves answers stored inline in older rows into the response store,
+        one batch at a time. Migrated rows stop matching, so it is safe to
+        interrupt and run again. Returns the number of rows migrated.
+        """
+        if self.responses is None:
+            raise RuntimeError("RESPONSE_STORE is off")
+        migrated = 0
+        while True:
+            rows = await self._inline_rows(batch_size, timeout)
+            if not rows:
+                return migrated
+            await self._rewrite_requests(await self._store_responses(rows, timeout), timeout)
+            migrated += len(rows)
+
+    async def _inline_rows(self, limit, timeout):
+        """Up to `limit` rows with an inline ai_response and no response_hash."""
+        raise NotImplementedError
+
+    async def _rewrite_requests(self, rows, timeout):
+        """Points migrated rows at their response: sets response_hash, clears ai_response."""
+        raise NotImplementedError
+
+    async def retire_question_keys(self, before, batch_size=SCAN_PAGE_SIZE, timeout=None):
+        """
+        Takes rows stored before `before` (UTC ISO) out of the stored-answer
+        lookup by appending LEGACY_KEY_SUFFIX to their question key. Retired
+        rows stop matching, so it is safe to interrupt and run again.
+        Returns the number of rows retired.
+        """
+        retired = 0
+        while True:
+            rows = await self._legacy_rows(before, batch_size, timeout)
+            if not rows:
+                return retired
+            for row in rows:
+                row["question"] += LEGACY_KEY_SUFFIX
+            await self._rekey_requests(rows, timeout)
+            retired += len(rows)
+
+    async def _legacy_rows(self, before, limit, timeout):
+        """Up to `limit` rows stored before `before` whose key isn't contextual or retired yet."""
+        raise NotImplementedError
+
+    async def _rekey_requests(self, rows, timeout):
+        """Writes the new question key of each row."""
+        raise NotImplementedError
+
+    async def reserve_quota(self, day, now, scopes, timeout=None):
+        """
+        Atomically checks and counts one request in every scope, shared by
+        all workers. `scopes` are dicts with key, scope, daily_limit and
+        cooldown; `day` is the UTC-8 date and `now` a UTC timestamp, both ISO.
+        Returns {"allowed": True, "used": global count} or a refusal with
+        scope, reason, used and (for cooldowns) retry_after.
+        """
+        raise NotImplementedError
+
+    async def release_quota(self, day, now, keys, timeout=None):
+        """Gives back a reservation made at `now` for these scope keys."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+# ---------------- Supabase ----------------
+class SupabaseStorage(RequestStorage):
+    """
+    Backed by one shared supabase AsyncClient, whose PostgREST session keeps
+    a single pooled set of HTTP connections for the whole bot.
+    Supabase tables can't be created through the API. The request table
+    has to be created manually with columns:
+      - id (SERIAL PRIMARY KEY)
+      - user_id (BIGINT)
+      - username, question, ai_response (TEXT)
+      - timestamp (TIMESTAMPTZ)
+      - daily_limit, current_count (INT)
+    and so does the guild settings table:
+      - guild_id (BIGINT PRIMARY KEY)
+      - watch_channels (JSONB)
+      - daily_limit (INT)
+      - cooldown (INT)
+      - allowed_personas, blocked_personas, unwatched_channels (JSONB);
+        supabase_guild_settings.sql adds the last two to older tables
+    and so does the conversation table (only used with CONVERSATION_MEMORY):
+      - user_id (BIGINT), persona (TEXT), PRIMARY KEY (user_id, persona)
+      - summary (TEXT)
+      - turns (JSONB)
+      - updated_at (TIMESTAMPTZ)
+    and the request queue table (only used with REQUEST_QUEUE):
+      - message_id (BIGINT PRIMARY KEY)
+      - user_id, channel_id, guild_id, status_message_id (BIGINT)
+      - username, personality, question, memory_key (TEXT)
+      - enqueued_at (TIMESTAMPTZ)
+    The response store (RESPONSE_STORE) is set up by supabase_responses.sql;
+    bodies travel base64-encoded in a TEXT column.
+    """
+
+    backend = "supabase"
+
+    def __init__(
+        self,
+        url=SUPABASE_URL,
+        key=SUPABASE_KEY,
+        table=TABLE_NAME,
+        guild_table=GUILD_SETTINGS_TABLE,
+        conversation_table=CONVERSATION_TABLE,
+        queue_table=QUEUE_TABLE,
+        response_table=RESPONSE_TABLE,
+        responses=response_codec if RESPONSE_STORE else None,
+        client=None,
+    ):
+        super().__init__(responses)
+        self.url = url
+        self.key = key
+        self.table = table
+        self.guild_table = guild_table
+        self.conversation_table = conversation_table
+        self.queue_table = queue_table
+        self.response_table = response_table
+        # Set by initialize(); until then assume the column exists only with the store on
+        self.response_column = None
+        self._client = client
+        self._client_lock = asyncio.Lock()
+
+    async def client(self):
+        if self._client is None:
+            async with self._client_lock:
+                if self._client is None:
+                    from supabase import acreate_client
+                    self._client = await acreate_client(self.url, self.key)
+        return self._client
+
+    async def _query(self):
+        return (await self.client()).table(self.table)
+
+    def _has_response_hash(self):
+        # Rows migrated earlier still resolve with the store turned off
+        return self.response_column if self.response_column is not None else self.responses is not None
+
+    def _stored_size(self, body):
+        # Compressed bodies travel as base64 text
+        return 4 * math.ceil(len(body) / 3)
+
+    def _select(self, columns):
+        columns = super()._select(columns)
+        if "response_hash" in columns:
+            # PostgREST embeds the response through the response_hash foreign key: one round trip
+            columns += (f"{self.response_table}(codec,body)",)
+        return columns
+
+    async def _resolve(self, rows, timeout=None):
+        for row in rows:
+            embedded = row.pop(self.response_table, None)
+            if embedded and row.get("ai_response") is None:
+                row["ai_response"] = ResponseCodec.decode(self._from_text(embedded))
+                self._remember(row["response_hash"])
+        return await super()._resolve(rows, timeout)
+
+    async def initialize(self):
+        # Supabase doesn't allow creating tables through the API; just check it exists,
+        # and whether supabase_responses.sql added the response_hash column
+        try:
+            await self._timed("initialize", (await self._query()).select("id", "response_hash").limit(1).execute())
+            self.response_column = True
+        except Exception:
+            await self._timed("initialize", (await self._query()).select("id").limit(1).execute())
+            self.response_column = False
+
+    async def _insert(self, rows, timeout):
+        await self._timed("insert", (await self._query()).insert(rows).execute(), timeout)
+
+    async def _find(self, question, timeout):
+        res = await self._timed(
+            "find_response",
+            (await self._query()).select(*self._select(("ai_response",))).eq("question", question).limit(1).execute(),
+            timeout,
+        )
+        return res.data[0] if res.data else None
+
+    async def recent_requests(self, limit, columns=("*",), timeout=None):
+        res = await self._timed(
+            "recent_requests",
+            (await self._query()).select(*self._select(columns)).order("timestamp", desc=True).limit(limit).execute(),
+            timeout,
+        )
+        return await self._resolve(res.data or [], timeout)
+
+    async def _page(self, columns, since, until, after, page_size, timeout):
+        query = (await self._query()).select(*columns)
+        if since is not None:
+            query = query.gte("timestamp", since)
+        if until is not None:
+            query = query.lt("timestamp", until)
+        if after is not None:
+            query = query.or_(keyset_filter(*after))
+        query = query.order("timestamp").order("id").limit(page_size)
+        res = await self._timed("scan_page", query.execute(), timeout)
+        return res.data or []
+
+    async def last_request(self, user_id=None, timeout=None):
+        query = (await self._query()).select("*")
+        if user_id is not None:
+            query = query.eq("user_id", user_id)
+        res = await self._timed(
+            "last_request",
+            query.order("timestamp", desc=True).limit(1).execute(),
+            timeout,
+        )
+        return (await self._resolve(res.data, timeout))[0] if res.data else None
+
+    async def load_guild_settings(self, timeout=None):
+        client = await self.client()
+        res = await self._timed("load_guild_settings", client.table(self.guild_table).select("*").execute(), timeout)
+        return res.data or []
+
+    async def save_guild_settings(self, row, timeout=None):
+        client = await self.client()
+        await self._timed("save_guild_settings", client.table(self.guild_table).upsert(row).execute(), timeout)
+
+    async def load_conversations(self, since, timeout=None):
+        client = await self.client()
+        res = await self._timed(
+            "load_conversations",
+            client.table(self.conversation_table).select("*").gte("updated_at", since).execute(),
+            timeout,
+        )
+        return res.data or []
+
+    async def save_conversations(self, rows, timeout=None):
+        client = await self.client()
+        await self._timed(
+            "save_conversations",
+            client.table(self.conversation_table).upsert(rows, on_conflict="user_id,persona").execute(),
+            timeout,
+        )
+
+    async def load_queue(self, timeout=None):
+        client = await self.client()
+        res = await self._timed(
+            "load_queue", client.table(self.queue_table).select("*").order("enqueued_at").execute(), timeout
+        )
+        return res.data or []
+
+    async def save_queued(self, row, timeout=None):
+        client = await self.client()
+        await self._timed("save_queued", client.table(self.queue_table).upsert(row).execute(), timeout)
+
+    async def delete_queued(self, message_id, timeout=None):
+        client = await self.client()
+        await self._timed(
+            "delete_queued", client.table(self.queue_table).delete().eq("message_id", message_id).execute(), timeout
+        )
+
+    async def save_responses(self, rows, timeout=None):
+        client = await self.client()
+        rows = [self._to_text(row) for row in rows]
+        await self._timed(
+            "save_responses",
+            client.table(self.response_table).upsert(rows, on_conflict="hash", ignore_duplicates=True).execute(),
+            timeout,
+        )
+
+    async def load_responses(self, hashes, timeout=None):
+        client = await self.client()
+        res = await self._timed(
+            "load_responses",
+            client.table(self.response_table).select("hash", "codec", "body").in_("hash", hashes).execute(),
+            timeout,
+        )
+        return [self._from_text(row) for row in res.data or []]
+
+    @staticmethod
+    def _to_text(row):
+        # Raw answers are stored as the text itself, compressed ones as base64
+        if row["codec"] == "raw":
+            return {**row, "body": row["body"].decode("utf-8")}
+        return {**row, "body": base64.b64encode(row["body"]).decode("ascii")}
+
+    @staticmethod
+    def _from_text(row):
+        if row["codec"] == "raw":
+            return {**row, "body": row["body"].encode("utf-8")}
+        return {**row, "body": base64.b64decode(row["body"])}
+
+    async def _inline_rows(self, limit, timeout):
+        query = (await self._query()).select("*").is_("response_hash", "null").not_.is_("ai_response", "null")
+        res = await self._timed("inline_rows", query.order("id").limit(limit).execute(), timeout)
+        return res.data or []
+
+    async def _rewrite_requests(self, rows, timeout):
+        # Full rows come back from _inline_rows, so one upsert rewrites the whole batch
+        await self._timed("rewrite_requests", (await self._query()).upsert(rows, on_conflict="id").execute(), timeout)
+
+    async def _legacy_rows(self, before, limit, timeout):
+        query = (await self._query()).select("*").lt("timestamp", before).not_.like("question", f"%{CONTEXT_KEY_SEPARATOR}%")
+        res = await self._timed("legacy_rows", query.order("id").limit(limit).execute(), timeout)
+        return res.data or []
+
+    async def _rekey_requests(self, rows, timeout):
+        # Full rows come back from _legacy_rows, as for _rewrite_requests
+        await self._timed("rekey_requests", (await self._query()).upsert(rows, on_conflict="id").execute(), timeout)
+
+    # Both functions are defined in cogs/db/supabase_quota.sql
+    async def reserve_quota(self, day, now, scopes, timeout=None):
+        client = await self.client()
+        res = await self._timed(
+            "reserve_quota",
+            client.rpc("karigpt_reserve_quota", {"p_day": day, "p_now": now, "p_scopes": scopes}).execute(),
+            timeout,
+        )
+        return res.data
+
+    async def release_quota(self, day, now, keys, timeout=None):
+        client = await self.client()
+        await self._timed(
+            "release_quota",
+            client.rpc("karigpt_release_quota", {"p_day": day, "p_now": now, "p_keys": keys}).execute(),
+            timeout,
+        )
+
+    async def close(self):
+        if self._client is None:
+            return
+        try:
+            await self._client.postgrest.aclose()
+        except Exception as e:
+            print("❌ Failed to close Supabase client:", e)
+        self._client = None
+
+
+# ---------------- SQLite ----------------
+class SQLiteStorage(RequestStorage):
+    """
+    Local SQLite file in WAL mode with indexes on question and timestamp,
+    so lookups stay sub-millisecond and small deployments and tests need
+    no network. Queries run in a worker thread on one shared connection.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path=SQLITE_PATH,
+        table=TABLE_NAME,
+        guild_table=GUILD_SETTINGS_TABLE,
+        quota_table=QUOTA_TABLE,
+        conversation_table=CONVERSATION_TABLE,
+        queue_table=QUEUE_TABLE,
+        response_table=RESPONSE_TABLE,
+        responses=response_codec if RESPONSE_STORE else None,
+    ):
+        super().__init__(responses)
+        self.path = path
+        self.table = table
+        self.guild_table = guild_table
+        self.quota_table = quota_table
+        self.conversation_table = conversation_table
+        self.queue_table = queue_table
+        self.response_table = response_table
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS "{self.table}" (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    username TEXT,
+                    question TEXT,
+                    ai_response TEXT,
+                    timestamp TEXT,
+                    daily_limit INTEGER,
+                    current_count INTEGER,
+                    response_hash TEXT
+                );
+                CREATE INDEX IF NOT EXISTS "idx_{self.table}_question" ON "{self.table}" (question);
+                CREATE INDEX IF NOT EXISTS "idx_{self.table}_timestamp" ON "{self.table}" (timestamp);
+                CREATE TABLE IF NOT EXISTS "{self.guild_table}" (
+                    guild_id INTEGER PRIMARY KEY,
+                    watch_channels TEXT,
+                    daily_limit INTEGER,
+                    cooldown INTEGER,
+                    allowed_personas TEXT,
+                    blocked_personas TEXT,
+                    unwatched_channels TEXT
+                );
+                CREATE TABLE IF NOT EXISTS "{self.quota_table}" (
+                    key TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    last TEXT,
+                    prev_last TEXT,
+                    PRIMARY KEY (key, day)
+                );
+                CREATE TABLE IF NOT EXISTS "{self.conversation_table}" (
+                    user_id INTEGER NOT NULL,
+                    persona TEXT NOT NULL,
+                    summary TEXT,
+                    turns TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (user_id, persona)
+                );
+                CREATE TABLE IF NOT EXISTS "{self.queue_table}" (
+                    message_id INTEGER PRIMARY KEY,
+                    user_id INTEGER,
+                    username TEXT,
+                    channel_id INTEGER,
+                    guild_id INTEGER,
+                    personality TEXT,
+                    question TEXT,
+                    memory_key TEXT,
+                    enqueued_at TEXT,
+                    status_message_id INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS "{self.response_table}" (
+                    hash TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL
+                );
+            """)
+            # Files created before the response store lack the column
+            columns = {row["name"] for row in conn.execute(f'PRAGMA table_info("{self.table}")')}
+            if "response_hash" not in columns:
+                conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN response_hash TEXT')
+            # ...and the guild settings before block-lists
+            columns = {row["name"] for row in conn.execute(f'PRAGMA table_info("{self.guild_table}")')}
+            for column in ("blocked_personas", "unwatched_channels"):
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE "{self.guild_table}" ADD COLUMN {column} TEXT')
+            self._conn = conn
+        return self._conn
+
+    def _run(self, fn, *args):
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                return fn(conn, *args)
+
+    async def _call(self, operation, fn, *args, timeout=None):
+        return await self._timed(operation, asyncio.to_thread(self._run, fn, *args), timeout)
+
+    def _has_response_hash(self):
+        # Always added by _connection, so rows stored earlier resolve even with the store off
+        return True
+
+    def _columns(self, columns):
+        return ", ".join(f'"{c}"' for c in self._select(columns))
+
+    async def initialize(self):
+        await self._call("initialize", lambda conn: None)
+
+    async def _insert(self, rows, timeout):
+        def insert(conn, rows):
+            conn.executemany(
+                f'INSERT INTO "{self.table}" (user_id, username, question, ai_response, timestamp, daily_limit, current_count, response_hash) '
+                "VALUES (:user_id, :username, :question, :ai_response, :timestamp, :daily_limit, :current_count, :response_hash)",
+                [{c: row.get(c) for c in REQUEST_COLUMNS + ("response_hash",)} for row in rows],
+            )
+        await self._call("insert", insert, rows, timeout=timeout)
+
+    async def _find(self, question, timeout):
+        def find(conn, question):
+            row = conn.execute(
+                f'SELECT r.ai_response, r.response_hash, s.codec, s.body FROM "{self.table}" r '
+                f'LEFT JOIN "{self.response_table}" s ON s.hash = r.response_hash WHERE r.question = ? LIMIT 1',
+                (question,),
+            ).fetchone()
+            if row is None:
+                return None
+            row = dict(row)
+            if row["ai_response"] is None and row["body"] is not None:
+                row["ai_response"] = ResponseCodec.decode(row)
+            return row
+        return await self._call("find_response", find, question, timeout=timeout)
+
+    async def recent_requests(self, limit, columns=("*",), timeout=None):
+        sql = f'SELECT {self._columns(columns)} FROM "{self.table}" ORDER BY timestamp DESC LIMIT ?'
+        def recent(conn, limit):
+            return [dict(row) for row in conn.execute(sql, (limit,))]
+        return await self._resolve(await self._call("recent_requests", recent, limit, timeout=timeout), timeout)
+
+    async def _page(self, columns, since, until, after, page_size, timeout):
+        where, params = [], []
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp < ?")
+            params.append(until)
+        if after is not None:
+            where.append("(timestamp > ? OR (timestamp = ? AND id > ?))")
+            params += [after[0], after[0], after[1]]
+        sql = f'SELECT {self._columns(columns)} FROM "{self.table}"'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY timestamp, id LIMIT ?"
+        params.append(page_size)
+        def page(conn):
+            return [dict(row) for row in conn.execute(sql, params)]
+        return await self._call("scan_page", page, timeout=timeout)
+
+    async def last_request(self, user_id=None, timeout=None):
+        sql = f'SELECT * FROM "{self.table}"'
+        params = ()
+        if user_id is not None:
+            sql += " WHERE user_id = ?"
+            params = (user_id,)
+        sql += " ORDER BY timestamp DESC LIMIT 1"
+        def last(conn):
+            row = conn.execute(sql, params).fetchone()
+            return dict(row) if row else None
+        row = await self._call("last_request", last, timeout=timeout)
+        return (await self._resolve([row], timeout))[0] if row else None
+
+    async def load_guild_settings(self, timeout=None):
+        def load(conn):
+            rows = []
+            for row in conn.execute(f'SELECT * FROM "{self.guild_table}"'):
+                row = dict(row)
+                for column in GUILD_LIST_COLUMNS:
+                    row[column] = json.loads(row[column] or "[]")
+                rows.append(row)
+            return rows
+        return await self._call("load_guild_settings", load, timeout=timeout)
+
+    async def save_guild_settings(self, row, timeout=None):
+        row = {**row, **{c: json.dumps(list(row.get(c) or ())) for c in GUILD_LIST_COLUMNS}}
+        def save(conn):
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.guild_table}" '
+                "(guild_id, watch_channels, daily_limit, cooldown, allowed_personas, blocked_personas, unwatched_channels) "
+                "VALUES (:guild_id, :watch_channels, :daily_limit, :cooldown, :allowed_personas, :blocked_personas, :unwatched_channels)",
+                row,
+            )
+        await self._call("save_guild_settings", save, timeout=timeout)
+
+    async def load_conversations(self, since, timeout=None):
+        def load(conn, since):
+            rows = []
+            for row in conn.execute(f'SELECT * FROM "{self.conversation_table}" WHERE updated_at >= ?', (since,)):
+                row = dict(row)
+                row["turns"] = json.loads(row["turns"] or "[]")
+                rows.append(row)
+            return rows
+        return await self._call("load_conversations", load, since, timeout=timeout)
+
+    async def save_conversations(self, rows, timeout=None):
+        rows = [{**row, "turns": json.dumps(row.get("turns") or [])} for row in rows]
+        def save(conn, rows):
+            conn.executemany(
+                f'INSERT OR REPLACE INTO "{self.conversation_table}" (user_id, persona, summary, turns, updated_at) '
+                "VALUES (:user_id, :persona, :summary, :turns, :updated_at)",
+                rows,
+            )
+        await self._call("save_conversations", save, rows, timeout=timeout)
+
+    async def load_queue(self, timeout=None):
+        def load(conn):
+            return [dict(row) for row in conn.execute(f'SELECT * FROM "{self.queue_table}" ORDER BY enqueued_at')]
+        return await self._call("load_queue", load, timeout=timeout)
+
+    async def save_queued(self, row, timeout=None):
+        def save(conn, row):
+            conn.execute(
+                f'INSERT OR REPLACE INTO "{self.queue_table}" ({", ".join(QUEUE_COLUMNS)}) '
+                f'VALUES ({", ".join(":" + c for c in QUEUE_COLUMNS)})',
+                {c: row.get(c) for c in QUEUE_COLUMNS},
+            )
+        await self._call("save_queued", save, row, timeout=timeout)
+
+    async def delete_queued(self, message_id, timeout=None):
+        def delete(conn, message_id):
+            conn.execute(f'DELETE FROM "{self.queue_table}" WHERE message_id = ?', (message_id,))
+        await self._call("delete_queued", delete, message_id, timeout=timeout)
+
+    async def save_responses(self, rows, timeout=None):
+        def save(conn, rows):
+            conn.executemany(
+                f'INSERT OR IGNORE INTO "{self.response_table}" (hash, codec, body, size) '
+                "VALUES (:hash, :codec, :body, :size)",
+                rows,
+            )
+        await self._call("save_responses", save, rows, timeout=timeout)
+
+    async def load_responses(self, hashes, timeout=None):
+        sql = f'SELECT hash, codec, body FROM "{self.response_table}" WHERE hash IN ({", ".join("?" * len(hashes))})'
+        def load(conn, hashes):
+            return [dict(row) for row in conn.execute(sql, hashes)]
+        return await self._call("load_responses", load, list(hashes), timeout=timeout)
+
+    async def _inline_rows(self, limit, timeout):
+        def inline(conn, limit):
+            return [dict(row) for row in conn.execute(
+                f'SELECT id, ai_response FROM "{self.table}" '
+                "WHERE response_hash IS NULL AND ai_response IS NOT NULL ORDER BY id LIMIT ?",
+                (limit,),
+            )]
+        return await self._call("inline_rows", inline, limit, timeout=timeout)
+
+    async def _rewrite_requests(self, rows, timeout):
+        def rewrite(conn, rows):
+            conn.executemany(
+                f'UPDATE "{self.table}" SET ai_response = NULL, response_hash = :response_hash WHERE id = :id',
+                [{"id": row["id"], "response_hash": row["response_hash"]} for row in rows],
+            )
+        await self._call("rewrite_requests", rewrite, rows, timeout=timeout)
+
+    async def _legacy_rows(self, before, limit, timeout):
+        def legacy(conn, before, limit):
+            return [dict(row) for row in conn.execute(
+                f'SELECT id, question FROM "{self.table}" '
+                "WHERE timestamp < ? AND instr(question, ?) = 0 ORDER BY id LIMIT ?",
+                (before, CONTEXT_KEY_SEPARATOR, limit),
+            )]
+        return await self._call("legacy_rows", legacy, before, limit, timeout=timeout)
+
+    async def _rekey_requests(self, rows, timeout):
+        def rekey(conn, rows):
+            conn.executemany(
+                f'UPDATE "{self.table}" SET question = :question WHERE id = :id',
+                [{"id": row["id"], "question": row["question"]} for row in rows],
+            )
+        await self._call("rekey_requests", rekey, rows, timeout=timeout)
+
+    async def reserve_quota(self, day, now, scopes, timeout=None):
+        def reserve(conn):
+            # Write lock up front, so other processes on the same file wait
+            conn.execute("BEGIN IMMEDIATE")
+            now_dt = datetime.datetime.fromisoformat(now)
+            for s in scopes:
+                row = conn.execute(
+                    f'SELECT count, last FROM "{self.quota_table}" WHERE key = ? AND day = ?', (s["key"], day)
+                ).fetchone()
+                count, last = (row["count"], row["last"]) if row else (0, None)
+                if s.get("cooldown") and last:
+                    delta = (now_dt - datetime.datetime.fromisoformat(last)).total_seconds()
+                    if delta < s["cooldown"]:
+                        return {"allowed": False, "scope": s["scope"], "reason": "cooldown",
+                                "used": count, "retry_after": math.ceil(s["cooldown"] - delta)}
+                if s.get("daily_limit") is not None and count >= s["daily_limit"]:
+                    return {"allowed": False, "scope": s["scope"], "reason": "daily_limit", "used": count}
+
+            conn.executemany(
+                f'INSERT INTO "{self.quota_table}" (key, day, count, last) VALUES (?, ?, 1, ?) '
+                "ON CONFLICT (key, day) DO UPDATE SET count = count + 1, prev_last = last, last = excluded.last",
+                [(s["key"], day, now) for s in scopes],
+            )
+            row = conn.execute(
+                f'SELECT count FROM "{self.quota_table}" WHERE key = \'global\' AND day = ?', (day,)
+            ).fetchone()
+            return {"allowed": True, "used": row["count"] if row else 0}
+        return await self._call("reserve_quota", reserve, timeout=timeout)
+
+    async def release_quota(self, day, now, keys, timeout=None):
+        def release(conn):
+            conn.executemany(
+                f'UPDATE "{self.quota_table}" SET count = MAX(count - 1, 0), '
+                "last = CASE WHEN last = ? THEN prev_last ELSE last END WHERE key = ? AND day = ?",
+                [(now, key, day) for key in keys],
+            )
+        await self._call("release_quota", release, timeout=timeout)
+
+    async def close(self):
+        def close():
+            with self._lock:
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+        await asyncio.to_thread(close)
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteStorage()
+    if backend == "supabase":
+        return SupabaseStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'supabase' or 'sqlite')")
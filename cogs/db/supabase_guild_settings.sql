@@ -0,0 +1,7 @@
+-- Guild settings block angels by name and can turn off default channels.
+-- Run once in the Supabase SQL editor on tables created before that; the
+-- bot converts the older allowed_personas lists on its next start.
+
+alter table "KariGPT_guild_settings"
+    add column if not exists blocked_personas jsonb not null default '[]'::jsonb,
+    add column if not exists unwatched_channels jsonb not null default '[]'::jsonb;
@@ -0,0 +1,64 @@
+-- Shared quota for running several bot workers against one Supabase project.
+-- Run once in the Supabase SQL editor, then set SHARED_QUOTA=true.
+
+create table if not exists "KariGPT_quota" (
+    key text not null,           -- "global", "user:<id>", "channel:<id>" or "guild:<id>"
+    day date not null,           -- UTC-8 calendar day
+    count int not null default 0,
+    last timestamptz,
+    prev_last timestamptz,       -- restored by a release
+    primary key (key, day)
+);
+
+-- All-or-nothing reservation over every scope of one request.
+-- p_scopes: [{"key": ..., "scope": ..., "daily_limit": int|null, "cooldown": int|null}, ...]
+create or replace function karigpt_reserve_quota(p_day date, p_now timestamptz, p_scopes jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    s jsonb;
+    r record;
+    used int;
+begin
+    -- Rows are locked in key order so concurrent callers can't deadlock
+    for s in select value from jsonb_array_elements(p_scopes) order by value->>'key' loop
+        insert into "KariGPT_quota" (key, day) values (s->>'key', p_day) on conflict do nothing;
+        select q.count, q.last into r from "KariGPT_quota" q
+            where q.key = s->>'key' and q.day = p_day for update;
+
+        if s->>'cooldown' is not null and r.last is not null
+            and extract(epoch from p_now - r.last) < (s->>'cooldown')::int then
+            return jsonb_build_object(
+                'allowed', false, 'scope', s->>'scope', 'reason', 'cooldown', 'used', r.count,
+                'retry_after', ceil((s->>'cooldown')::int - extract(epoch from p_now - r.last))::int
+            );
+        end if;
+
+        if s->>'daily_limit' is not null and r.count >= (s->>'daily_limit')::int then
+            return jsonb_build_object(
+                'allowed', false, 'scope', s->>'scope', 'reason', 'daily_limit', 'used', r.count
+            );
+        end if;
+    end loop;
+
+    update "KariGPT_quota" q
+        set count = q.count + 1, prev_last = q.last, last = p_now
+        from jsonb_array_elements(p_scopes) e
+        where q.key = e.value->>'key' and q.day = p_day;
+
+    select q.count into used from "KariGPT_quota" q where q.key = 'global' and q.day = p_day;
+    return jsonb_build_object('allowed', true, 'used', coalesce(used, 0));
+end;
+$$;
+
+-- Hands a reservation back, e.g. after a failed generation.
+create or replace function karigpt_release_quota(p_day date, p_now timestamptz, p_keys jsonb)
+returns void
+language sql
+as $$
+    update "KariGPT_quota"
+        set count = greatest(count - 1, 0),
+            last = case when last = p_now then prev_last else last end
+        where day = p_day and key in (select jsonb_array_elements_text(p_keys));
+$$;
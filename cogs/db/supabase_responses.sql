@@ -0,0 +1,19 @@
+-- Content-addressed response store: each distinct answer is kept once,
+-- compressed, and request rows point at it by hash.
+-- Run once in the Supabase SQL editor, set RESPONSE_STORE=true, then move
+-- the answers already stored inline with:
+--     RESPONSE_STORE=true python -m cogs.db.migrate_responses
+
+create table if not exists "KariGPT_responses" (
+    hash text primary key,       -- hex sha256 of the answer text
+    codec text not null,         -- "zlib", "zstd" or "raw"
+    body text not null,          -- compressed answer as base64, or the text itself for "raw"
+    size int not null            -- uncompressed bytes
+);
+
+alter table "KariGPT_requests"
+    add column if not exists response_hash text references "KariGPT_responses" (hash);
+
+-- The migration looks up rows that still carry their answer inline
+create index if not exists "idx_KariGPT_requests_inline_response"
+    on "KariGPT_requests" (id) where response_hash is null and ai_response is not null;
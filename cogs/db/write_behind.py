@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+import random
+
+# ---------------- CONFIG ----------------
+WRITE_BEHIND_BATCH = int(os.environ.get("WRITE_BEHIND_BATCH", 20))         # rows per bulk insert
+WRITE_BEHIND_DELAY = float(os.environ.get("WRITE_BEHIND_DELAY", 5))        # max seconds a row waits
+WRITE_BEHIND_RETRIES = int(os.environ.get("WRITE_BEHIND_RETRIES", 3))
+WRITE_BEHIND_BACKOFF = float(os.environ.get("WRITE_BEHIND_BACKOFF", 1))    # first retry delay, doubled each time
+WRITE_BEHIND_SPILL = os.environ.get("WRITE_BEHIND_SPILL", "karigpt_requests_spill.jsonl")
+
+
+class WriteBehindQueue:
+    """
+    Buffers rows and writes them with one bulk insert when the batch is full
+    or the oldest row has waited max_delay seconds. Failed flushes are retried
+    with exponential backoff; rows that still can't be written are appended
+    to a local JSONL spill file and replayed on the next start.
+    """
+
+    def __init__(
+        self,
+        flush_fn,
+        max_batch=WRITE_BEHIND_BATCH,
+        max_delay=WRITE_BEHIND_DELAY,
+        max_retries=WRITE_BEHIND_RETRIES,
+        backoff=WRITE_BEHIND_BACKOFF,
+        spill_path=WRITE_BEHIND_SPILL,
+    ):
+        self.flush_fn = flush_fn  # async callable taking a list of rows
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.spill_path = spill_path
+
+        self._buffer = []
+        self._writing = []  # batch being written right now
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self._closing = False
+
+        self.flushed_rows = 0
+        self.flushes = 0
+        self.spilled_rows = 0
+
+    def __len__(self):
+        return len(self._buffer)
+
+    # ---------------- Lifecycle ----------------
+    def start(self):
+        if self._task is not None:
+            return
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._buffer = self._load_spill() + self._buffer
+        self._task = asyncio.create_task(self._run())
+        if self._buffer:
+            self._wakeup.set()
+
+    async def close(self):
+        """Stops the background task and flushes whatever is left."""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    def enqueue(self, row):
+        self.start()
+        self._buffer.append(row)
+        if len(self._buffer) >= self.max_batch:
+            self._wakeup.set()
+
+    # ---------------- Flushing ----------------
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        await self.flush()
+
+    async def flush(self):
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._buffer[:self.max_batch]
+                del self._buffer[:len(batch)]
+                self._writing = batch
+                try:
+                    written = await self._write(batch)
+                finally:
+                    self._writing = []
+                if not written:
+                    self._spill(batch + self._buffer)
+                    self._buffer.clear()
+                    return
+
+    async def _write(self, batch):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.flush_fn(batch)
+                self.flushes += 1
+                self.flushed_rows += len(batch)
+                return True
+            except Exception as e:
+                print(f"❌ Bulk insert of {len(batch)} rows failed (attempt {attempt + 1}):", e)
+                if attempt < self.max_retries and not self._closing:
+                    delay = self.backoff * 2 ** attempt
+                    await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        return False
+
+    # ---------------- Spill file ----------------
+    def _spill(self, rows):
+        try:
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+            self.spilled_rows += len(rows)
+            print(f"💾 Spilled {len(rows)} rows to {self.spill_path}")
+        except Exception as e:
+            print(f"❌ Failed to spill {len(rows)} rows, they are lost:", e)
+
+    def _read_spill(self):
+        with open(self.spill_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def _load_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return []
+        try:
+            rows = self._read_spill()
+            os.remove(self.spill_path)
+            if rows:
+                print(f"💾 Replaying {len(rows)} spilled rows")
+            return rows
+        except Exception as e:
+            print("❌ Failed to read spill file:", e)
+            return []
+
+    def pending(self):
+        """
+        Rows queued but not known to be written yet: the batch in flight, the
+        buffer and a spill file not replayed so far.
+        """
+        rows = self._writing + self._buffer
+        if self._task is None and self.spill_path and os.path.exists(self.spill_path):
+            try:
+                rows = rows + self._read_spill()
+            except Exception as e:
+                print("❌ Failed to read spill file:", e)
+        return rows
+
+    def stats(self):
+        return {
+            "pending": len(self._buffer),
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "spilled_rows": self.spilled_rows,
+        }
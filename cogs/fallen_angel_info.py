@@ -47,10 +47,10 @@ class FallenAngelInfo(commands.Cog):
         interaction: discord.Interaction,
         current: str
     ):
+        # Indexed lookup, already capped at Discord's 25 choices
         return [
             app_commands.Choice(name=key, value=key)
-            for key in PERSONALITIES.keys()
-            if current.lower() in key.lower()
+            for key in PERSONALITIES.search(current)
         ]
 
 
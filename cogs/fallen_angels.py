@@ -5,9 +5,54 @@ from discord import app_commands
 from KariGPT_ai import PERSONALITIES
 
 
+# Embed fields hold at most 1024 characters; keep the whole embed well
+# under Discord's 6000-character limit
+FIELD_LIMIT = 1024
+MAX_FIELDS = 5
+
+
+def build_angels_embed():
+    embed = discord.Embed(
+        title="😈 Fallen Angels",
+        description="Invoke one by starting your message with:\n`angel_name: your question?`",
+        color=discord.Color.dark_red()
+    )
+
+    names = sorted(PERSONALITIES.keys())
+    fields = [""]
+    shown = 0
+    for key in names:
+        line = f"• **{key}**\n"
+        if len(fields[-1]) + len(line) > FIELD_LIMIT:
+            if len(fields) == MAX_FIELDS:
+                break
+            fields.append("")
+        fields[-1] += line
+        shown += 1
+
+    for i, value in enumerate(fields):
+        embed.add_field(
+            name="🔥 Available Angels" if i == 0 else "\u200b",
+            value=value,
+            inline=False
+        )
+    if shown < len(names):
+        embed.set_footer(text=f"...and {len(names) - shown} more. Use /angel to search them.")
+    return embed
+
+
 class FallenAngels2(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        # Rendered once per persona registry version
+        self._embed = None
+        self._embed_version = None
+
+    def angels_embed(self):
+        if self._embed is None or self._embed_version != PERSONALITIES.version:
+            self._embed = build_angels_embed()
+            self._embed_version = PERSONALITIES.version
+        return self._embed
 
     @app_commands.command(
         name="angels",
@@ -21,24 +66,8 @@ class FallenAngels2(commands.Cog):
             )
             return
 
-        embed = discord.Embed(
-            title="😈 Fallen Angels",
-            description="Invoke one by starting your message with:\n`angel_name: your question?`",
-            color=discord.Color.dark_red()
-        )
-
-        angels_list = ""
-        for key in sorted(PERSONALITIES.keys()):
-            angels_list += f"• **{key}**\n"
-
-        embed.add_field(
-            name="🔥 Available Angels",
-            value=angels_list,
-            inline=False
-        )
-
         await interaction.response.send_message(
-            embed=embed,
+            embed=self.angels_embed(),
             ephemeral=True
         )
 
@@ -0,0 +1,136 @@
+import discord
+from discord.ext import commands
+from discord import app_commands
+
+from KariGPT_ai import PERSONALITIES
+from cogs.db.async_database_editor import load_guild_settings, save_guild_settings
+from cogs.db.guild_settings import guild_settings
+
+
+def build_settings_embed(guild, settings):
+    embed = discord.Embed(
+        title=f"⚙️ KariGPT settings for {guild.name}",
+        color=discord.Color.blurple()
+    )
+    channels = ", ".join(f"<#{c}>" for c in sorted(settings.watch_channels)) or "None (default channels only)"
+    personas = ", ".join(f"`{p}`" for p in sorted(settings.blocked_personas)) or "None"
+    embed.add_field(name="👀 Watched channels", value=channels[:1024], inline=False)
+    if settings.unwatched_channels:
+        unwatched = ", ".join(f"<#{c}>" for c in sorted(settings.unwatched_channels))
+        embed.add_field(name="🙈 Unwatched default channels", value=unwatched[:1024], inline=False)
+    embed.add_field(name="📅 Daily limit", value=str(settings.daily_limit or "Global"), inline=True)
+    embed.add_field(name="⏳ Cooldown", value=f"{settings.cooldown}s" if settings.cooldown else "Global", inline=True)
+    embed.add_field(name="🚫 Blocked angels", value=personas[:1024], inline=False)
+    return embed
+
+
+class GuildConfig(commands.Cog):
+    config = app_commands.Group(
+        name="karigpt_config",
+        description="Configure KariGPT for this server",
+        guild_only=True,
+        default_permissions=discord.Permissions(manage_guild=True),
+    )
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def warm_up(self):
+        # Called by the bot after login
+        if await load_guild_settings():
+            # Older settings stored an allow-list that blocked every angel added later
+            for settings in guild_settings.convert_allow_lists(PERSONALITIES.keys()):
+                await save_guild_settings(settings)
+
+    async def _save(self, interaction, **changes):
+        settings = guild_settings.update(interaction.guild_id, **changes)
+        if not await save_guild_settings(settings):
+            await interaction.response.send_message(
+                "⚠️ Applied until restart, but failed to save the settings.",
+                embed=build_settings_embed(interaction.guild, settings),
+                ephemeral=True
+            )
+            return
+        await interaction.response.send_message(
+            embed=build_settings_embed(interaction.guild, settings),
+            ephemeral=True
+        )
+
+    @config.command(name="show", description="Show this server's KariGPT settings")
+    async def show(self, interaction: discord.Interaction):
+        await interaction.response.send_message(
+            embed=build_settings_embed(interaction.guild, guild_settings.get(interaction.guild_id)),
+            ephemeral=True
+        )
+
+    @config.command(name="watch", description="Answer fallen angel questions in a channel")
+    @app_commands.describe(channel="Channel to watch")
+    async def watch(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        settings = guild_settings.get(interaction.guild_id)
+        await self._save(
+            interaction,
+            watch_channels=settings.watch_channels | {channel.id},
+            unwatched_channels=settings.unwatched_channels - {channel.id},
+        )
+
+    @config.command(name="unwatch", description="Stop answering in a channel")
+    @app_commands.describe(channel="Channel to stop watching")
+    async def unwatch(self, interaction: discord.Interaction, channel: discord.TextChannel):
+        settings = guild_settings.get(interaction.guild_id)
+        unwatched = settings.unwatched_channels
+        if guild_settings.watched_by_default(channel):
+            # Default channels are watched everywhere unless the guild turns them off
+            unwatched = unwatched | {channel.id}
+        await self._save(
+            interaction,
+            watch_channels=settings.watch_channels - {channel.id},
+            unwatched_channels=unwatched,
+        )
+
+    @config.command(name="limits", description="Set this server's daily limit and cooldown (0 uses the global one)")
+    @app_commands.describe(daily_limit="Requests per day for this server", cooldown="Seconds between requests")
+    async def limits(
+        self,
+        interaction: discord.Interaction,
+        daily_limit: app_commands.Range[int, 0, 10000],
+        cooldown: app_commands.Range[int, 0, 86400]
+    ):
+        await self._save(interaction, daily_limit=daily_limit or None, cooldown=cooldown or None)
+
+    @config.command(name="angel", description="Allow or block a fallen angel in this server")
+    @app_commands.describe(name="Fallen angel", allowed="Whether it may be invoked here")
+    async def angel(self, interaction: discord.Interaction, name: str, allowed: bool):
+        angel_key = name.lower()
+        if angel_key not in PERSONALITIES:
+            await interaction.response.send_message(f"❌ Fallen angel `{name}` not found.", ephemeral=True)
+            return
+
+        # Only blocked angels are stored, so angels added later are allowed
+        blocked = guild_settings.get(interaction.guild_id).blocked_personas
+        if allowed:
+            blocked = blocked - {angel_key}
+        else:
+            blocked = blocked | {angel_key}
+            if set(PERSONALITIES.keys()) <= blocked:
+                await interaction.response.send_message("❌ At least one fallen angel must stay allowed.", ephemeral=True)
+                return
+        await self._save(interaction, blocked_personas=blocked)
+
+    @config.command(name="reset_angels", description="Allow every fallen angel again")
+    async def reset_angels(self, interaction: discord.Interaction):
+        await self._save(interaction, allowed_personas=(), blocked_personas=())
+
+    @angel.autocomplete("name")
+    async def angel_autocomplete(
+        self,
+        interaction: discord.Interaction,
+        current: str
+    ):
+        return [
+            app_commands.Choice(name=key, value=key)
+            for key in PERSONALITIES.search(current)
+        ]
+
+
+async def setup(bot):
+    await bot.add_cog(GuildConfig(bot))